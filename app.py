@@ -1,11 +1,22 @@
+import streamlit as st  # first: config.get_config falls back to st.secrets once streamlit is loaded
 from werkzeug.security import check_password_hash
-from indexing import build_index
+from ingest_jobs import (
+    submit_ingest_job,
+    submit_ingest_batch,
+    list_ingest_jobs,
+    summarize_jobs,
+    STAGE_COUNTERS,
+    STAGE_LABELS,
+)
 from pdf_utils import *
 from db_utils import *
-import time
+from search import hybrid_search, find_similar_testimony, search_ready, warm_search
+from evidence_bundle import submit_evidence_bundle, get_bundle_job, discard_bundle_job
+from issue_list import render_keyset_list, ISSUE_PAGE_SIZE, PAGE_SIZE_OPTIONS
+from telemetry import span
+from issue_extractor import init_issue_tables, project_file_extraction, project_upload_extraction
+import fitz
 import base64
-import pandas as pd
-import streamlit as st
 
 # ----------- LOGIN SESSION ----------
 if "authenticated" not in st.session_state:
@@ -15,6 +26,8 @@ if "username" not in st.session_state:
     st.session_state.username = None
 
 PRIMARY_COLOR = "#4879a5"
+JOB_POLL_SECONDS = 2
+RECENT_JOBS = 50
 
 def render_footer():
     st.markdown(f"""
@@ -355,9 +368,6 @@ if "extracted" not in st.session_state:
 if "selected_page" not in st.session_state:
     st.session_state.selected_page = None
 
-if "pdf_bytes" not in st.session_state:
-    st.session_state.pdf_bytes = None
-
 if "download_page" not in st.session_state:
     st.session_state.download_page = None
 
@@ -367,6 +377,118 @@ if "download_pdf_link" not in st.session_state:
 if "confirm_download" not in st.session_state:
     st.session_state.confirm_download = {}
 
+if "similar_issue" not in st.session_state:
+    st.session_state.similar_issue = None
+
+if "export_job" not in st.session_state:
+    st.session_state.export_job = None
+
+if "selected_issue" not in st.session_state:
+    st.session_state.selected_issue = None
+
+if "current_pdf_link" not in st.session_state:
+    st.session_state.current_pdf_link = None
+
+if "issue_page" not in st.session_state:
+    st.session_state.issue_page = 0
+
+if "issue_view_key" not in st.session_state:
+    st.session_state.issue_view_key = None
+
+if "issue_cursors" not in st.session_state:
+    st.session_state.issue_cursors = [None]
+
+# ---------- INGEST JOBS ----------
+def format_eta(seconds):
+    if seconds is None:
+        return "estimating…"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+def format_projection(projection):
+    cost = f"~${projection['cost_usd']:.2f}" if projection["cost_usd"] is not None else "cost n/a (no price for this model)"
+    basis = (
+        f"from {projection['calls']} past calls" if projection["basis"] == "history"
+        else "default rates, no past calls yet"
+    )
+    return (
+        f"Projected issue extraction: ~{projection['chunks']} chunks · {cost} · "
+        f"~{format_eta(projection['seconds'])} ({basis})"
+    )
+
+def render_job(job):
+    status = job["status"]
+    counts = (
+        f"{job['pages_parsed']}/{job['pages_total']} pages parsed "
+        f"({job['pages_ocr']} OCR) · {job['chunks_written']}/{job['chunks_total']} chunks written · "
+        f"{job['issues_extracted']} issues from {job['extract_done']}/{job['extract_total']} chunks"
+    )
+
+    st.markdown(
+        f'<div class="status"><strong>{job["filename"]}</strong> – {status}</div>',
+        unsafe_allow_html=True
+    )
+
+    if status == "running" and job["stage"] in STAGE_COUNTERS:
+        done_col, total_col = STAGE_COUNTERS[job["stage"]]
+        total = job[total_col]
+        st.progress(
+            job[done_col] / total if total else 0.0,
+            text=f"{STAGE_LABELS[job['stage']]} · {job[done_col]}/{total} · ETA {format_eta(job['eta_seconds'])}"
+        )
+    elif status == "done":
+        st.markdown(
+            '<div class="status success">Indexing completed</div>',
+            unsafe_allow_html=True
+        )
+    elif status == "failed":
+        st.error(f"Indexing failed: {job['error']}")
+    elif status == "waiting_extract":
+        st.info("Indexed · waiting for issue extraction")
+    elif status == "interrupted":
+        st.warning("The job stopped reporting progress (the app was restarted). Upload the file again.")
+    elif status == "skipped":
+        st.info(job["error"])
+
+    st.caption(counts)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_ingest_jobs(username):
+    """
+    Polls ingest_jobs on its own timer: only this block reruns, not the whole page.
+    """
+    jobs = list_ingest_jobs(created_by=username, limit=RECENT_JOBS)
+    if not jobs:
+        return
+
+    st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
+    st.markdown("**Recent uploads**")
+
+    # single uploads and batches, newest first
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job["batch_id"] or job["job_id"], []).append(job)
+
+    for group in groups.values():
+        if len(group) == 1:
+            render_job(group[0])
+            continue
+
+        summary = summarize_jobs(group)
+        finished = summary["done"] + summary["failed"] + summary["interrupted"] + summary["skipped"]
+        with st.expander(
+            f"📦 Batch of {summary['files']} files – {summary['done']} done, "
+            f"{summary['failed']} failed, {summary['skipped']} skipped, {summary['files'] - finished} in progress",
+            expanded=finished < summary["files"]
+        ):
+            st.progress(finished / summary["files"])
+            st.caption(
+                f"{summary['pages']} pages ({summary['pages_ocr']} OCR) · "
+                f"{summary['chunks_written']} chunks written · {summary['issues_extracted']} issues extracted"
+            )
+            for job in group:
+                render_job(job)
+
    #📄 
 # ---------- Tabs ----------
 tab_index, tab_review = st.tabs([
@@ -379,41 +501,57 @@ with tab_index:
     st.subheader("Upload deposition transcript")
 
     uploaded = st.file_uploader(
-        "Upload deposition transcript (PDF)",
+        "Upload deposition transcripts (PDF)",
         type=["pdf"],
+        accept_multiple_files=True,
         label_visibility="collapsed"
     )
 
     if uploaded:
         st.markdown(
-            f'<div class="status"><strong>File:</strong> {uploaded.name}</div>',
+            f'<div class="status"><strong>Files ({len(uploaded)}):</strong> '
+            f'{", ".join(f.name for f in uploaded)}</div>',
             unsafe_allow_html=True
         )
-        if st.button("🚀 Load file"):
-            with st.spinner("Indexing document..."):
-                progress = st.progress(0)
-
-                time.sleep(0.3)
-                progress.progress(30)
-
-                # 🔥 AUTO RUN ON UPLOAD
-                build_index(uploaded)
-
-                time.sleep(0.3)
-                progress.progress(100)
+        # page counts per upload: every rerun would reopen every PDF otherwise
+        page_counts = st.session_state.setdefault("upload_page_counts", {})
+        pages, unreadable = 0, []
+        for f in uploaded:
+            key = (f.file_id, f.size)
+            if key not in page_counts:
+                try:
+                    with fitz.open(stream=f.getvalue(), filetype="pdf") as doc:
+                        page_counts[key] = doc.page_count
+                except Exception as e:
+                    unreadable.append(f"{f.name} ({e})")
+                    continue
+            pages += page_counts[key]
+        if unreadable:
+            st.error(f"❌ Not a readable PDF: {', '.join(unreadable)}")
+        st.caption(format_projection(project_upload_extraction(pages)))
+
+        if st.button("🚀 Load file" if len(uploaded) == 1 else f"🚀 Load {len(uploaded)} files"):
+            # 🔥 runs in the background, progress is persisted in ingest_jobs
+            if len(uploaded) == 1:
+                submit_ingest_job(
+                    uploaded[0].getvalue(),
+                    uploaded[0].name,
+                    created_by=st.session_state.username
+                )
+            else:
+                submit_ingest_batch(
+                    [(f.name, f.getvalue()) for f in uploaded],
+                    created_by=st.session_state.username
+                )
 
-            st.session_state.index_done = True
-            st.markdown(
-                '<div class="status success">Indexing completed</div>',
-                unsafe_allow_html=True
-    )
+    render_ingest_jobs(st.session_state.username)
 
 # ---------- TAB 2 — Review & Extract ----------
 with tab_review:
     # st.subheader("Review indexed files")
     st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
 
-    file_stats = get_file_stats()
+    file_stats = cached_file_stats()
 
     if not file_stats:
         st.warning("No indexed files found.")
@@ -439,94 +577,180 @@ with tab_review:
             st.session_state.review_file = review_file
             st.session_state.extracted = True
 
+        # -------- SEARCH TESTIMONY --------
+        warm_search()  # pool + embedding model, loaded in the background once per process
+        with st.expander("🔎 Search testimony", expanded=False):
+            s_col1, s_col2, s_col3 = st.columns([3, 2, 1])
+
+            with s_col1:
+                search_query = st.text_input(
+                    "Search",
+                    placeholder="Keywords or a question, e.g. knew about the risk",
+                    key="search_query"
+                )
+            with s_col2:
+                search_files = st.multiselect(
+                    "Files",
+                    options=filenames,
+                    default=[review_file] if review_file in filenames else [],
+                    key="search_files"
+                )
+            with s_col3:
+                search_pages = st.text_input(
+                    "Pages",
+                    placeholder="e.g. 12, 15",
+                    key="search_pages"
+                )
+
+            if search_query:
+                pages = [int(p) for p in search_pages.replace(",", " ").split() if p.isdigit()]
+                search_result = hybrid_search(
+                    search_query,
+                    k=20,
+                    filenames=search_files or None,
+                    pages=pages or None
+                )
+                hits = search_result["hits"]
+
+                if search_result["pending"] and not hits:
+                    warming = "" if search_ready() else " (loading the embedding model)"
+                    st.info(f"⏳ Search is still warming up{warming}, try again in a moment.")
+                    st.button("Retry search", key="search_retry")
+                elif not hits:
+                    st.info("No matching testimony found.")
+                else:
+                    latency = " · ".join(f"{source} {ms:.0f} ms" for source, ms in search_result["latency_ms"].items())
+                    if search_result["pending"]:
+                        latency += f" · {' + '.join(search_result['pending'])} results not ready yet"
+                    st.caption(latency)
+
+                for i, hit in enumerate(hits):
+                    h_col1, h_col2 = st.columns([5, 1])
+                    with h_col1:
+                        st.markdown(
+                            f"**{hit['filename']}** – Page.{hit['page']} "
+                            f"<span style='color:#6b7280;font-size:12px'>({' + '.join(hit['sources'])})</span>",
+                            unsafe_allow_html=True
+                        )
+                        st.caption(hit["content"][:400])
+                    with h_col2:
+                        if st.button(
+                            "Jump to page",
+                            key=f"search_hit_{hit['filename']}_{hit['page']}_{hit['chunk_index']}",
+                            disabled=not hit.get("pdf_link"),
+                            use_container_width=True
+                        ):
+                            st.session_state.review_file = hit["filename"]
+                            st.session_state.extracted = True
+                            st.session_state.selected_page = int(hit["page"])
+                            st.session_state.current_pdf_link = hit["pdf_link"].split("?")[0]
+                            st.session_state.selected_issue = None
+
         # -------- REVIEW PANEL --------
         if st.session_state.extracted and st.session_state.review_file:
             #st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
             #st.subheader("🔍 Extracted Issues Review")
 
-            rows = get_extracted_issues([st.session_state.review_file])
+            active_file = st.session_state.review_file
+            init_issue_tables()  # duplicate_of / issue_sources on databases from before dedup
+            all_facets = cached_issue_facets(active_file)
+
+            # chunks left pending (e.g. a CLI run with --batch-size)
+            projection = cached_query(
+                "chunks", ("projection", active_file),
+                lambda: project_file_extraction(active_file)
+            )
+            if projection["chunks"]:
+                st.caption(format_projection(projection))
 
-            if not rows:
+            if not all_facets["total"]:
                 st.info("No extracted issues found for this file.")
             else:
-                df = pd.DataFrame(
-                    rows,
-                    columns=[
-                        "issue_id",
-                        "chunk_id",
-                        "filename",
-                        "page",
-                        "speaker",
-                        "risk",
-                        "legal_relevance",
-                        "quoted_text",
-                        "issue_type",
-                        "pdf_link"
-                    ]
-                )
-
-                risk_order = {"HIGH": 0, "MEDIUM": 1, "LOW": 2}
-                df["risk_rank"] = df["risk"].map(risk_order)
-                df = df.sort_values(["risk_rank", "page"])
-
-                # ---- Filters ----
-                col1, col2, col3 = st.columns(3)
+                # ---- Filters (options + counts from one facet query) ----
+                col1, col2, col3, col4 = st.columns([3, 3, 3, 2])
 
                 with col1:
                     risk_filter = st.multiselect(
                         "Risk Level",
-                        options=sorted(df["risk"].unique())
+                        options=list(all_facets["risk"]),
+                        format_func=lambda v: f"{v} ({all_facets['risk'][v]})"
                     )
 
                 with col2:
                     issue_filter = st.multiselect(
                         "Issue Type",
-                        options=sorted(df["issue_type"].unique())
+                        options=list(all_facets["issue_type"]),
+                        format_func=lambda v: f"{v} ({all_facets['issue_type'][v]})"
                     )
 
                 with col3:
                     page_filter = st.multiselect(
                         "Page",
-                        options=sorted(df["page"].unique())
+                        options=list(all_facets["page"])
                     )
 
-                if risk_filter:
-                    df = df[df["risk"].isin(risk_filter)]
-                if issue_filter:
-                    df = df[df["issue_type"].isin(issue_filter)]
-                if page_filter:
-                    df = df[df["page"].isin(page_filter)]
-
-                def risk_badge(risk):
-                    risk = str(risk).upper()
-
-                    colors = {
-                        "HIGH": "#fee2e2",
-                        "MEDIUM": "#fef3c7",
-                        "LOW": "#ecfeff"
-                    }
-                    text = {
-                        "HIGH": "#991b1b",
-                        "MEDIUM": "#92400e",
-                        "LOW": "#065f46"
-                    }
-
-                    if risk not in colors:
-                        return f"<span>{risk}</span>"
-
-                    return f"""
-                    <span style="
-                        background:{colors[risk]};
-                        color:{text[risk]};
-                        padding:4px 10px;
-                        border-radius:6px;
-                        font-size:12px;
-                        font-weight:600;
-                    ">
-                        {risk}
-                    </span>
-                    """
-                    
+                with col4:
+                    issue_sort = st.selectbox(
+                        "Sort by",
+                        options=list(ISSUE_SORTS),
+                        format_func=lambda v: "Risk, then page" if v == "risk" else "Page, then risk",
+                        key="issue_sort"
+                    )
+
+                filters = (tuple(risk_filter), tuple(issue_filter), tuple(page_filter))
+                if any(filters):
+                    facets = cached_issue_facets(active_file, *filters)
+                else:
+                    facets = all_facets
+                matching = facets["matching"]
+
+                # ---- Evidence bundle export (filtered issues) ----
+                with st.expander(f"📦 Export evidence bundle ({matching} issues)", expanded=False):
+                    e_col1, e_col2 = st.columns([2, 1])
+                    with e_col1:
+                        bundle_fmt = st.radio(
+                            "Format",
+                            options=["pdf", "zip"],
+                            format_func=lambda f: "Combined PDF" if f == "pdf" else "ZIP (one PDF per deposition)",
+                            horizontal=True,
+                            key="bundle_fmt"
+                        )
+                    with e_col2:
+                        if st.button(
+                            "Build bundle",
+                            key="build_bundle",
+                            disabled=not matching,
+                            use_container_width=True
+                        ):
+                            if st.session_state.export_job:
+                                discard_bundle_job(st.session_state.export_job)
+                            bundle_rows, _ = query_issues(active_file, *filters, sort=issue_sort, limit=None)
+                            st.session_state.export_job = submit_evidence_bundle(
+                                [dict(zip(ISSUE_COLUMNS, r)) for r in bundle_rows],
+                                fmt=bundle_fmt,
+                                title=f"Evidence bundle - {st.session_state.review_file}"
+                            )
+
+                    if st.session_state.export_job:
+                        job = get_bundle_job(st.session_state.export_job)
+
+                        if job["status"] == "running":
+                            st.info(f"Building bundle of {job['count']} issues in the background…")
+                            st.button("🔄 Check status", key="bundle_refresh")
+                        elif job["status"] == "failed":
+                            st.error(f"Export failed: {job['error']}")
+                        elif job["status"] == "unknown":
+                            st.caption("The last bundle expired, build it again to download.")
+                        elif job["status"] == "done":
+                            base_name = st.session_state.review_file.rsplit(".", 1)[0]
+                            st.download_button(
+                                label=f"⬇️ Download bundle ({job['count']} issues)",
+                                data=job["data"],
+                                file_name=f"{base_name}_evidence.{job['fmt']}",
+                                mime="application/pdf" if job["fmt"] == "pdf" else "application/zip",
+                                use_container_width=True
+                            )
+
                 col_left, col_right = st.columns([2, 3])
 
                 # ---------- LEFT: ISSUES ----------
@@ -544,49 +768,48 @@ with tab_review:
                         </div>
                     """, unsafe_allow_html=True)
 
-                    scroll_box = st.container(height=900) 
+                    page_size = st.selectbox(
+                        "Issues per page",
+                        options=PAGE_SIZE_OPTIONS,
+                        index=PAGE_SIZE_OPTIONS.index(ISSUE_PAGE_SIZE),
+                        key="issue_page_size"
+                    )
 
-                    with scroll_box:
-                        for _, row in df.iterrows():
-                            page = int(row["page"])
-                            pdf_link = row["pdf_link"].split("?")[0]
-
-                            header = (
-                                f"<div style='display:flex; align-items:center; gap:8px;'>"
-                                f"{risk_badge(row['risk'])}"
-                                f"<strong>Page.{row['page']}</strong>"
-                                f"<span>– {row['issue_type']}</span>"
-                                f"</div>"
+                    # back to the first page whenever the file, filters or sort change
+                    view_key = (active_file, filters, issue_sort, page_size)
+                    if st.session_state.issue_view_key != view_key:
+                        st.session_state.issue_view_key = view_key
+                        st.session_state.issue_page = 0
+                        st.session_state.issue_cursors = [None]
+
+                    def fetch_issue_page(after):
+                        with span("review.issue_page", filename=active_file, sort=issue_sort, first_page=after is None):
+                            rows, next_cursor = cached_issue_page(
+                                active_file, *filters,
+                                sort=issue_sort,
+                                limit=page_size,
+                                after=after
                             )
+                        return [dict(zip(ISSUE_COLUMNS, r)) for r in rows], next_cursor
 
-                            with st.expander("Click to view details", expanded=False):
-                                st.markdown(
-                                    f"<div style='margin-bottom:8px'>{header}</div>",
-                                    unsafe_allow_html=True
-                                )
-
-                                st.markdown("**Quoted testimony**")
-                                st.code(row["quoted_text"], language="text")
-
-                                st.markdown("**Legal relevance**")
-                                st.write(row["legal_relevance"])
+                    scroll_box = st.container(height=900) 
 
-                                if st.button(
-                                    "👁 View in PDF",
-                                    key=f"view_pdf_{row['issue_id']}",
-                                    use_container_width=True
-                                ):
-                                    st.session_state.selected_page = page
-                                    st.session_state.current_pdf_link = pdf_link
+                    with scroll_box:
+                        # only the visible page is queried and rendered
+                        st.session_state.issue_page = render_keyset_list(
+                            fetch_issue_page,
+                            matching,
+                            page_size,
+                            similar_lookup=find_similar_testimony
+                        )
 
-                     
                 # ---------- RIGHT: PDF ----------
                 with col_right:
-                    for _, row in df.iterrows():
-                        page = int(row["page"])
-                        pdf_link = row["pdf_link"]
-                        pdf_page_url = f"#page={pdf_link}" + f"#page={page}"
-                        issue_key = str(row["issue_id"])
+                    selected = st.session_state.selected_issue or {}
+                    issue_key = str(
+                        selected.get("issue_id")
+                        or f"{st.session_state.current_pdf_link}#{st.session_state.selected_page}"
+                    )
 
                     # init state cho issue này
                     if issue_key not in st.session_state.confirm_download:
@@ -609,20 +832,43 @@ with tab_review:
                         st.info("👈 Select an issue to view the corresponding PDF page")
                     else:
                         page = st.session_state.selected_page
+                        pdf_link = st.session_state.current_pdf_link
+
+                        with st.spinner("Loading PDF from Dropbox..."):
+                            # shared across sessions, keyed by link
+                            pdf_bytes = get_pdf_bytes(pdf_link)
+                            page_count = get_page_count(pdf_link)
+
+                        v_col1, v_col2, v_col3, v_col4 = st.columns([1, 1, 3, 2])
+                        with v_col1:
+                            if st.button("◀", key="prev_page", disabled=page <= 1, use_container_width=True):
+                                page = st.session_state.selected_page = page - 1
+                        with v_col2:
+                            if st.button("▶", key="next_page", disabled=page >= page_count, use_container_width=True):
+                                page = st.session_state.selected_page = page + 1
+                        with v_col3:
+                            st.markdown(
+                                f'<div class="status" style="padding-top:8px">Page {page} of {page_count}</div>',
+                                unsafe_allow_html=True
+                            )
+                        with v_col4:
+                            view_mode = st.selectbox(
+                                "View mode",
+                                options=["Page image", "Page PDF", "Full PDF"],
+                                key="view_mode",
+                                label_visibility="collapsed"
+                            )
 
-                        if st.session_state.pdf_bytes is None:
-                            with st.spinner("Loading PDF from Dropbox..."):
-                                access_token = get_runtime_access_token()
-                                st.session_state.pdf_bytes = download_dropbox_pdf_raw(
-                                    pdf_link,
-                                    access_token
-                                )
-                        
-                        render_pdfjs_from_bytes(
-                            st.session_state.pdf_bytes,
-                            page=page,
-                            height=900
-                        )      
+                        if view_mode == "Page image":
+                            render_pdf_page(pdf_link, page=page, mode="png")
+                        elif view_mode == "Page PDF":
+                            render_pdf_page(pdf_link, page=page, mode="pdf", height=900)
+                        else:
+                            render_pdfjs_from_bytes(
+                                pdf_bytes,
+                                page=page,
+                                height=900
+                            )      
                                      
                         # ----- CONFIRM BUTTON -----
                         if not st.session_state.confirm_download[issue_key]:
@@ -633,15 +879,15 @@ with tab_review:
                             ):
                                 st.session_state.confirm_download[issue_key] = True
                                 st.session_state.download_page = page
-                                st.session_state.download_pdf_link = row["pdf_link"]
+                                st.session_state.download_pdf_link = pdf_link
 
                         # ----- DOWNLOAD BUTTON -----
                         else:
                             page_to_download = st.session_state.download_page
 
                             if page_to_download is not None:
-                                single_page_pdf = extract_single_page_pdf(
-                                    st.session_state.pdf_bytes,
+                                single_page_pdf = extract_page_pdf(
+                                    pdf_link,
                                     page_to_download
                                 )
 
@@ -649,9 +895,9 @@ with tab_review:
                                     label=f"⬇️ Download Page {page_to_download}",
                                     data=single_page_pdf,
                                     file_name=(
-                                        f"{row['filename']}"
+                                        f"{selected.get('filename', st.session_state.review_file)}"
                                         f"_page_{page_to_download}"
-                                        f"_{row['issue_type']}.pdf"
+                                        f"_{selected.get('issue_type', 'page')}.pdf"
                                     ),
                                     mime="application/pdf",
                                     use_container_width=True
@@ -0,0 +1,65 @@
+"""
+Scaling of issue_dedup.find_duplicates on synthetic issues of one file.
+
+    python -m benchmarks.bench_dedup --sizes 1000 10000 50000 --dup-rate 0.2
+
+Every issue quotes 8-40 words; dup_rate of them are re-quoted by the next chunk as a
+suffix (the chunk overlap case), 1% again far away in the file. Per size: wall time,
+candidate pairs, duplicates found vs planted. Prints one JSON object.
+"""
+import argparse
+import json
+import random
+import time
+from issue_dedup import find_duplicates
+
+VOCAB = (
+    "the company knew about the risk and did not warn doctors or patients of exposure "
+    "in the study data we never tested for that before the product was launched"
+).split()
+
+def make_issues(n, dup_rate, seed):
+    rng = random.Random(seed)
+    issues, planted = [], 0
+    for i in range(n):
+        words = [rng.choice(VOCAB) if rng.random() < 0.6 else f"w{rng.randrange(10 ** 6)}"
+                 for _ in range(rng.randint(8, 40))]
+        issues.append({"issue_id": f"i{i}", "quoted_text": "A. " + " ".join(words),
+                       "chunk_pos": i // 2, "page": i // 6, "risk_rank": rng.randint(0, 2)})
+        if rng.random() < dup_rate:
+            cut = rng.randint(0, len(words) // 3)
+            issues.append({"issue_id": f"d{i}", "quoted_text": " ".join(words[cut:]).upper() + ".",
+                           "chunk_pos": i // 2 + 1, "page": i // 6, "risk_rank": rng.randint(0, 2)})
+            planted += 1
+        if rng.random() < 0.01:
+            issues.append({"issue_id": f"f{i}", "quoted_text": " ".join(words),
+                           "chunk_pos": i // 2 + 500, "page": i // 6 + 100, "risk_rank": 1})
+            planted += 1
+    return issues, planted
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dup-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = []
+    for n in args.sizes:
+        issues, planted = make_issues(n, args.dup_rate, args.seed)
+        t0 = time.perf_counter()
+        groups, candidates = find_duplicates(issues)
+        seconds = time.perf_counter() - t0
+        report.append({
+            "issues": len(issues),
+            "seconds": round(seconds, 3),
+            "us_per_issue": round(seconds / len(issues) * 1e6, 1),
+            "candidates": candidates,
+            "groups": len(groups),
+            "duplicates_found": sum(len(g) - 1 for g in groups),
+            "duplicates_planted": planted,
+        })
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
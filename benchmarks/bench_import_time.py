@@ -0,0 +1,130 @@
+"""
+Import-time budget for the app and the headless entry points.
+
+    python -m benchmarks.bench_import_time --runs 5
+    python -m benchmarks.bench_import_time --target worker --budget-ms 600
+    python -m benchmarks.bench_import_time --target cli
+
+Each target's imports run in a fresh interpreter under `python -X importtime`
+(no secrets needed: settings are read on first use). Reports the median
+total, the slowest modules, and heavy modules that must stay lazy.
+Exits 1 when a target is over budget or pulls in a lazy module.
+Prints one JSON object.
+"""
+import argparse
+import ast
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# imported only by the code paths that need them
+LAZY_MODULES = [
+    "torch",
+    "sentence_transformers",
+    "pytesseract",
+    "pdf2image",
+    "PyPDF2",
+    "anthropic",
+    "paramiko",
+    "dropbox",
+]
+
+BUDGETS_MS = {
+    "app": 1500,      # streamlit + fitz + faiss + psycopg dominate
+    "worker": 800,
+    "cli": 300,       # subcommands import the pipeline modules on use
+}
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def script_imports(path):
+    """
+    Source of the top-level import statements of a script that cannot be imported (app.py).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source)
+    lines = [
+        ast.get_source_segment(source, node)
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    ]
+    return "\n".join(lines)
+
+def target_code(name):
+    if name == "app":
+        return script_imports(os.path.join(ROOT, "app.py"))
+    if name == "worker":
+        return "import ingest_jobs, indexing, issue_extractor"
+    if name == "cli":
+        return "import cli"
+    raise ValueError(f"Unknown target: {name}")
+
+def measure(code):
+    """
+    Return: (total_ms, {module: cumulative_ms})
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    total_us, modules = 0, {}
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        _, cumulative, indent, module = m.groups()
+        modules[module] = int(cumulative) / 1000
+        if len(indent) == 1:  # top-level import of this run
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+def run_target(name, runs, budget_ms, top):
+    code = target_code(name)
+    totals, modules = [], {}
+    for _ in range(runs):
+        total, modules = measure(code)
+        totals.append(total)
+
+    total_ms = statistics.median(totals)
+    loaded_lazy = sorted(m for m in modules if m in LAZY_MODULES)
+    slowest = sorted(modules.items(), key=lambda kv: kv[1], reverse=True)[:top]
+
+    return {
+        "median_ms": round(total_ms, 1),
+        "budget_ms": budget_ms,
+        "over_budget": total_ms > budget_ms,
+        "lazy_modules_loaded": loaded_lazy,
+        "slowest": [{"module": m, "cumulative_ms": round(ms, 1)} for m, ms in slowest],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=sorted(BUDGETS_MS), action="append",
+                        help="default: every target")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="override the budget of the selected targets")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    report = {}
+    for name in args.target or sorted(BUDGETS_MS):
+        budget = args.budget_ms if args.budget_ms is not None else BUDGETS_MS[name]
+        report[name] = run_target(name, args.runs, budget, args.top)
+
+    print(json.dumps(report, indent=2))
+    failed = any(r["over_budget"] or r["lazy_modules_loaded"] for r in report.values())
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
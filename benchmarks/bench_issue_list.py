@@ -0,0 +1,79 @@
+"""
+Rerun cost of the review issue list: render every issue vs the paginated window.
+
+    python -m benchmarks.bench_issue_list --issues 5000 --page-size 25 --reruns 5
+
+Runs the list in Streamlit's AppTest harness (script run + element tree, no
+browser) with synthetic issues. Prints one JSON object.
+"""
+import argparse
+import json
+import statistics
+import time
+from streamlit.testing.v1 import AppTest
+
+def _list_script():
+    import pandas as pd
+    import streamlit as st
+    from issue_list import render_issue_card, render_issue_list
+
+    n = st.session_state["bench_issues"]
+    risks = ["HIGH", "MEDIUM", "LOW"]
+    df = pd.DataFrame({
+        "issue_id": [f"issue-{i:06d}" for i in range(n)],
+        "filename": ["bench.pdf"] * n,
+        "page": [i // 4 + 1 for i in range(n)],
+        "risk": [risks[i % 3] for i in range(n)],
+        "issue_type": ["causation"] * n,
+        "quoted_text": [f"Q. Did you know? A. Yes, I knew about it ({i})." for i in range(n)],
+        "legal_relevance": ["Admission of corporate knowledge."] * n,
+        "pdf_link": ["https://www.dropbox.com/s/bench/bench.pdf?dl=0"] * n,
+    })
+
+    if st.session_state["bench_mode"] == "all":
+        for row in df.to_dict("records"):
+            render_issue_card(row)
+    else:
+        render_issue_list(df, 0, st.session_state["bench_page_size"])
+
+def time_mode(mode, issues, page_size, reruns):
+    at = AppTest.from_function(_list_script, default_timeout=600)
+    at.session_state["bench_issues"] = issues
+    at.session_state["bench_mode"] = mode
+    at.session_state["bench_page_size"] = page_size
+
+    samples = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - t0)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    return {
+        "expanders": len(at.expander),
+        "buttons": len(at.button),
+        "first_run_ms": round(samples[0] * 1000, 1),
+        "rerun_median_ms": round(statistics.median(samples[1:] or samples) * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--issues", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=25)
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args()
+
+    report = {
+        "issues": args.issues,
+        "page_size": args.page_size,
+        "render_all": time_mode("all", args.issues, args.page_size, args.reruns),
+        "paginated": time_mode("paginated", args.issues, args.page_size, args.reruns),
+    }
+    report["speedup"] = round(
+        report["render_all"]["rerun_median_ms"] / max(report["paginated"]["rerun_median_ms"], 0.1), 1
+    )
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+End-to-end pipeline throughput on synthetic depositions, against local stand-ins.
+
+    python -m benchmarks.bench_pipeline --files 4 --pages 100 --image-fraction 0.1 --out head.json
+    python -m benchmarks.bench_pipeline --compare base.json head.json --threshold 10
+
+Stages: extract_pages, clean_transcript_text, smart_chunk_text, insert_metadata,
+run_issue_extraction, build_faiss_index. Services are stand-ins (benchmarks/standins.py):
+a throwaway Postgres cluster (no SSH tunnel), a fake Anthropic API with a latency model,
+an in-memory Dropbox; FAISS shards go to a temp dir. OCR pages need tesseract.
+--fake-embedder swaps the embedding model for random vectors (build_faiss_index then
+measures chunking + store writes only).
+
+Per stage: items, throughput, p50/p95 latency per step (page, chunk or batch) and peak RSS.
+Prints one JSON object; --compare exits 1 when a stage regressed past the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import fitz
+import numpy as np
+from benchmarks.standins import FakeDropbox, fake_anthropic, temp_postgres
+from benchmarks.synthetic import make_corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RSS_SAMPLE_INTERVAL = 0.02
+REPORT_VERSION = 1
+
+# ========== MEASUREMENT ==========
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:  # not Linux: peak of the whole process so far
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 2) if samples else None
+
+@contextmanager
+def measure_stage(report, name, unit, step):
+    """
+    Times a stage and samples RSS while it runs.
+    Yields a dict: add to "items", append step durations (seconds) to "latencies".
+    """
+    stage = {"items": 0, "latencies": []}
+    peak = [rss_mb()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(RSS_SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], rss_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    print(f"⏱️ {name} ...")
+    started = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        seconds = time.perf_counter() - started
+        done.set()
+        sampler.join()
+        peak[0] = max(peak[0], rss_mb())
+
+        report[name] = {
+            "items": stage["items"],
+            "unit": unit,
+            "seconds": round(seconds, 3),
+            "throughput_per_s": round(stage["items"] / seconds, 2) if seconds else None,
+            "latency_per": step,
+            "p50_ms": percentile_ms(stage["latencies"], 50),
+            "p95_ms": percentile_ms(stage["latencies"], 95),
+            "peak_rss_mb": round(peak[0], 1),
+        }
+
+def timed(stage, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    stage["latencies"].append(time.perf_counter() - t0)
+    return out
+
+def step_recorder(stage, counter):
+    """
+    Pipeline progress callback: records the time between calls that advance counter
+    (one page / chunk / batch per call).
+    """
+    last = {"at": time.perf_counter(), "done": 0}
+
+    def progress(_stage, **counters):
+        done = counters.get(counter, 0)
+        now = time.perf_counter()
+        if done > last["done"]:
+            stage["latencies"].append(now - last["at"])
+        last["at"], last["done"] = now, done
+
+    return progress
+
+# ========== STAND-IN WIRING ==========
+@contextmanager
+def patched(obj, name, value):
+    old = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, old)
+
+@contextmanager
+def settings_env(**sections):
+    """
+    DEPO_<SECTION>_<KEY> env vars (config.get_config) for the duration of the run.
+    """
+    from config import env_name, reset_config
+
+    old = {}
+    for section, values in sections.items():
+        for key, value in values.items():
+            name = env_name(section, key)
+            old[name] = os.environ.get(name)
+            os.environ[name] = value
+    reset_config()
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        reset_config()
+
+class FakeEmbedder:
+    """
+    Random unit vectors in place of the sentence-transformers model.
+    """
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, show_progress_bar=False):
+        from vector_store import EMBEDDING_DIM
+        x = self.rng.standard_normal((len(texts), EMBEDDING_DIM)).astype("float32")
+        return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+# ========== STAGES ==========
+def run_pipeline(corpus, args, llm):
+    import index
+    import indexing
+    from issue_extractor import run_issue_extraction
+    from vector_store import get_vector_store
+
+    stages = {}
+
+    # --- parse (OCR on image-only pages) ---
+    pages_by_file = {}
+    with measure_stage(stages, "extract_pages", "pages", "page") as stage:
+        for filename, data in corpus:
+            pages_by_file[filename] = indexing.extract_pages(data, step_recorder(stage, "pages_parsed"))
+            stage["items"] += fitz.open(stream=data, filetype="pdf").page_count
+
+    # --- text-layer cleanup, on the raw page text ---
+    raw_pages = []
+    for _, data in corpus:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            raw_pages += [t for t in (p.get_text("text") for p in doc) if t.strip()]
+    with measure_stage(stages, "clean_transcript_text", "pages", "page") as stage:
+        for text in raw_pages:
+            timed(stage, indexing.clean_transcript_text, text)
+        stage["items"] = len(raw_pages)
+
+    # --- chunking ---
+    with measure_stage(stages, "smart_chunk_text", "pages", "page") as stage:
+        for pages in pages_by_file.values():
+            for page in pages:
+                timed(stage, indexing.smart_chunk_text, page["text"], indexing.CHUNK_SIZE, indexing.CHUNK_OVERLAP)
+                stage["items"] += 1
+
+    # --- Postgres writes ---
+    indexing.init_postgresql()
+    with measure_stage(stages, "insert_metadata", "chunks", "batch") as stage:
+        for filename, pages in pages_by_file.items():
+            docs = indexing.docs_from_pages(pages, filename)
+            indexing.insert_metadata(docs, step_recorder(stage, "chunks_written"), args.insert_batch_size)
+            stage["items"] += len(docs)
+
+    # --- issue extraction against the fake API ---
+    with measure_stage(stages, "run_issue_extraction", "chunks", "chunk") as stage:
+        requests_before = llm.requests
+        for filename in pages_by_file:
+            run_issue_extraction(filename, step_recorder(stage, "extract_done"), limit=args.extract_limit)
+        stage["items"] = llm.requests - requests_before
+
+    # --- embeddings + FAISS shards, PDFs served by the fake Dropbox ---
+    faiss_dir = tempfile.mkdtemp(prefix="bench_faiss_")
+    dbx = FakeDropbox(corpus, index.FOLDER_PATH, args.dropbox_latency_ms, args.dropbox_mbps)
+    try:
+        with patched(index, "FAISS_DIR", faiss_dir), \
+             patched(index, "get_dropbox_client", lambda: dbx), \
+             patched(index, "load_embedding_model",
+                     (lambda *a, **k: FakeEmbedder(args.seed)) if args.fake_embedder else index.load_embedding_model):
+            with measure_stage(stages, "build_faiss_index", "chunks", "batch") as stage:
+                stage["items"] = index.build_faiss_index(
+                    get_vector_store("faiss"),
+                    batch_size=args.embed_batch_size,
+                    progress=step_recorder(stage, "chunks_embedded"),
+                )
+    finally:
+        shutil.rmtree(faiss_dir, ignore_errors=True)
+
+    return stages
+
+def git_meta():
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def run(args):
+    print(f"📄 Generating {args.files} x {args.pages} pages (image fraction {args.image_fraction}) ...")
+    corpus = make_corpus(args.files, args.pages, args.image_fraction, args.seed)
+
+    with temp_postgres(args.pg_bindir) as db, \
+         fake_anthropic(args.llm_latency_ms, args.llm_ms_per_token, args.llm_jitter, seed=args.seed) as llm, \
+         settings_env(
+             database=db,
+             ssh={"SSH_HOST": ""},   # direct connection, no tunnel
+             claude={"base_url": llm.base_url, "api_key": "bench", "anthropic_model": "bench-model"},
+         ):
+        stages = run_pipeline(corpus, args, llm)
+
+    return {
+        "version": REPORT_VERSION,
+        "meta": {
+            **git_meta(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "params": {k: v for k, v in vars(args).items() if k not in ("compare", "out", "threshold")},
+        "corpus_mb": round(sum(len(d) for _, d in corpus) / 1e6, 2),
+        "stages": stages,
+        "peak_rss_mb": max(s["peak_rss_mb"] for s in stages.values()),
+    }
+
+# ========== COMPARE ==========
+# metric -> True when higher is better
+COMPARED_METRICS = {"throughput_per_s": True, "p50_ms": False, "p95_ms": False, "peak_rss_mb": False}
+
+def compare(base, head, threshold):
+    """
+    Return: ({stage: {metric: {"base", "head", "change_pct", "regressed"}}}, any regression)
+    """
+    result, regressed = {}, False
+    for name, h in head["stages"].items():
+        b = base["stages"].get(name)
+        if not b:
+            continue
+        result[name] = {}
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if not b.get(metric) or h.get(metric) is None:
+                continue
+            change = (h[metric] - b[metric]) / b[metric] * 100
+            worse = -change if higher_is_better else change
+            result[name][metric] = {
+                "base": b[metric],
+                "head": h[metric],
+                "change_pct": round(change, 1),
+                "regressed": worse > threshold,
+            }
+            regressed |= worse > threshold
+    if base.get("params") != head.get("params"):
+        print("⚠️ The two runs used different parameters.", file=sys.stderr)
+    return result, regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--image-fraction", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--insert-batch-size", type=int, default=500)
+    parser.add_argument("--extract-limit", type=int, default=50, help="chunks per file sent to the fake API")
+    parser.add_argument("--embed-batch-size", type=int, default=None)
+    parser.add_argument("--fake-embedder", action="store_true")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-ms-per-token", type=float, default=10)
+    parser.add_argument("--llm-jitter", type=float, default=0.3)
+    parser.add_argument("--dropbox-latency-ms", type=float, default=50)
+    parser.add_argument("--dropbox-mbps", type=float, default=50)
+    parser.add_argument("--pg-bindir", help="directory of initdb / pg_ctl")
+    parser.add_argument("--out", help="also write the report to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="compare two reports, run nothing")
+    parser.add_argument("--threshold", type=float, default=10, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            head = json.load(f)
+        result, regressed = compare(base, head, args.threshold)
+        print(json.dumps({
+            "base": base["meta"].get("commit"),
+            "head": head["meta"].get("commit"),
+            "threshold_pct": args.threshold,
+            "regressed": regressed,
+            "stages": result,
+        }, indent=2))
+        sys.exit(1 if regressed else 0)
+
+    # pipeline prints go to stderr, stdout is the report
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        report = run(args)
+    finally:
+        sys.stdout = stdout
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Throughput and accuracy of quote_verify on a synthetic transcript.
+
+    python -m benchmarks.bench_quote_verify --pages 300 --quotes 20000
+
+Chunks are cut like smart_chunk_text (CHUNK_SIZE chars, CHUNK_OVERLAP overlap, per page).
+Quotes are A. answers of a chunk, mixed per --mix: verbatim, re-cased / re-spaced,
+edited (a word of a 7+ word answer dropped and one changed), spanning into the next chunk of the page
+(verbatim on a page's last chunk), and invented.
+Reports quotes per second (cold: SourceTexts built inside the timing) and the status
+found per kind. Prints one JSON object.
+"""
+import argparse
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from benchmarks.synthetic import transcript_lines
+from quote_verify import source_levels, verify_quote
+
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 120
+KINDS = ("verbatim", "normalized", "edited", "spanning", "invented")
+
+def make_chunks(pages, lines_per_page, seed):
+    rng = random.Random(seed)
+    chunks = []
+    for page in range(1, pages + 1):
+        text = "\n".join(f"{i:>2}  {line}" for i, line in enumerate(transcript_lines(rng, lines_per_page), start=1))
+        start, idx = 0, 0
+        while start < len(text):
+            chunks.append((f"bench_{page:04d}_{idx:02d}", page, text[start:start + CHUNK_SIZE]))
+            start += CHUNK_SIZE - CHUNK_OVERLAP
+            idx += 1
+    return chunks
+
+def make_quote(kind, chunks, i, rng):
+    chunk_id, _, content = chunks[i]
+    answers = [ln.split("A. ", 1)[1] for ln in content.splitlines() if "A. " in ln]
+    answers = [a for a in answers if a.strip()]   # "A. " cut at the chunk end
+    quote = rng.choice(answers) if answers else content[:80]
+
+    if kind == "normalized":
+        quote = "  ".join(quote.upper().split()).rstrip(".")
+    elif kind == "edited":
+        long_answers = [a for a in answers if len(a.split()) > 6]
+        if long_answers:   # shorter answers stay verbatim
+            words = rng.choice(long_answers).split()
+            del words[rng.randrange(len(words))]
+            words[rng.randrange(len(words))] = "allegedly"
+            quote = " ".join(words)
+    elif kind == "spanning" and i + 1 < len(chunks) and chunks[i + 1][1] == chunks[i][1]:
+        # last 60 chars of this chunk + the 60 that follow them in the next one, cut to whole words
+        text = content[-60:] + chunks[i + 1][2][CHUNK_OVERLAP:CHUNK_OVERLAP + 60]
+        quote = " ".join(text.split(" ")[1:-1]).strip()
+    elif kind == "invented":
+        quote = "I personally shredded the internal memo about the " + rng.choice(["dust", "warnings", "study"])
+    return chunk_id, quote
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--lines-per-page", type=int, default=25)
+    parser.add_argument("--quotes", type=int, default=20000)
+    parser.add_argument("--mix", type=float, nargs=5, default=[0.7, 0.1, 0.1, 0.05, 0.05],
+                        metavar=("VERBATIM", "NORMALIZED", "EDITED", "SPANNING", "INVENTED"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    chunks = make_chunks(args.pages, args.lines_per_page, args.seed)
+    kinds = rng.choices(KINDS, weights=args.mix, k=args.quotes)
+    quotes = [(kind, *make_quote(kind, chunks, rng.randrange(len(chunks)), rng)) for kind in kinds]
+
+    t0 = time.perf_counter()
+    levels = source_levels(chunks)
+    results = [verify_quote(quote, levels(chunk_id)) for _, chunk_id, quote in quotes]
+    seconds = time.perf_counter() - t0
+
+    by_kind = defaultdict(Counter)
+    for (kind, _, _), r in zip(quotes, results):
+        by_kind[kind][r["quote_status"]] += 1
+
+    print(json.dumps({
+        "chunks": len(chunks),
+        "quotes": len(quotes),
+        "seconds": round(seconds, 3),
+        "quotes_per_s": round(len(quotes) / seconds, 1),
+        "status_by_kind": {kind: dict(by_kind[kind]) for kind in KINDS},
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+FAISS shards vs pgvector at corpus size.
+
+    python -m benchmarks.bench_vector_store --chunks 50000 --files 200 --queries 200
+
+Uses random unit vectors (no embedding model), a temp dir for the FAISS shards
+and a scratch Postgres table so the real chunks table is untouched.
+Prints one JSON object.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import index
+from db_utils import pooled_connection
+from vector_store import EMBEDDING_DIM, FaissStore, PgVectorStore
+
+BENCH_TABLE = "chunks_bench"
+
+def make_docs(n_chunks, n_files):
+    docs = []
+    for i in range(n_chunks):
+        filename = f"bench_{i % n_files:04d}.pdf"
+        bates_id = f"bench_{i:08d}"
+        docs.append({
+            "content": f"[Q] synthetic question {i}? [A] synthetic answer {i}.",
+            "metadata": {
+                "source": filename,
+                "path": filename,
+                "page": i // n_files + 1,
+                "bates_id": bates_id,
+                "chunk_index": 0,
+                "chunk_chars": 40,
+                "has_ocr": False,
+                "collection_id": "bench",
+                "pdf_link": None,
+            }
+        })
+    return docs
+
+def random_unit(n, dim, rng):
+    x = rng.standard_normal((n, dim)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 2)
+
+def run_searches(store, queries, k, filenames=None):
+    latencies, results = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = store.search(q.reshape(1, -1), k=k, filenames=filenames)
+        latencies.append(time.perf_counter() - t0)
+        results.append([h["chunk_id"] for h in hits])
+    return latencies, results
+
+def bench_store(store, docs, embeddings, queries, k, one_file):
+    t0 = time.perf_counter()
+    store.add(docs, embeddings)
+    add_s = time.perf_counter() - t0
+
+    all_lat, all_res = run_searches(store, queries, k)
+    file_lat, _ = run_searches(store, queries, k, filenames=[one_file])
+
+    return {
+        "add_seconds": round(add_s, 2),
+        "add_vectors_per_s": round(len(docs) / add_s, 1),
+        "search_all_p50_ms": percentile_ms(all_lat, 50),
+        "search_all_p95_ms": percentile_ms(all_lat, 95),
+        "search_one_file_p50_ms": percentile_ms(file_lat, 50),
+        "search_one_file_p95_ms": percentile_ms(file_lat, 95),
+    }, all_res
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    docs = make_docs(args.chunks, args.files)
+    embeddings = random_unit(args.chunks, EMBEDDING_DIM, rng)
+    queries = random_unit(args.queries, EMBEDDING_DIM, rng)
+    one_file = docs[0]["metadata"]["source"]
+    report = {"chunks": args.chunks, "files": args.files, "queries": args.queries, "k": args.k}
+
+    # --- FAISS shards in a temp dir ---
+    tmp = tempfile.mkdtemp(prefix="bench_faiss_")
+    index.FAISS_DIR = tmp
+    try:
+        report["faiss"], exact = bench_store(FaissStore(), docs, embeddings, queries, args.k, one_file)
+        shard_dir = index.current_snapshot(refresh=True).shard_dir
+        report["faiss"]["disk_mb"] = round(
+            sum(os.path.getsize(os.path.join(shard_dir, f)) for f in os.listdir(shard_dir)) / 1e6, 1
+        )
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    # --- pgvector in a scratch table ---
+    with pooled_connection() as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        conn.execute(f"""
+            CREATE TABLE {BENCH_TABLE} (
+                chunk_id TEXT PRIMARY KEY,
+                filename TEXT,
+                path TEXT,
+                page INTEGER,
+                chunk_index INTEGER,
+                chunk_chars INTEGER,
+                has_ocr INTEGER,
+                collection_id TEXT,
+                content TEXT
+            )
+        """)
+    try:
+        report["pgvector"], approx = bench_store(PgVectorStore(BENCH_TABLE), docs, embeddings, queries, args.k, one_file)
+        # FAISS flat search is exact -> recall of the HNSW index
+        report["pgvector"]["recall_at_k"] = round(
+            float(np.mean([len(set(a) & set(e)) / max(len(e), 1) for a, e in zip(approx, exact)])), 4
+        )
+    finally:
+        with pooled_connection() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Recall loss of the triage cascade against single-model extraction.
+
+    python -m benchmarks.eval_cascade --triage-model claude-haiku-4-5 --sample 400 \
+        --thresholds 0.1 0.2 0.3 0.5 --batch 8
+
+Baseline: chunks the primary model extracted on its own (issue_progress.triage_model IS NULL,
+current PROMPT / model stamp); their live issues are the ground truth. A stratified sample
+(half chunks with issues, half without, reweighted to the corpus mix) is scored once by the
+triage model, then every threshold is evaluated on those scores:
+
+    escalation_rate    share of the corpus sent on to the primary model
+    chunk_recall       baseline chunks with issues that are escalated
+    issue_recall       baseline issues on escalated chunks (recall_loss = 1 - this)
+    high_risk_recall   same, HIGH risk issues only
+    cost / seconds     per 1000 chunks, single model vs triage + escalated extraction
+
+Spends real API tokens on the triage model only (ledger rows carry run_id eval-...).
+Uses the configured database. Prints one JSON object.
+"""
+import argparse
+import json
+import random
+import uuid
+from db_utils import pooled_connection
+from extraction_ledger import project
+from issue_extractor import PROMPT, PROMPT_VERSION, get_anthropic_model, init_issue_tables
+from triage import TRIAGE_PROMPT_VERSION, triage_chunks, triage_settings
+
+SAMPLE_SQL = """
+    WITH done AS (
+        SELECT c.chunk_id, c.content, COUNT(i.issue_id) AS issues
+        FROM chunks c
+        JOIN issue_progress p ON p.chunk_id = c.chunk_id
+        LEFT JOIN deposition_issues i ON i.chunk_id = c.chunk_id
+        WHERE p.extracted = 1
+        AND p.triage_model IS NULL
+        AND p.model = %(model)s
+        AND (p.prompt_version = %(prompt_version)s OR %(any_prompt)s)
+        GROUP BY c.chunk_id, c.content
+    )
+    SELECT chunk_id, content, issues, COUNT(*) OVER () AS population
+    FROM done
+    WHERE (issues > 0) = %(positive)s
+    ORDER BY md5(chunk_id || %(seed)s)
+    LIMIT %(n)s
+"""
+
+def load_sample(n, seed, any_prompt):
+    """
+    Return: (positives, negatives, population by stratum); rows are (chunk_id, content, issues)
+    """
+    strata, population = {}, {}
+    params = {
+        "model": get_anthropic_model(),
+        "prompt_version": PROMPT_VERSION,
+        "any_prompt": any_prompt,
+        "seed": str(seed),
+        "n": n // 2,
+    }
+    with pooled_connection() as conn:
+        for positive in (True, False):
+            rows = conn.execute(SAMPLE_SQL, dict(params, positive=positive)).fetchall()
+            strata[positive] = [row[:3] for row in rows]
+            population[positive] = rows[0][3] if rows else 0
+    return strata[True], strata[False], population
+
+def load_issues(chunk_ids):
+    """
+    Return: {chunk_id: [(risk_level, quoted_text), ...]}
+    """
+    issues = {}
+    with pooled_connection() as conn:
+        for chunk_id, risk, quote in conn.execute(
+            "SELECT chunk_id, upper(risk_level), quoted_text FROM deposition_issues WHERE chunk_id = ANY(%s)",
+            (list(chunk_ids),)
+        ):
+            issues.setdefault(chunk_id, []).append((risk, quote))
+    return issues
+
+def triage_spend(run_id):
+    with pooled_connection() as conn:
+        calls, failed, cost, latency_ms = conn.execute("""
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE parse_status <> 'ok'), SUM(cost_usd), SUM(latency_ms)
+            FROM extraction_calls
+            WHERE run_id = %s
+        """, (run_id,)).fetchone()
+    return calls, failed, float(cost or 0), float(latency_ms or 0) / 1000
+
+def _ratio(a, b):
+    return round(a / b, 4) if b else None
+
+def evaluate(threshold, scores, positives, negatives, population, issues, per_chunk, show_missed):
+    """
+    Metrics of one threshold. per_chunk: triage / primary cost and seconds per sampled chunk.
+    """
+    escalated = {cid for cid, _, _ in positives + negatives if scores.get(cid, 1.0) >= threshold}
+    pos_escalated = sum(1 for cid, _, _ in positives if cid in escalated)
+    neg_escalated = sum(1 for cid, _, _ in negatives if cid in escalated)
+
+    corpus = population[True] + population[False]
+    escalation_rate = (
+        (pos_escalated / len(positives) if positives else 0) * population[True]
+        + (neg_escalated / len(negatives) if negatives else 0) * population[False]
+    ) / corpus if corpus else None
+
+    all_issues = [(cid, risk, quote) for cid, rows in issues.items() for risk, quote in rows]
+    found = [it for it in all_issues if it[0] in escalated]
+    high = [it for it in all_issues if it[1] == "HIGH"]
+    missed_high = [it for it in high if it[0] not in escalated]
+    issue_recall = _ratio(len(found), len(all_issues))
+
+    report = {
+        "threshold": threshold,
+        "escalation_rate": round(escalation_rate, 4) if escalation_rate is not None else None,
+        "chunk_recall": _ratio(pos_escalated, len(positives)),
+        "issue_recall": issue_recall,
+        "recall_loss": round(1 - issue_recall, 4) if issue_recall is not None else None,
+        "high_risk_recall": _ratio(len(high) - len(missed_high), len(high)),
+        "missed_issues": len(all_issues) - len(found),
+    }
+    if escalation_rate is not None and per_chunk["primary_cost"] is not None:
+        cascade_cost = per_chunk["triage_cost"] + escalation_rate * per_chunk["primary_cost"]
+        report.update(
+            cost_usd_per_1k_chunks=round(1000 * cascade_cost, 4),
+            cost_savings=_ratio(per_chunk["primary_cost"] - cascade_cost, per_chunk["primary_cost"]),
+        )
+    if escalation_rate is not None:
+        report["seconds_per_1k_chunks"] = round(
+            1000 * (per_chunk["triage_seconds"] + escalation_rate * per_chunk["primary_seconds"]), 1
+        )
+    if show_missed:
+        report["missed_high_risk"] = [
+            {"chunk_id": cid, "score": scores.get(cid), "quoted_text": quote[:300]}
+            for cid, _, quote in missed_high[:show_missed]
+        ]
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--triage-model", help="default: claude.triage_model")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.1, 0.2, 0.3, 0.5, 0.7])
+    parser.add_argument("--sample", type=int, default=400, help="chunks scored, split across the two strata")
+    parser.add_argument("--batch", type=int, help="chunks per triage call (default: claude.triage_batch)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--any-prompt", action="store_true",
+                        help="also use chunks extracted with an older PROMPT as the baseline")
+    parser.add_argument("--show-missed", type=int, default=5, help="missed HIGH risk quotes per threshold")
+    args = parser.parse_args()
+
+    settings = triage_settings(args.triage_model, batch=args.batch)
+    if not settings:
+        raise SystemExit("eval_cascade: give --triage-model or set claude.triage_model")
+
+    init_issue_tables()
+    positives, negatives, population = load_sample(args.sample, args.seed, args.any_prompt)
+    if not positives:
+        raise SystemExit("eval_cascade: no single-model extraction with issues to compare against")
+    sample = positives + negatives
+    random.Random(args.seed).shuffle(sample)   # mixed triage batches, as in a real file
+
+    run_id = "eval-" + uuid.uuid4().hex[:12]
+    scores = triage_chunks([(cid, content) for cid, content, _ in sample], settings, run_id=run_id)
+    calls, failed, triage_cost, triage_seconds = triage_spend(run_id)
+
+    # primary model: projected from its ledger history on the sampled chunks
+    primary = project(len(sample), sum(len(content) for _, content, _ in sample), get_anthropic_model(), len(PROMPT))
+    per_chunk = {
+        "triage_cost": triage_cost / len(sample),
+        "triage_seconds": triage_seconds / len(sample),
+        "primary_cost": primary["cost_usd"] / len(sample) if primary["cost_usd"] is not None else None,
+        "primary_seconds": primary["seconds"] / len(sample),
+    }
+    issues = load_issues(cid for cid, _, _ in positives)
+
+    report = {
+        "run_id": run_id,
+        "primary_model": get_anthropic_model(),
+        "triage_model": settings["model"],
+        "triage_prompt_version": TRIAGE_PROMPT_VERSION,
+        "triage_batch": settings["batch"],
+        "sample": {"positive": len(positives), "negative": len(negatives), "scored": len(scores)},
+        "population": {"positive": population[True], "negative": population[False]},
+        "triage_calls": calls,
+        "triage_failed_calls": failed,
+        "triage_cost_usd": round(triage_cost, 4),
+        "baseline": {
+            "cost_usd_per_1k_chunks": round(1000 * per_chunk["primary_cost"], 4)
+            if per_chunk["primary_cost"] is not None else None,
+            "seconds_per_1k_chunks": round(1000 * per_chunk["primary_seconds"], 1),
+            "projection_basis": primary["basis"],
+        },
+        "thresholds": [
+            evaluate(t, scores, positives, negatives, population, issues, per_chunk, args.show_missed)
+            for t in sorted(args.thresholds)
+        ],
+    }
+    print(json.dumps(report, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
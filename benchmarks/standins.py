@@ -0,0 +1,280 @@
+"""
+Local stand-ins for the services the pipeline talks to, for benchmarks:
+
+    temp_postgres()   throwaway cluster (initdb + pg_ctl) on a free localhost port
+    fake_anthropic()  Messages API on localhost with a latency model
+    FakeDropbox       in-memory folder of PDFs with the dropbox.Dropbox calls index.py uses
+
+None of them touch the real database, Anthropic account or Dropbox folder.
+"""
+import glob
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# ========== TEMP POSTGRES ==========
+def find_pg_bindir(bindir=None):
+    """
+    Return: directory holding initdb / pg_ctl (PATH, pg_config --bindir, /usr/lib/postgresql/*/bin)
+    """
+    candidates = [bindir] if bindir else []
+    if shutil.which("initdb"):
+        candidates.append(os.path.dirname(shutil.which("initdb")))
+    try:
+        candidates.append(subprocess.run(
+            ["pg_config", "--bindir"], capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    candidates += sorted(glob.glob("/usr/lib/postgresql/*/bin"), reverse=True)
+
+    for d in candidates:
+        if d and os.path.exists(os.path.join(d, "initdb")):
+            return d
+    raise RuntimeError("initdb not found: install the Postgres server or pass --pg-bindir")
+
+@contextmanager
+def temp_postgres(bindir=None, user="bench"):
+    """
+    Throwaway Postgres cluster, trust auth, removed on exit. Refuses to run as root (initdb).
+    Yields: {"DB_HOST", "DB_PORT", "DB_NAME", "DB_USER", "DB_PASSWORD"}
+    """
+    bindir = find_pg_bindir(bindir)
+    datadir = tempfile.mkdtemp(prefix="bench_pg_")
+    port = free_port()
+
+    subprocess.run(
+        [os.path.join(bindir, "initdb"), "-D", datadir, "-U", user, "-A", "trust", "--no-sync"],
+        check=True, capture_output=True,
+    )
+    subprocess.run(
+        [os.path.join(bindir, "pg_ctl"), "-D", datadir, "-l", os.path.join(datadir, "server.log"),
+         "-o", f"-p {port} -k {datadir} -c listen_addresses=127.0.0.1", "-w", "start"],
+        check=True, capture_output=True,
+    )
+    print(f"🐘 Temp Postgres on 127.0.0.1:{port} ({datadir})")
+    try:
+        yield {
+            "DB_HOST": "127.0.0.1",
+            "DB_PORT": str(port),
+            "DB_NAME": "postgres",
+            "DB_USER": user,
+            "DB_PASSWORD": "",
+        }
+    finally:
+        subprocess.run(
+            [os.path.join(bindir, "pg_ctl"), "-D", datadir, "-m", "immediate", "stop"],
+            capture_output=True,
+        )
+        shutil.rmtree(datadir, ignore_errors=True)
+
+# ========== FAKE ANTHROPIC ==========
+_ANSWER_RE = re.compile(r"\bA\.\s+([^\n]+)")
+_EXCERPT_RE = re.compile(r"^\[(\d+)\]$", re.M)
+
+def _fake_issues(transcript, rng, issues_per_chunk):
+    answers = _ANSWER_RE.findall(transcript)
+    rng.shuffle(answers)
+    return [
+        {
+            "issue_type": rng.choice(["failure_to_warn", "causation", "corporate_knowledge", "other"]),
+            "quoted_text": a.strip(),
+            "legal_relevance": "Synthetic relevance for benchmarking.",
+            "risk_level": rng.choice(["high", "medium", "low"]),
+        }
+        for a in answers[:issues_per_chunk]
+    ]
+
+SSE_DELTA_CHARS = 40
+
+class _MessagesHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = body["messages"][0]["content"]
+        if isinstance(prompt, list):
+            prompt = "".join(block.get("text", "") for block in prompt)
+        transcript = prompt.split("Transcript:", 1)[-1]
+        continuation = len(body["messages"]) > 1
+
+        triage = bool(body.get("tools")) and body["tools"][0]["name"] == "record_scores"
+
+        with server.lock:
+            if triage:
+                # triage.py: one random score per numbered excerpt
+                excerpts = _EXCERPT_RE.findall(prompt.split("Excerpts:", 1)[-1])
+                reply = {"scores": {n: round(server.rng.random(), 2) for n in excerpts}}
+            else:
+                reply = {"issues": [] if continuation else _fake_issues(transcript, server.rng, server.issues_per_chunk)}
+            jitter = server.rng.lognormvariate(0, server.jitter) if server.jitter else 1.0
+            server.requests += 1
+            msg_id = f"msg_bench_{server.requests}"
+
+        text = json.dumps(reply)
+        stop_reason = "tool_use" if body.get("tools") else "end_turn"
+        if len(text) // 4 > body.get("max_tokens", 1024):
+            text, stop_reason = text[:body["max_tokens"] * 4], "max_tokens"
+        input_tokens, output_tokens = len(json.dumps(body["messages"])) // 4, len(text) // 4
+
+        # latency model: time to first token + decode time, with lognormal jitter
+        time.sleep((server.latency_ms + server.ms_per_output_token * output_tokens) * jitter / 1000)
+
+        if body.get("tools"):
+            block = {"type": "tool_use", "id": f"toolu_{msg_id}", "name": body["tools"][0]["name"], "input": {}}
+        else:
+            block = {"type": "text", "text": ""}
+        message = {
+            "id": msg_id,
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [block],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 1},
+        }
+
+        if body.get("stream"):
+            self._stream(message, block, text, stop_reason, output_tokens)
+            return
+
+        if block["type"] == "tool_use":
+            block["input"] = json.loads(text) if stop_reason != "max_tokens" else {}
+        else:
+            block["text"] = text
+        message.update(stop_reason=stop_reason, usage={"input_tokens": input_tokens, "output_tokens": output_tokens})
+        payload = json.dumps(message).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, message, block, text, stop_reason, output_tokens):
+        """
+        Server-sent events as the Messages API streams them (whole reply at once, no pacing).
+        """
+        delta_type, field = ("input_json_delta", "partial_json") if block["type"] == "tool_use" else ("text_delta", "text")
+        events = [
+            ("message_start", {"type": "message_start", "message": message}),
+            ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": block}),
+        ] + [
+            ("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                     "delta": {"type": delta_type, field: text[i:i + SSE_DELTA_CHARS]}})
+            for i in range(0, len(text), SSE_DELTA_CHARS)
+        ] + [
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            ("message_delta", {"type": "message_delta", "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                               "usage": {"output_tokens": output_tokens}}),
+            ("message_stop", {"type": "message_stop"}),
+        ]
+        payload = "".join(f"event: {name}\ndata: {json.dumps(data)}\n\n" for name, data in events).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@contextmanager
+def fake_anthropic(latency_ms=800, ms_per_output_token=10, jitter=0.3, issues_per_chunk=1, seed=0):
+    """
+    Messages API stand-in: each reply quotes issues_per_chunk answers ("A. ...") of the chunk
+    after latency_ms + ms_per_output_token * output tokens, times lognormal(0, jitter).
+    Tool calls, streaming and max_tokens truncation are honoured; continuations get no issues,
+    record_scores calls (triage.py) a random score per excerpt.
+    Yields: the server (base_url, requests)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", free_port()), _MessagesHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.rng = random.Random(seed)
+    server.latency_ms = latency_ms
+    server.ms_per_output_token = ms_per_output_token
+    server.jitter = jitter
+    server.issues_per_chunk = issues_per_chunk
+    server.requests = 0
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"🤖 Fake Anthropic API at {server.base_url}")
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+# ========== FAKE DROPBOX ==========
+class FakeDropbox:
+    """
+    The subset of dropbox.Dropbox used by index.load_documents_from_dropbox, over in-memory PDFs.
+    Downloads cost latency_ms + size / mbps.
+    """
+    LIST_PAGE_SIZE = 100
+
+    def __init__(self, files, folder, latency_ms=50, mbps=50):
+        import dropbox
+
+        self.folder = folder.rstrip("/")
+        self.latency_ms = latency_ms
+        self.mbps = mbps
+        self.files = {}
+        self.entries = []
+        for i, (name, data) in enumerate(files):
+            path = f"{self.folder}/{name}"
+            self.files[path.lower()] = data
+            self.entries.append(dropbox.files.FileMetadata(
+                name=name,
+                id=f"id:bench{i:06d}",
+                path_lower=path.lower(),
+                path_display=path,
+                size=len(data),
+            ))
+        self.downloads = 0
+
+    def _page(self, start):
+        end = start + self.LIST_PAGE_SIZE
+        return SimpleNamespace(
+            entries=self.entries[start:end],
+            has_more=end < len(self.entries),
+            cursor=str(end),
+        )
+
+    def files_list_folder(self, path, recursive=False):
+        return self._page(0)
+
+    def files_list_folder_continue(self, cursor):
+        return self._page(int(cursor))
+
+    def files_download(self, path):
+        data = self.files[path.lower()]
+        time.sleep(self.latency_ms / 1000 + len(data) / (self.mbps * 1e6 / 8))
+        self.downloads += 1
+        entry = next(e for e in self.entries if e.path_lower == path.lower())
+        return entry, SimpleNamespace(content=data)
+
+    def sharing_list_shared_links(self, path, direct_only=True):
+        return SimpleNamespace(links=[SimpleNamespace(url=f"https://dropbox.invalid/s{path}")])
+
+    def sharing_create_shared_link_with_settings(self, path):
+        return SimpleNamespace(url=f"https://dropbox.invalid/s{path}")
@@ -0,0 +1,128 @@
+"""
+Synthetic deposition transcripts: line-numbered Q/A pages, some rendered as image-only
+(scanned) pages so extract_pages has to OCR them.
+
+    python -m benchmarks.synthetic --pages 300 --image-fraction 0.1 --out /tmp/depo.pdf
+"""
+import argparse
+import random
+import fitz
+
+LINES_PER_PAGE = 25
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792   # US letter, points
+SCAN_DPI = 150
+
+WITNESSES = ["DR. HALVORSEN", "MR. OKAFOR", "MS. BRANDT", "DR. ICHIKAWA"]
+COUNSEL = ["MR. DELACROIX", "MS. WEATHERBY"]
+
+QUESTIONS = [
+    "When did the company first receive reports of {topic}?",
+    "Did anyone at the company warn users about {topic}?",
+    "What testing was done on {topic} before the product was sold?",
+    "Were you aware of internal memos discussing {topic}?",
+    "Who was responsible for reviewing data on {topic}?",
+    "Is there any study that rules out {topic} as a cause?",
+    "Did the label change after the reports on {topic}?",
+]
+ANSWERS = [
+    "We received the first reports in {year}, as far as I recall.",
+    "No warning was added to the label at that time.",
+    "I don't recall the specific testing protocol.",
+    "Yes, I reviewed the memo in {year} and forwarded it to regulatory.",
+    "The data had gaps; we did not have exposure measurements for every site.",
+    "I am not aware of any study that rules it out.",
+    "Objection, form. You can answer.",
+    "The methodology was never validated outside the company.",
+]
+TOPICS = [
+    "respiratory injury", "skin exposure", "groundwater contamination",
+    "inhalation of the powder", "the 2009 adverse event cluster", "dosage limits",
+]
+
+def transcript_lines(rng, n_lines):
+    """
+    Return: n_lines of Q/A text with speaker turns and objections.
+    """
+    lines = []
+    while len(lines) < n_lines:
+        topic, year = rng.choice(TOPICS), rng.randint(1998, 2016)
+        if rng.random() < 0.1:
+            lines.append(f"{rng.choice(COUNSEL)}: Objection to the form of the question.")
+        lines.append("Q. " + rng.choice(QUESTIONS).format(topic=topic))
+        lines.append("A. " + rng.choice(ANSWERS).format(year=year))
+    return lines[:n_lines]
+
+def _page_text(rng, page_num, lines_per_page):
+    header = f"Page {page_num}"
+    body = [f"{i:>2}  {line}" for i, line in enumerate(transcript_lines(rng, lines_per_page), start=1)]
+    return header, body
+
+def _draw(page, header, body):
+    page.insert_text((PAGE_WIDTH - 90, 40), header, fontsize=10)
+    y = 72
+    for line in body:
+        page.insert_text((54, y), line, fontsize=10)
+        y += 26
+
+def make_deposition_pdf(pages=100, image_fraction=0.1, lines_per_page=LINES_PER_PAGE, seed=0):
+    """
+    image_fraction: share of pages with no text layer (rendered to an image, like a scan)
+    Return: PDF bytes
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+
+    witness = rng.choice(WITNESSES)
+    cover = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    _draw(cover, "Page 1", [
+        "UNITED STATES DISTRICT COURT",
+        "IN RE: SYNTHETIC PRODUCTS LIABILITY LITIGATION",
+        f"VIDEOTAPED DEPOSITION OF {witness}",
+        "",
+        f"{rng.choice(COUNSEL)}: Please state your name for the record.",
+    ])
+
+    for page_num in range(2, pages + 1):
+        header, body = _page_text(rng, page_num, lines_per_page)
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+
+        if rng.random() < image_fraction:
+            # render the text on a scratch page, keep only its pixels
+            scratch = fitz.open()
+            sp = scratch.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            _draw(sp, header, body)
+            pix = sp.get_pixmap(dpi=SCAN_DPI)
+            page.insert_image(page.rect, stream=pix.tobytes("png"))
+            scratch.close()
+        else:
+            _draw(page, header, body)
+
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return data
+
+def make_corpus(files=4, pages=100, image_fraction=0.1, seed=0):
+    """
+    Return: list of (filename, pdf_bytes)
+    """
+    return [
+        (f"synthetic_depo_{i:03d}.pdf", make_deposition_pdf(pages, image_fraction, seed=seed + i))
+        for i in range(files)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--image-fraction", type=float, default=0.1)
+    parser.add_argument("--lines-per-page", type=int, default=LINES_PER_PAGE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    data = make_deposition_pdf(args.pages, args.image_fraction, args.lines_per_page, args.seed)
+    with open(args.out, "wb") as f:
+        f.write(data)
+    print(f"✅ Wrote {args.pages} pages ({len(data) / 1e6:.1f} MB) to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe LRU mapping shared by every session of the app process.
+    maxsize: maximum number of entries kept (None = unbounded)
+    maxbytes: optional size budget, entries are measured with sizeof(value)
+    on_evict: optional callback(key, value) for entries pushed out by the bounds
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None, sizeof=None, on_evict=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._sizes.pop(key)
+            size = self.sizeof(value)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._sizes[key] = size
+            self._bytes += size
+
+            while self._data and (
+                (self.maxsize is not None and len(self._data) > self.maxsize)
+                or (self.maxbytes is not None and self._bytes > self.maxbytes)
+            ):
+                old_key, old_value = self._data.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+                evicted.append((old_key, old_value))
+
+        # callbacks may do I/O: run them outside the lock
+        if self.on_evict:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._bytes -= self._sizes.pop(key)
+            return self._data.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,571 @@
+"""
+deposition-extractor: the ingest / extraction pipeline without the Streamlit UI.
+
+    python cli.py ingest ./production_12 --workers 4
+    python cli.py ingest --dropbox "/Apps/Document Brain/Agent/Production 12"
+    python cli.py extract --all --workers 2 --batch-size 200
+    python cli.py extract --all --triage-model claude-haiku-4-5 --triage-threshold 0.3
+    python cli.py reindex --backend pgvector
+    python cli.py export --format zip --risk high --out evidence.zip
+    python cli.py reextract start --all --budget-usd 25 --batch-size 2000
+    python cli.py reextract diff RUN_ID
+    python cli.py verify --all
+    python cli.py dedup --all
+    python cli.py usage --by model
+
+stdout carries one JSON object per line (start, progress, file_done, file_failed,
+dry_run, run, diff_issue, diff_file, usage, summary); logs go to stderr. Exit code 1 if any file failed.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import redirect_stdout
+import telemetry
+
+PROG = "deposition-extractor"
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+PROGRESS_EVENT_INTERVAL = 1.0   # seconds between progress events of one file / stage
+EXPORT_PAGE_SIZE = 500
+
+# ========== JSON EVENTS ==========
+_out = sys.stdout          # kept for events; print() output is sent to stderr
+_out_lock = threading.Lock()
+_worker_events = None      # multiprocessing queue inside ingest worker processes
+
+def emit(event, **fields):
+    record = {"ts": round(time.time(), 3), "event": event, **fields}
+    if _worker_events is not None:
+        _worker_events.put(record)
+        return
+    with _out_lock:
+        _out.write(json.dumps(record, default=str) + "\n")
+        _out.flush()
+
+def json_progress(command, **context):
+    """
+    Pipeline progress callback fn(stage, **counters) that emits throttled "progress" events.
+    """
+    state = {"stage": None, "emitted_at": 0.0}
+
+    def progress(stage, **counters):
+        now = time.monotonic()
+        if stage == state["stage"] and now - state["emitted_at"] < PROGRESS_EVENT_INTERVAL:
+            return
+        state["stage"] = stage
+        state["emitted_at"] = now
+        emit("progress", command=command, stage=stage, **context, **counters)
+
+    return progress
+
+def _summary(command, started, results, **extra):
+    failed = [r for r in results if r.get("error")]
+    emit(
+        "summary",
+        command=command,
+        ok=len(results) - len(failed),
+        failed=len(failed),
+        seconds=round(time.monotonic() - started, 1),
+        **extra
+    )
+    return 1 if failed else 0
+
+# ========== INGEST ==========
+def _collect_local(paths):
+    """
+    Return: list of (filename, ("path", path)) for every PDF under the given files / directories.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf"):
+                        found.append((name, ("path", os.path.join(root, name))))
+        elif path.lower().endswith(".pdf"):
+            found.append((os.path.basename(path), ("path", path)))
+        else:
+            print(f"⚠️ Skipping {path}: not a PDF or directory")
+    return found
+
+def _collect_dropbox(folder):
+    from indexing import get_dropbox_client
+    import dropbox
+
+    dbx = get_dropbox_client()
+    response = dbx.files_list_folder(folder, recursive=True)
+    found = []
+    while True:
+        for entry in response.entries:
+            if isinstance(entry, dropbox.files.FileMetadata) and entry.name.lower().endswith(".pdf"):
+                found.append((entry.name, ("dropbox", entry.path_lower)))
+        if not response.has_more:
+            break
+        response = dbx.files_list_folder_continue(response.cursor)
+    return found
+
+def _init_ingest_worker(events):
+    global _worker_events
+    _worker_events = events
+    sys.stdout = sys.stderr
+
+def _ingest_one(filename, source, batch_size):
+    from indexing import ingest_pdf, get_dropbox_client, INSERT_BATCH_SIZE
+
+    started = time.monotonic()
+    kind, ref = source
+    if kind == "dropbox":
+        _, res = get_dropbox_client().files_download(ref)
+        pdf_bytes = res.content
+    else:
+        with open(ref, "rb") as f:
+            pdf_bytes = f.read()
+
+    chunks = ingest_pdf(
+        pdf_bytes,
+        filename,
+        progress=json_progress("ingest", file=filename),
+        batch_size=batch_size or INSERT_BATCH_SIZE,
+    )
+    return {"file": filename, "chunks": chunks, "seconds": round(time.monotonic() - started, 1)}
+
+def cmd_ingest(args):
+    started = time.monotonic()
+    files = _collect_dropbox(args.dropbox) if args.dropbox else _collect_local(args.paths)
+
+    # same filename -> same chunk ids: ingest the first one only
+    unique, seen = [], set()
+    for filename, source in files:
+        if filename in seen:
+            emit("file_skipped", command="ingest", file=filename, reason="duplicate filename", source=source[1])
+            continue
+        seen.add(filename)
+        unique.append((filename, source))
+
+    emit("start", command="ingest", files=len(unique), workers=args.workers, dry_run=args.dry_run)
+
+    if args.dry_run:
+        from db_utils import get_indexed_filenames
+        indexed = set(get_indexed_filenames())
+        for filename, source in unique:
+            emit("dry_run", command="ingest", file=filename, source=source[1], already_indexed=filename in indexed)
+        return _summary("ingest", started, [], planned=len(unique))
+
+    # spawn: clean workers without the parent's pool / tunnel threads
+    ctx = multiprocessing.get_context("spawn")
+    events = ctx.Queue()
+
+    def drain():
+        while True:
+            record = events.get()
+            if record is None:
+                return
+            emit(record.pop("event"), **{k: v for k, v in record.items() if k != "ts"})
+
+    drainer = threading.Thread(target=drain, daemon=True)
+    drainer.start()
+
+    results = []
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max(1, args.workers),
+            mp_context=ctx,
+            initializer=_init_ingest_worker,
+            initargs=(events,),
+        ) as pool:
+            futures = {
+                pool.submit(_ingest_one, filename, source, args.batch_size): filename
+                for filename, source in unique
+            }
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"file": filename, "error": str(e)}
+                    emit("file_failed", command="ingest", **result)
+                else:
+                    emit("file_done", command="ingest", **result)
+                results.append(result)
+    finally:
+        events.put(None)
+        drainer.join()
+
+    return _summary("ingest", started, results, chunks=sum(r.get("chunks", 0) for r in results))
+
+# ========== EXTRACT ==========
+def cmd_extract(args):
+    from issue_extractor import get_extraction_backlog, run_issue_extraction
+    from triage import triage_settings
+
+    if not args.files and not args.all:
+        raise SystemExit(f"{PROG} extract: give FILE ... or --all")
+
+    triage = False if args.no_triage else triage_settings(args.triage_model, args.triage_threshold)
+
+    started = time.monotonic()
+    backlog = get_extraction_backlog(args.files or None)
+    emit("start", command="extract", files=len(backlog), workers=args.workers, dry_run=args.dry_run,
+         triage_model=triage["model"] if triage else None,
+         triage_threshold=triage["threshold"] if triage else None)
+
+    if args.dry_run:
+        for filename, pending in backlog:
+            emit("dry_run", command="extract", file=filename, pending_chunks=pending,
+                 chunks_this_run=min(pending, args.batch_size) if args.batch_size else pending)
+        return _summary("extract", started, [], planned=len(backlog))
+
+    def extract_one(filename):
+        t0 = time.monotonic()
+        issues = run_issue_extraction(
+            filename,
+            progress=json_progress("extract", file=filename),
+            limit=args.batch_size,
+            triage=triage,
+        )
+        return {"file": filename, "issues": issues, "seconds": round(time.monotonic() - t0, 1)}
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(extract_one, filename): filename for filename, _ in backlog}
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"file": filename, "error": str(e)}
+                emit("file_failed", command="extract", **result)
+            else:
+                emit("file_done", command="extract", **result)
+            results.append(result)
+
+    return _summary("extract", started, results, issues=sum(r.get("issues") or 0 for r in results))
+
+# ========== REINDEX ==========
+def cmd_reindex(args):
+    from index import build_faiss_index
+    from vector_store import get_vector_store
+
+    started = time.monotonic()
+    store = get_vector_store(args.backend)
+    emit("start", command="reindex", backend=store.name, dry_run=args.dry_run)
+
+    if args.workers:
+        import torch
+        torch.set_num_threads(args.workers)
+
+    try:
+        chunks = build_faiss_index(
+            store,
+            batch_size=args.batch_size,
+            dry_run=args.dry_run,
+            progress=json_progress("reindex", backend=store.name),
+        )
+    except Exception as e:
+        emit("file_failed", command="reindex", error=str(e))
+        return _summary("reindex", started, [{"error": str(e)}])
+
+    key = "planned_chunks" if args.dry_run else "chunks"
+    return _summary("reindex", started, [], backend=store.name, **{key: chunks})
+
+# ========== EXPORT ==========
+def _iter_issues(filename, args):
+    from db_utils import ISSUE_COLUMNS, query_issues
+
+    after = None
+    while True:
+        rows, after = query_issues(
+            filename, args.risk, args.issue_type, None,
+            sort=args.sort,
+            limit=args.batch_size or EXPORT_PAGE_SIZE,
+            after=after,
+        )
+        for row in rows:
+            yield dict(zip(ISSUE_COLUMNS, row))
+        if after is None:
+            return
+
+def cmd_export(args):
+    from db_utils import ISSUE_COLUMNS, get_issue_facets, get_issue_filenames
+
+    started = time.monotonic()
+    filenames = args.files or get_issue_filenames()
+    emit("start", command="export", files=len(filenames), format=args.format, out=args.out, dry_run=args.dry_run)
+
+    if args.dry_run:
+        total = 0
+        for filename in filenames:
+            matching = get_issue_facets(filename, args.risk, args.issue_type)["matching"]
+            total += matching
+            emit("dry_run", command="export", file=filename, issues=matching)
+        return _summary("export", started, [], planned_issues=total)
+
+    tmp = args.out + ".tmp"
+    results, issues = [], []
+    try:
+        with open(tmp, "w" if args.format in ("csv", "jsonl") else "wb") as f:
+            writer = None
+            if args.format == "csv":
+                writer = csv.DictWriter(f, fieldnames=ISSUE_COLUMNS)
+                writer.writeheader()
+
+            for filename in filenames:
+                try:
+                    count = 0
+                    for issue in _iter_issues(filename, args):
+                        if args.format == "csv":
+                            writer.writerow(issue)
+                        elif args.format == "jsonl":
+                            f.write(json.dumps(issue, default=str) + "\n")
+                        else:
+                            issues.append(issue)
+                        count += 1
+                except Exception as e:
+                    result = {"file": filename, "error": str(e)}
+                    emit("file_failed", command="export", **result)
+                else:
+                    result = {"file": filename, "issues": count}
+                    emit("file_done", command="export", **result)
+                results.append(result)
+
+            if args.format in ("pdf", "zip"):
+                from evidence_bundle import build_evidence_bundle
+                f.write(build_evidence_bundle(issues, fmt=args.format, title=args.title))
+
+        os.replace(tmp, args.out)
+    finally:
+        # failed export: no half-written .tmp next to the output
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return _summary("export", started, results, out=args.out, issues=sum(r.get("issues", 0) for r in results))
+
+# ========== RE-EXTRACTION ==========
+REEXTRACT_ACTIONS = ["start", "resume", "diff", "promote", "discard", "list"]
+
+def cmd_reextract(args):
+    import reextraction
+
+    started = time.monotonic()
+    emit("start", command="reextract", action=args.action, targets=args.targets, dry_run=args.dry_run)
+
+    if args.action == "list":
+        runs = reextraction.list_runs()
+        for run in runs:
+            emit("run", command="reextract", **run)
+        return _summary("reextract", started, [], runs=len(runs))
+
+    if args.action == "start":
+        if not args.targets and not args.all:
+            raise SystemExit(f"{PROG} reextract start: give FILE ... or --all")
+        if args.dry_run:
+            stale = reextraction.stale_summary(args.targets or None)
+            for filename, chunks in stale["files"]:
+                emit("dry_run", command="reextract", file=filename, stale_chunks=chunks)
+            return _summary("reextract", started, [], **{f"projected_{k}": v for k, v in stale["projection"].items()})
+        run = reextraction.start_run(
+            args.targets or None,
+            priority=args.priority,
+            max_chunks=args.batch_size,
+            budget_usd=args.budget_usd,
+            progress=json_progress("reextract"),
+        )
+    else:
+        if len(args.targets) != 1:
+            raise SystemExit(f"{PROG} reextract {args.action}: give one RUN_ID")
+        run_id = args.targets[0]
+
+        if args.action == "diff":
+            diff = reextraction.diff_run(run_id)
+            for kind in ("added", "removed", "risk_changed"):
+                for issue in diff[kind]:
+                    emit("diff_issue", command="reextract", change=kind, **issue)
+            for filename, counts in diff["files"].items():
+                emit("diff_file", command="reextract", file=filename, **counts)
+            return _summary("reextract", started, [], run_id=run_id, chunks=diff["chunks"],
+                            unchanged_chunks=diff["unchanged_chunks"], added=len(diff["added"]),
+                            removed=len(diff["removed"]), risk_changed=len(diff["risk_changed"]))
+        if args.action == "promote":
+            chunks = reextraction.promote_run(run_id, force=args.force)
+            return _summary("reextract", started, [], run_id=run_id, promoted_chunks=chunks)
+        if args.action == "discard":
+            reextraction.discard_run(run_id)
+            return _summary("reextract", started, [], run_id=run_id, discarded=True)
+
+        run = reextraction.resume_run(run_id, max_chunks=args.batch_size, budget_usd=args.budget_usd,
+                                      progress=json_progress("reextract", run_id=run_id))
+
+    emit("run", command="reextract", **run)
+    if args.promote and run["status"] == "completed":
+        run["promoted_chunks"] = reextraction.promote_run(run["run_id"])
+    return _summary(
+        "reextract", started, [{"error": "chunks failed"}] if run["chunks_failed"] else [],
+        run_id=run["run_id"], status=run["status"], chunks=run["chunks_done"],
+        spent_usd=round(run["spent_usd"] or 0, 4), promoted_chunks=run.get("promoted_chunks", 0),
+    )
+
+# ========== DEDUP ==========
+def cmd_dedup(args):
+    from db_utils import get_issue_filenames
+    from issue_dedup import dedup_file
+    from issue_extractor import init_issue_tables
+
+    if not args.files and not args.all:
+        raise SystemExit(f"{PROG} dedup: give FILE ... or --all")
+
+    started = time.monotonic()
+    init_issue_tables()
+    filenames = args.files or get_issue_filenames()
+    emit("start", command="dedup", files=len(filenames))
+
+    results = []
+    for filename in filenames:
+        try:
+            result = dedup_file(filename)
+        except Exception as e:
+            result = {"file": filename, "error": str(e)}
+            emit("file_failed", command="dedup", **result)
+        else:
+            emit("file_done", command="dedup", **result)
+        results.append(result)
+
+    return _summary("dedup", started, results, duplicates=sum(r.get("duplicates", 0) for r in results))
+
+# ========== VERIFY ==========
+def cmd_verify(args):
+    from db_utils import get_issue_filenames
+    from issue_extractor import init_issue_tables
+    from quote_verify import QUOTE_STATUSES, verify_file
+
+    if not args.files and not args.all:
+        raise SystemExit(f"{PROG} verify: give FILE ... or --all")
+
+    started = time.monotonic()
+    init_issue_tables()
+    filenames = args.files or get_issue_filenames()
+    emit("start", command="verify", files=len(filenames), force=args.force)
+
+    results = []
+    for filename in filenames:
+        try:
+            result = verify_file(filename, force=args.force)
+        except Exception as e:
+            result = {"file": filename, "error": str(e)}
+            emit("file_failed", command="verify", **result)
+        else:
+            emit("file_done", command="verify", **result)
+        results.append(result)
+
+    return _summary("verify", started, results, quotes=sum(r.get("quotes", 0) for r in results),
+                    **{status: sum(r.get(status, 0) for r in results) for status in QUOTE_STATUSES})
+
+# ========== USAGE ==========
+def cmd_usage(args):
+    from extraction_ledger import get_usage
+    from issue_extractor import init_issue_tables
+
+    started = time.monotonic()
+    init_issue_tables()  # creates the ledger views
+    rows = get_usage(f"extraction_usage_by_{args.by}")
+    for row in rows:
+        emit("usage", command="usage", by=args.by, **row)
+    return _summary("usage", started, [], rows=len(rows),
+                    cost_usd=round(sum(r["cost_usd"] or 0 for r in rows), 4))
+
+# ========== ARGUMENTS ==========
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="ingest: processes, extract: concurrent files, reindex: torch threads")
+    common.add_argument("--batch-size", type=int, default=None,
+                        help="ingest: rows per INSERT, extract: max chunks per file this run, "
+                             "reindex: chunks per encode call, export: rows per keyset page, "
+                             "reextract: max chunks of the run")
+    common.add_argument("--dry-run", action="store_true", help="report what would be done, write nothing")
+    common.add_argument("--metrics-out", metavar="PATH",
+                        help="write Prometheus metrics here on exit (node_exporter textfile collector)")
+
+    parser = argparse.ArgumentParser(
+        prog=PROG,
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("ingest", parents=[common], help="parse, chunk and store PDFs")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("paths", nargs="*", default=[], help="PDF files or directories")
+    src.add_argument("--dropbox", metavar="FOLDER", help="Dropbox folder to ingest instead of local paths")
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser("extract", parents=[common], help="extract issues from stored chunks")
+    p.add_argument("files", nargs="*", help="filenames as stored in chunks.filename")
+    p.add_argument("--all", action="store_true", help="every file with pending chunks")
+    p.add_argument("--triage-model", help="cascade: cheap model that screens chunks (default: claude.triage_model)")
+    p.add_argument("--triage-threshold", type=float, help="cascade: escalate chunks scoring >= this")
+    p.add_argument("--no-triage", action="store_true", help="every chunk to the primary model")
+    p.set_defaults(func=cmd_extract)
+
+    p = sub.add_parser("reindex", parents=[common], help="embed new Dropbox chunks into the vector store")
+    p.add_argument("--backend", choices=["faiss", "pgvector"], default=None,
+                   help="default: vector.backend from the settings")
+    p.set_defaults(func=cmd_reindex)
+
+    p = sub.add_parser("export", parents=[common], help="export extracted issues")
+    p.add_argument("--format", choices=["csv", "jsonl", "pdf", "zip"], default="csv")
+    p.add_argument("--out", required=True)
+    p.add_argument("--file", dest="files", action="append", help="repeatable, default: every file")
+    p.add_argument("--risk", action="append", type=str.lower, help="repeatable risk_level filter (high, medium, low)")
+    p.add_argument("--issue-type", action="append", help="repeatable issue_type filter")
+    p.add_argument("--sort", choices=["page", "risk"], default="page")
+    p.add_argument("--title", default="Evidence bundle")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("reextract", parents=[common],
+                       help="re-run chunks extracted with an older PROMPT / model, staged for diff")
+    p.add_argument("action", choices=REEXTRACT_ACTIONS,
+                   help="start FILE...|--all, resume RUN, diff RUN, promote RUN, discard RUN, list")
+    p.add_argument("targets", nargs="*", help="filenames (start) or a run id")
+    p.add_argument("--all", action="store_true", help="start: every file with out-of-date chunks")
+    p.add_argument("--priority", choices=["risk", "page", "oldest"], default="risk")
+    p.add_argument("--budget-usd", type=float, help="stop before the run's spend crosses this")
+    p.add_argument("--promote", action="store_true", help="start / resume: promote when the run completes")
+    p.add_argument("--force", action="store_true", help="promote: also a run stopped by its budget")
+    p.set_defaults(func=cmd_reextract)
+
+    p = sub.add_parser("dedup", help="merge duplicate quotes of overlapping chunks (runs after extract too)")
+    p.add_argument("files", nargs="*", help="filenames as stored in deposition_issues.filename")
+    p.add_argument("--all", action="store_true", help="every file with issues")
+    p.set_defaults(func=cmd_dedup, metrics_out=None)
+
+    p = sub.add_parser("verify", help="check quotes against the transcript (runs after extract too)")
+    p.add_argument("files", nargs="*", help="filenames as stored in deposition_issues.filename")
+    p.add_argument("--all", action="store_true", help="every file with issues")
+    p.add_argument("--force", action="store_true", help="re-check quotes already verified")
+    p.set_defaults(func=cmd_verify, metrics_out=None)
+
+    p = sub.add_parser("usage", help="LLM cost / latency from the extraction_calls ledger")
+    p.add_argument("--by", choices=["file", "model", "prompt", "stage"], default="file")
+    p.set_defaults(func=cmd_usage, metrics_out=None)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    with redirect_stdout(sys.stderr):
+        try:
+            return args.func(args)
+        except KeyboardInterrupt:
+            emit("interrupted", command=args.command)
+            return 130
+        finally:
+            telemetry.flush()
+            if args.metrics_out:
+                telemetry.write_metrics(args.metrics_out)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Settings for the app and headless workers, read on first use.
+
+Lookup order for get_config("database", "DB_HOST"):
+    1. env var DEPO_DATABASE_DB_HOST
+    2. TOML file: $DEPO_SECRETS_FILE, else .streamlit/secrets.toml, else ~/.streamlit/secrets.toml
+    3. st.secrets, only when streamlit is already imported (the app), never imported from here
+"""
+import os
+import sys
+import threading
+
+ENV_PREFIX = "DEPO_"
+SECRETS_FILE_ENV = "DEPO_SECRETS_FILE"
+DEFAULT_SECRETS_FILES = [
+    os.path.join(".streamlit", "secrets.toml"),
+    os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+]
+
+_MISSING = object()
+_toml = None
+_toml_lock = threading.Lock()
+
+def _load_toml(path):
+    try:
+        import tomllib  # Python 3.11+
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    except ImportError:
+        import toml
+        return toml.load(path)
+
+def _toml_secrets():
+    global _toml
+
+    with _toml_lock:
+        if _toml is None:
+            paths = (
+                [os.environ[SECRETS_FILE_ENV]]
+                if os.environ.get(SECRETS_FILE_ENV)
+                else DEFAULT_SECRETS_FILES
+            )
+            _toml = next((_load_toml(p) for p in paths if os.path.exists(p)), {})
+        return _toml
+
+def _streamlit_section(section):
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return None
+    try:
+        return st.secrets.get(section)
+    except Exception:  # no secrets configured for this app
+        return None
+
+def env_name(section, key):
+    return f"{ENV_PREFIX}{section}_{key}".upper()
+
+def get_config(section, key, default=_MISSING, cast=None):
+    """
+    One setting. Values from env vars are strings: pass cast (e.g. int) for numbers.
+    Raises KeyError naming every place it looked if the setting is required and missing.
+    """
+    value = os.environ.get(env_name(section, key), _MISSING)
+
+    if value is _MISSING:
+        value = _toml_secrets().get(section, {}).get(key, _MISSING)
+
+    if value is _MISSING:
+        st_section = _streamlit_section(section)
+        if st_section is not None and key in st_section:
+            value = st_section[key]
+
+    if value is _MISSING:
+        if default is _MISSING:
+            raise KeyError(
+                f"Missing setting {section}.{key}: set {env_name(section, key)}, "
+                f"add it to secrets.toml or to st.secrets"
+            )
+        return default
+
+    return cast(value) if cast and value is not None else value
+
+def reset_config():
+    """
+    Forget the parsed TOML file (tests / after editing secrets).
+    """
+    global _toml
+
+    with _toml_lock:
+        _toml = None
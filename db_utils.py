@@ -1,52 +1,125 @@
 import psycopg
-from sshtunnel import SSHTunnelForwarder
+from psycopg_pool import ConnectionPool
+from contextlib import contextmanager
 import os
 import tempfile
-import streamlit as st
-
-SSH_HOST = st.secrets["ssh"]["SSH_HOST"]
-SSH_PORT = st.secrets["ssh"]["SSH_PORT"]
-SSH_USER = st.secrets["ssh"]["SSH_USER"]
-SSH_PRIVATE_KEY = st.secrets["ssh"]["SSH_PRIVATE_KEY"]
-# SSH_KEY = os.path.join(
-#     os.environ["USERPROFILE"],
-#     ".ssh",
-#     st.secrets["ssh"]["SSH_KEY_PATH"]
-# )
-DB_NAME = st.secrets["database"]["DB_NAME"]
-DB_USER = st.secrets["database"]["DB_USER"]
-DB_PORT = st.secrets["database"]["DB_PORT"]
-DB_HOST = st.secrets["database"]["DB_HOST"]
-DB_PASSWORD = st.secrets["database"]["DB_PASSWORD"]
+import threading
+import time
+from cache_utils import LRUCache
+from config import get_config
+from telemetry import inc, observe, span
+
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 8
+VERSION_CHECK_INTERVAL = 2.0   # seconds a data version is trusted before re-reading it
+
+# ========== SHARED TUNNEL + CONNECTION POOL ==========
+# One SSH tunnel and one pool per process, shared by every Streamlit session.
+# Without ssh.SSH_HOST (local / benchmark databases) the pool connects directly.
+_tunnel = None
+_pool = None
+_pool_lock = threading.Lock()
+
+class TracedCursor(psycopg.Cursor):
+    """
+    Cursor of every pooled connection: one span per statement ("db.select", "db.insert", ...).
+    """
+    def execute(self, query, params=None, **kwargs):
+        name, statement = _statement_span(query)
+        with span(name, statement=statement):
+            return super().execute(query, params, **kwargs)
+
+    def executemany(self, query, params_seq, **kwargs):
+        name, statement = _statement_span(query)
+        with span(name, statement=statement):
+            return super().executemany(query, params_seq, **kwargs)
+
+def _statement_span(query):
+    statement = " ".join(str(query).split())
+    verb = statement.split(" ", 1)[0].lower() or "query"
+    return f"db.{verb}", statement[:200]
+
+def _use_tunnel():
+    return bool(get_config("ssh", "SSH_HOST", None))
+
+def _start_tunnel():
+    from sshtunnel import SSHTunnelForwarder  # paramiko: only when a tunnel is opened
 
-def get_indexed_filenames():
     # --- write SSH key to temp file ---
     with tempfile.NamedTemporaryFile(delete=False) as key_file:
-        key_file.write(SSH_PRIVATE_KEY.encode())
+        key_file.write(get_config("ssh", "SSH_PRIVATE_KEY").encode())
         ssh_key_path = key_file.name
 
     # --- SSH Tunnel ---
     tunnel = SSHTunnelForwarder(
-        (SSH_HOST, SSH_PORT),
-        ssh_username=SSH_USER,
+        (get_config("ssh", "SSH_HOST"), get_config("ssh", "SSH_PORT", cast=int)),
+        ssh_username=get_config("ssh", "SSH_USER"),
         ssh_pkey=ssh_key_path,
         allow_agent=False,
         host_pkey_directories=[],
-        remote_bind_address=(DB_HOST, DB_PORT),
+        remote_bind_address=(
+            get_config("database", "DB_HOST"),
+            get_config("database", "DB_PORT", cast=int),
+        ),
     )
-    
-    tunnel.start()
+    with span("db.tunnel_start"):
+        tunnel.start()
+    return tunnel
 
-    try:
-        conn = psycopg.connect(
-            host=DB_HOST,
-            port=tunnel.local_bind_port,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            connect_timeout=5,
-        )
+def get_pool():
+    """
+    Return the process-wide connection pool, (re)starting the tunnel if it dropped.
+    """
+    global _tunnel, _pool
+
+    with _pool_lock:
+        tunnel_down = _tunnel is not None and not _tunnel.is_active
+        if _pool is None or tunnel_down:
+            if _pool is not None:
+                _pool.close()
+            if _tunnel is not None:
+                _tunnel.stop()
+                _tunnel = None
+            if tunnel_down:
+                inc("db_tunnel_restarts_total")
+
+            if _use_tunnel():
+                _tunnel = _start_tunnel()
+                port = _tunnel.local_bind_port
+            else:
+                port = get_config("database", "DB_PORT", cast=int)
 
+            with span("db.pool_open", tunnel=_tunnel is not None):
+                _pool = ConnectionPool(
+                    min_size=POOL_MIN_SIZE,
+                    max_size=POOL_MAX_SIZE,
+                    kwargs={
+                        "host": get_config("database", "DB_HOST"),
+                        "port": port,
+                        "dbname": get_config("database", "DB_NAME"),
+                        "user": get_config("database", "DB_USER"),
+                        "password": get_config("database", "DB_PASSWORD"),
+                        "connect_timeout": 5,
+                        "cursor_factory": TracedCursor,
+                    },
+                    open=True,
+                )
+        return _pool
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a connection from the shared pool.
+    Commits on success, rolls back on error.
+    """
+    pool = get_pool()
+    requested = time.perf_counter()
+    with pool.connection() as conn:
+        observe("db_connection_wait_seconds", time.perf_counter() - requested)
+        yield conn
+
+def get_indexed_filenames():
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT DISTINCT filename
@@ -55,11 +128,17 @@ def get_indexed_filenames():
             """)
             rows = cur.fetchall()
 
-        conn.close()
-        return [r[0] for r in rows]
+    return [r[0] for r in rows]
+
+def get_issue_filenames():
+    with pooled_connection() as conn:
+        rows = conn.execute("""
+            SELECT DISTINCT filename
+            FROM deposition_issues
+            ORDER BY filename ASC
+        """).fetchall()
 
-    finally:
-        tunnel.stop()
+    return [r[0] for r in rows]
 
 def get_file_stats():
     """
@@ -69,33 +148,7 @@ def get_file_stats():
         "file2.pdf": {"pages": 8, "chunks": 97}
     }
     """
-    # --- write SSH key to temp file ---
-    with tempfile.NamedTemporaryFile(delete=False) as key_file:
-        key_file.write(SSH_PRIVATE_KEY.encode())
-        ssh_key_path = key_file.name
-
-    # --- SSH Tunnel ---
-    tunnel = SSHTunnelForwarder(
-        (SSH_HOST, SSH_PORT),
-        ssh_username=SSH_USER,
-        ssh_pkey=ssh_key_path,
-        allow_agent=False,
-        host_pkey_directories=[],
-        remote_bind_address=(DB_HOST, DB_PORT),
-    )
-    
-    tunnel.start()
-
-    try:
-        conn = psycopg.connect(
-            host=DB_HOST,
-            port=tunnel.local_bind_port,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            connect_timeout=5,
-        )
-        
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT
@@ -110,20 +163,16 @@ def get_file_stats():
             """)
 
             rows = cur.fetchall()
-            conn.close()
-
-            stats = {}
-            for filename, pages, chunks in rows:
-                stats[filename] = {
-                    "pages": pages,
-                    "chunks": chunks
-                }
-
-        return stats
-    
-    finally:
-        tunnel.stop()
-        
+
+    stats = {}
+    for filename, pages, chunks in rows:
+        stats[filename] = {
+            "pages": pages,
+            "chunks": chunks
+        }
+
+    return stats
+
 def get_extracted_issues(filenames: list[str]):
     """
     Return list of issues for selected files
@@ -131,33 +180,7 @@ def get_extracted_issues(filenames: list[str]):
     if not filenames:
         return []
 
-    # --- write SSH key to temp file ---
-    with tempfile.NamedTemporaryFile(delete=False) as key_file:
-        key_file.write(SSH_PRIVATE_KEY.encode())
-        ssh_key_path = key_file.name
-
-    # --- SSH Tunnel ---
-    tunnel = SSHTunnelForwarder(
-        (SSH_HOST, SSH_PORT),
-        ssh_username=SSH_USER,
-        ssh_pkey=ssh_key_path,
-        allow_agent=False,
-        host_pkey_directories=[],
-        remote_bind_address=(DB_HOST, DB_PORT),
-    )
-    
-    tunnel.start()
-
-    try:
-        conn = psycopg.connect(
-            host=DB_HOST,
-            port=tunnel.local_bind_port,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            connect_timeout=5,
-        )
-
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT
@@ -173,14 +196,338 @@ def get_extracted_issues(filenames: list[str]):
                     pdf_link
                 FROM deposition_issues
                 WHERE filename = ANY(%s)
+                AND duplicate_of IS NULL
                 ORDER BY filename, page
             """, (filenames,))
 
+            return cur.fetchall()
+
+# ========== ISSUE QUERIES (filters / sort / keyset pages in SQL) ==========
+# Row shape returned by query_issues, in this order.
+ISSUE_COLUMNS = [
+    "issue_id",
+    "chunk_id",
+    "filename",
+    "page",
+    "speaker",
+    "risk",
+    "legal_relevance",
+    "quoted_text",
+    "issue_type",
+    "pdf_link",
+    "source_pages",   # pages of every merged duplicate (issue_dedup.py), None if unique
+    "quote_status",   # exact | normalized | fuzzy | unmatched (quote_verify.py), None if unchecked
+    "quote_score",
+]
+
+RISK_RANK_SQL = (
+    "(CASE upper(risk_level) WHEN 'HIGH' THEN 0 WHEN 'MEDIUM' THEN 1 "
+    "WHEN 'LOW' THEN 2 ELSE 3 END)"
+)
+
+# sort name -> keyset columns (issue_id last as the tie-breaker)
+ISSUE_SORTS = {
+    "risk": [RISK_RANK_SQL, "page", "issue_id"],
+    "page": ["page", RISK_RANK_SQL, "issue_id"],
+}
+
+ISSUE_INDEXES_DDL = [
+    # equality filters on file + risk + type, then page
+    """
+    CREATE INDEX IF NOT EXISTS idx_issues_file_risk_type_page
+    ON deposition_issues (filename, risk_level, issue_type, page)
+    """,
+    # ordered keyset scans per file for each sort
+    f"""
+    CREATE INDEX IF NOT EXISTS idx_issues_file_riskrank_page
+    ON deposition_issues (filename, {RISK_RANK_SQL}, page, issue_id)
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS idx_issues_file_page_riskrank
+    ON deposition_issues (filename, page, {RISK_RANK_SQL}, issue_id)
+    """,
+]
+
+def _issue_filters(risks=None, issue_types=None, pages=None):
+    """
+    Return: (list of SQL conditions, params) for the review tab filters.
+    """
+    conditions, params = [], []
+
+    if risks:
+        conditions.append("risk_level = ANY(%s)")
+        params.append(list(risks))
+    if issue_types:
+        conditions.append("issue_type = ANY(%s)")
+        params.append(list(issue_types))
+    if pages:
+        conditions.append("page = ANY(%s)")
+        params.append([int(p) for p in pages])
+
+    return conditions, params
+
+def query_issues(filename, risks=None, issue_types=None, pages=None,
+                 sort="risk", limit=25, after=None):
+    """
+    One page of filtered, ordered issues of a file.
+    after: keyset cursor returned for the previous page (None = first page)
+    limit: None = every matching issue
+    Return: (rows as tuples of ISSUE_COLUMNS, next cursor or None on the last page)
+    """
+    if sort not in ISSUE_SORTS:
+        raise ValueError(f"Unknown issue sort: {sort}")
+
+    keys = ISSUE_SORTS[sort]
+    conditions, params = _issue_filters(risks, issue_types, pages)
+    conditions[:0] = ["filename = %s", "duplicate_of IS NULL"]
+    params.insert(0, filename)
+
+    if after is not None:
+        conditions.append(f"({', '.join(keys)}) > ({', '.join(['%s'] * len(keys))})")
+        params.extend(after)
+
+    sql = f"""
+        SELECT
+            issue_id,
+            chunk_id,
+            filename,
+            page,
+            speaker_role,
+            risk_level,
+            legal_relevance,
+            quoted_text,
+            issue_type,
+            pdf_link,
+            (
+                SELECT array_agg(DISTINCT s.page ORDER BY s.page)
+                FROM issue_sources s
+                WHERE s.issue_id = deposition_issues.issue_id
+            ) AS source_pages,
+            quote_status,
+            quote_score,
+            {', '.join(keys)}
+        FROM deposition_issues
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {', '.join(keys)}
+    """
+    if limit is not None:
+        # one extra row tells whether there is a next page
+        sql += " LIMIT %s"
+        params.append(limit + 1)
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+
+    width = len(ISSUE_COLUMNS)
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = tuple(rows[-1][width:])
+
+    return [tuple(r[:width]) for r in rows], next_cursor
+
+def get_issue_facets(filename, risks=None, issue_types=None, pages=None):
+    """
+    Filter options with counts and the filtered total, in one round trip.
+    Return:
+    {
+        "risk": {"high": 4, ...},
+        "issue_type": {"causation": 7, ...},
+        "page": {12: 3, ...},
+        "total": 42,      # all issues of the file (merged duplicates count once)
+        "matching": 9     # issues passing the filters
+    }
+    """
+    conditions, params = _issue_filters(risks, issue_types, pages)
+    matching = " AND ".join(conditions) or "TRUE"
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT
+                    GROUPING(risk_level) AS g_risk,
+                    GROUPING(issue_type) AS g_type,
+                    GROUPING(page) AS g_page,
+                    risk_level,
+                    issue_type,
+                    page,
+                    COUNT(*) AS n,
+                    COUNT(*) FILTER (WHERE {matching}) AS n_matching
+                FROM deposition_issues
+                WHERE filename = %s
+                AND duplicate_of IS NULL
+                GROUP BY GROUPING SETS ((risk_level), (issue_type), (page), ())
+            """, params + [filename])
             rows = cur.fetchall()
-            conn.close()
 
-        return rows
+    facets = {"risk": {}, "issue_type": {}, "page": {}, "total": 0, "matching": 0}
+    for g_risk, g_type, g_page, risk, issue_type, page, n, n_matching in rows:
+        if not g_risk:
+            facets["risk"][risk] = n
+        elif not g_type:
+            facets["issue_type"][issue_type] = n
+        elif not g_page:
+            facets["page"][page] = n
+        else:
+            facets["total"] = n
+            facets["matching"] = n_matching
+
+    for name in ("risk", "issue_type", "page"):
+        facets[name] = dict(sorted(
+            facets[name].items(),
+            key=lambda kv: (kv[0] is None, kv[0] if kv[0] is not None else 0)
+        ))
+    return facets
+
+# ========== CROSS-SESSION CACHE (write-driven invalidation) ==========
+# Writers bump a per-scope counter in the same transaction as their data:
+#   "chunks"            -> chunks / issue_extracted changed (file stats)
+#   "issues:<filename>" -> deposition_issues of that file changed
+DATA_VERSIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS data_versions (
+        scope TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ DEFAULT now()
+    )
+"""
 
-    finally:
-        tunnel.stop()
+_query_cache = LRUCache(maxsize=256)
+_version_cache = {}   # scope -> (version, checked_at)
 
+def issues_scope(filename):
+    return f"issues:{filename}"
+
+def bump_data_version(cur, *scopes):
+    """
+    Invalidate cached reads of the given scopes. Call inside the writer's transaction.
+    """
+    cur.executemany("""
+        INSERT INTO data_versions (scope, version)
+        VALUES (%s, 1)
+        ON CONFLICT (scope) DO UPDATE
+        SET version = data_versions.version + 1,
+            updated_at = now()
+    """, [(scope,) for scope in scopes])
+
+def get_data_version(scope):
+    now = time.monotonic()
+    hit = _version_cache.get(scope)
+    if hit and now - hit[1] < VERSION_CHECK_INTERVAL:
+        return hit[0]
+
+    try:
+        with pooled_connection() as conn:
+            row = conn.execute(
+                "SELECT version FROM data_versions WHERE scope = %s", (scope,)
+            ).fetchone()
+    except psycopg.errors.UndefinedTable:
+        row = None  # no writer has run yet
+
+    version = row[0] if row else 0
+    _version_cache[scope] = (version, now)
+    return version
+
+def cached_query(scope, key, loader):
+    """
+    Serve loader() from memory until a writer bumps the scope's version.
+    """
+    cache_key = (scope, key, get_data_version(scope))
+    result = _query_cache.get(cache_key)
+    if result is None:
+        inc("query_cache_total", scope=scope.split(":", 1)[0], result="miss")
+        result = loader()
+        _query_cache.put(cache_key, result)
+    else:
+        inc("query_cache_total", scope=scope.split(":", 1)[0], result="hit")
+    return result
+
+def cached_file_stats():
+    return cached_query("chunks", "file_stats", get_file_stats)
+
+def cached_issue_page(filename, risks=(), issue_types=(), pages=(),
+                      sort="risk", limit=25, after=None):
+    return cached_query(
+        issues_scope(filename),
+        ("page", tuple(risks), tuple(issue_types), tuple(pages), sort, limit, after),
+        lambda: query_issues(filename, risks, issue_types, pages, sort, limit, after)
+    )
+
+def cached_issue_facets(filename, risks=(), issue_types=(), pages=()):
+    return cached_query(
+        issues_scope(filename),
+        ("facets", tuple(risks), tuple(issue_types), tuple(pages)),
+        lambda: get_issue_facets(filename, risks, issue_types, pages)
+    )
+
+# full-text search (hybrid search in the review tab): the tsvector is stored, so
+# ranking reads it instead of re-parsing every matching chunk
+CHUNKS_FTS_DDL = [
+    """
+    ALTER TABLE chunks
+        ADD COLUMN IF NOT EXISTS content_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_chunks_content_tsv ON chunks USING GIN (content_tsv)",
+]
+
+_search_tables_ready = False
+_search_tables_lock = threading.Lock()
+
+def init_search_tables():
+    """
+    content_tsv + its GIN index on databases indexed before them (adding the column
+    rewrites chunks once). Nothing to do until the first upload creates chunks.
+    """
+    global _search_tables_ready
+
+    with _search_tables_lock:
+        if _search_tables_ready:
+            return
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('chunks')")
+                if cur.fetchone()[0] is None:
+                    return
+                for ddl in CHUNKS_FTS_DDL:
+                    cur.execute(ddl)
+        _search_tables_ready = True
+
+def search_chunks_fulltext(query: str, filenames=None, pages=None, limit: int = 50):
+    """
+    Postgres full-text search over chunks.content (GIN index on the stored content_tsv).
+    Return list of (chunk_id, filename, page, chunk_index, content, pdf_link, rank)
+    """
+    if not query or not query.strip():
+        return []
+    init_search_tables()
+
+    sql = """
+        SELECT
+            chunk_id,
+            filename,
+            page,
+            chunk_index,
+            content,
+            pdf_link,
+            ts_rank_cd(content_tsv, q) AS rank
+        FROM chunks, websearch_to_tsquery('english', %s) q
+        WHERE content_tsv @@ q
+    """
+    params = [query]
+
+    if filenames:
+        sql += " AND filename = ANY(%s)"
+        params.append(list(filenames))
+    if pages:
+        sql += " AND page = ANY(%s)"
+        params.append(list(pages))
+
+    sql += " ORDER BY rank DESC LIMIT %s"
+    params.append(limit)
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
@@ -0,0 +1,210 @@
+import io
+import csv
+import time
+import uuid
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import fitz
+from pdf_utils import acquire_document, copy_pages
+
+RISK_COLORS = {
+    "HIGH": (0.60, 0.11, 0.11),
+    "MEDIUM": (0.57, 0.25, 0.05),
+    "LOW": (0.02, 0.37, 0.27),
+}
+STAMP_FILL = (1.0, 0.98, 0.85)
+INDEX_ROWS_PER_PAGE = 40
+QUOTE_PREVIEW_CHARS = 70
+BUNDLE_JOB_TTL = 3600      # seconds a finished bundle is kept for download
+MAX_BUNDLE_JOBS = 16       # finished bundles kept in memory at most
+
+_executor = ThreadPoolExecutor(max_workers=2)
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def _group_by_source(issues):
+    """
+    {pdf_link: {"filename", "pages": {page: [issue, ...]}}}, files and pages in order.
+    """
+    sources = {}
+    for it in sorted(issues, key=lambda i: (i["filename"], int(i["page"]))):
+        src = sources.setdefault(it["pdf_link"], {"filename": it["filename"], "pages": {}})
+        src["pages"].setdefault(int(it["page"]), []).append(it)
+    return sources
+
+def _stamp_page(page, filename, page_number, issues):
+    labels = " | ".join(
+        f"{str(it['risk']).upper()} - {it['issue_type']}" for it in issues
+    )
+    text = f"{filename} · p.{page_number} · {labels}"
+    risk = str(issues[0]["risk"]).upper()
+
+    rect = fitz.Rect(24, 6, page.rect.width - 24, 26)
+    page.draw_rect(rect, color=None, fill=STAMP_FILL, overlay=True)
+    page.insert_textbox(
+        rect + (4, 4, -4, 0),
+        text,
+        fontsize=8,
+        fontname="helv",
+        color=RISK_COLORS.get(risk, (0.2, 0.2, 0.2)),
+    )
+
+def _stamped_source_pdf(pdf_link, source):
+    """
+    All cited pages of one deposition, copied from the open document in one pass, then stamped.
+    """
+    page_numbers = list(source["pages"].keys())
+    with acquire_document(pdf_link) as (_, src):
+        data = copy_pages(src, page_numbers)
+
+    doc = fitz.open(stream=data, filetype="pdf")
+    for page, page_number in zip(doc, page_numbers):
+        _stamp_page(page, source["filename"], page_number, source["pages"][page_number])
+    return doc
+
+def _index_rows(sources):
+    rows = []
+    for source in sources.values():
+        for page_number, issues in source["pages"].items():
+            for it in issues:
+                rows.append({
+                    "filename": source["filename"],
+                    "page": page_number,
+                    "risk": str(it["risk"]).upper(),
+                    "issue_type": it["issue_type"],
+                    "quoted_text": it["quoted_text"],
+                    "legal_relevance": it.get("legal_relevance", ""),
+                    "quote_status": it.get("quote_status"),
+                })
+    return rows
+
+def _index_sheet(rows, title):
+    doc = fitz.open()
+    for start in range(0, max(len(rows), 1), INDEX_ROWS_PER_PAGE):
+        page = doc.new_page(width=612, height=792)
+        y = 50
+        if start == 0:
+            page.insert_text((40, y), title, fontsize=14, fontname="helv")
+            y += 18
+            page.insert_text(
+                (40, y),
+                f"{len(rows)} issues · generated {time.strftime('%Y-%m-%d %H:%M')}",
+                fontsize=9,
+                fontname="helv",
+                color=(0.42, 0.45, 0.50),
+            )
+            y += 22
+
+        page.insert_text((40, y), "#    File / page                      Risk     Issue type               Quote", fontsize=8, fontname="cour")
+        y += 14
+        for n, row in enumerate(rows[start:start + INDEX_ROWS_PER_PAGE], start=start + 1):
+            quote = " ".join(row["quoted_text"].split())
+            if row.get("quote_status") == "unmatched":
+                quote = "[NOT VERBATIM] " + quote
+            if len(quote) > QUOTE_PREVIEW_CHARS:
+                quote = quote[:QUOTE_PREVIEW_CHARS - 3] + "..."
+            where = f"{row['filename'][:26]} p.{row['page']}"
+            line = f"{n:<4} {where:<32} {row['risk']:<8} {row['issue_type'][:24]:<24} {quote}"
+            page.insert_text((40, y), line, fontsize=7, fontname="cour",
+                             color=RISK_COLORS.get(row["risk"], (0, 0, 0)))
+            y += 17
+    return doc
+
+def build_evidence_bundle(issues, fmt="pdf", title="Evidence bundle"):
+    """
+    issues: list of dicts with filename, page, pdf_link, issue_type, risk, quoted_text
+    fmt: "pdf" -> one combined PDF (index sheet + stamped pages)
+         "zip" -> index.pdf, index.csv and one stamped PDF per deposition
+    Each source PDF is opened once and all its cited pages are copied in a single pass.
+    Return: bytes
+    """
+    sources = _group_by_source(issues)
+    rows = _index_rows(sources)
+
+    if fmt == "pdf":
+        out = _index_sheet(rows, title)
+        for pdf_link, source in sources.items():
+            part = _stamped_source_pdf(pdf_link, source)
+            out.insert_pdf(part)
+            part.close()
+        data = out.tobytes(garbage=3, deflate=True)
+        out.close()
+        return data
+
+    if fmt == "zip":
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            index_doc = _index_sheet(rows, title)
+            zf.writestr("index.pdf", index_doc.tobytes(garbage=3, deflate=True))
+            index_doc.close()
+
+            csv_buffer = io.StringIO()
+            writer = csv.DictWriter(csv_buffer, fieldnames=list(rows[0].keys()) if rows else ["filename"])
+            writer.writeheader()
+            writer.writerows(rows)
+            zf.writestr("index.csv", csv_buffer.getvalue())
+
+            for pdf_link, source in sources.items():
+                part = _stamped_source_pdf(pdf_link, source)
+                name = source["filename"].rsplit(".", 1)[0]
+                zf.writestr(f"{name}_evidence.pdf", part.tobytes(garbage=3, deflate=True))
+                part.close()
+        return buffer.getvalue()
+
+    raise ValueError(f"Unknown bundle format: {fmt}")
+
+# ========== BACKGROUND EXPORT ==========
+def _prune_jobs(now):
+    """
+    Drop finished jobs older than BUNDLE_JOB_TTL, then the oldest beyond MAX_BUNDLE_JOBS:
+    sessions that end without discarding their job would otherwise keep its bytes forever.
+    Call with _jobs_lock held.
+    """
+    finished = sorted(
+        (job["finished_at"], job_id) for job_id, job in _jobs.items() if job.get("finished_at")
+    )
+    for i, (finished_at, job_id) in enumerate(finished):
+        if now - finished_at > BUNDLE_JOB_TTL or len(finished) - i > MAX_BUNDLE_JOBS:
+            del _jobs[job_id]
+
+def submit_evidence_bundle(issues, fmt="pdf", title="Evidence bundle"):
+    """
+    Build the bundle in a background thread so the Streamlit script keeps running.
+    Return: job id to poll with get_bundle_job
+    """
+    job_id = uuid.uuid4().hex
+    job = {"fmt": fmt, "count": len(issues), "submitted_at": time.time(), "finished_at": None}
+    with _jobs_lock:
+        _prune_jobs(time.time())
+        job["future"] = _executor.submit(build_evidence_bundle, issues, fmt, title)
+        _jobs[job_id] = job
+    job["future"].add_done_callback(lambda _: job.update(finished_at=time.time()))
+    return job_id
+
+def get_bundle_job(job_id):
+    """
+    Return: {"status": "running" | "done" | "failed" | "unknown", "data", "error", "fmt", "count"}
+    "unknown": never submitted, discarded, or expired (BUNDLE_JOB_TTL / MAX_BUNDLE_JOBS)
+    """
+    with _jobs_lock:
+        _prune_jobs(time.time())
+        job = _jobs.get(job_id)
+    if job is None:
+        return {"status": "unknown"}
+
+    future = job["future"]
+    result = {"fmt": job["fmt"], "count": job["count"], "data": None, "error": None}
+    if not future.done():
+        result["status"] = "running"
+    elif future.exception() is not None:
+        result["status"] = "failed"
+        result["error"] = str(future.exception())
+    else:
+        result["status"] = "done"
+        result["data"] = future.result()
+    return result
+
+def discard_bundle_job(job_id):
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
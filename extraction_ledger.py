@@ -0,0 +1,250 @@
+"""
+Ledger of issue-extraction calls: tokens, cache tokens, wall time, retries, continuations,
+stop reason and parse outcome of every chunk's messages.create calls, plus the cost / latency views built on it
+and projections for work not started yet.
+"""
+import uuid
+from config import get_config
+from db_utils import pooled_connection
+
+# USD per million tokens: (input, output, cache write, cache read). First matching key wins;
+# override with a [claude] prices = [input, output, cache_write, cache_read] setting.
+MODEL_PRICES = [
+    ("opus-4-5", (5.00, 25.00, 6.25, 0.50)),
+    ("opus-4", (15.00, 75.00, 18.75, 1.50)),
+    ("3-opus", (15.00, 75.00, 18.75, 1.50)),
+    ("sonnet", (3.00, 15.00, 3.75, 0.30)),
+    ("haiku-4-5", (1.00, 5.00, 1.25, 0.10)),
+    ("3-5-haiku", (0.80, 4.00, 1.00, 0.08)),
+    ("haiku", (0.25, 1.25, 0.30, 0.03)),
+]
+
+# projections before any call of the model is in the ledger
+CHARS_PER_TOKEN = 4
+DEFAULT_OUTPUT_TOKENS = 300
+DEFAULT_LATENCY_S = 6.0
+DEFAULT_CHUNKS_PER_PAGE = 3.0
+DEFAULT_CHUNK_CHARS = 700
+PROFILE_WINDOW = 1000   # most recent calls used for a model's profile
+
+PARSE_STATUSES = ("ok", "no_json", "invalid_json", "api_error", "db_error")
+
+EXTRACTION_CALLS_DDL = """
+    CREATE TABLE IF NOT EXISTS extraction_calls (
+        call_id TEXT PRIMARY KEY,
+        chunk_id TEXT,
+        filename TEXT,
+        model TEXT,
+        prompt_version TEXT,
+        content_chars INTEGER,
+        input_tokens INTEGER,
+        output_tokens INTEGER,
+        cache_creation_input_tokens INTEGER,
+        cache_read_input_tokens INTEGER,
+        latency_ms DOUBLE PRECISION,
+        retries INTEGER,
+        stop_reason TEXT,
+        parse_status TEXT,
+        issues_found INTEGER,
+        cost_usd DOUBLE PRECISION,
+        error TEXT,
+        created_at TIMESTAMPTZ DEFAULT now()
+    )
+"""
+
+def _usage_view(name, group_by):
+    return f"""
+        CREATE OR REPLACE VIEW {name} AS
+        SELECT
+            {group_by},
+            COUNT(*) AS calls,
+            COUNT(*) FILTER (WHERE parse_status <> 'ok') AS failed_calls,
+            COUNT(*) FILTER (WHERE stop_reason = 'max_tokens') AS truncated_calls,
+            COALESCE(SUM(retries), 0) AS retries,
+            COALESCE(SUM(input_tokens), 0) AS input_tokens,
+            COALESCE(SUM(output_tokens), 0) AS output_tokens,
+            COALESCE(SUM(cache_creation_input_tokens), 0) AS cache_creation_input_tokens,
+            COALESCE(SUM(cache_read_input_tokens), 0) AS cache_read_input_tokens,
+            SUM(cost_usd) AS cost_usd,
+            AVG(latency_ms) AS avg_latency_ms,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms) AS p50_latency_ms,
+            percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) AS p95_latency_ms,
+            MAX(output_tokens) AS max_output_tokens,
+            MIN(created_at) AS first_call,
+            MAX(created_at) AS last_call,
+            COALESCE(SUM(continuations), 0) AS continuations
+        FROM extraction_calls
+        GROUP BY {group_by}
+    """
+
+# view name -> group by
+USAGE_VIEWS = {
+    "extraction_usage_by_file": "filename",
+    "extraction_usage_by_model": "model",
+    "extraction_usage_by_prompt": "prompt_version, model",
+    "extraction_usage_by_stage": "stage, model",
+}
+
+LEDGER_DDL = [
+    EXTRACTION_CALLS_DDL,
+    "CREATE INDEX IF NOT EXISTS idx_extraction_calls_file ON extraction_calls (filename)",
+    "CREATE INDEX IF NOT EXISTS idx_extraction_calls_model_created ON extraction_calls (model, created_at DESC)",
+    # re-extraction runs (reextraction.py): spend per run for the budget cap
+    "ALTER TABLE extraction_calls ADD COLUMN IF NOT EXISTS run_id TEXT",
+    "CREATE INDEX IF NOT EXISTS idx_extraction_calls_run ON extraction_calls (run_id) WHERE run_id IS NOT NULL",
+    # cascade (triage.py): stage extract | triage, a triage call scores chunk_count chunks
+    "ALTER TABLE extraction_calls ADD COLUMN IF NOT EXISTS stage TEXT, ADD COLUMN IF NOT EXISTS chunk_count INTEGER",
+    # follow-up calls after a reply cut off at max_tokens (issue_extractor.call_extraction)
+    "ALTER TABLE extraction_calls ADD COLUMN IF NOT EXISTS continuations INTEGER",
+] + [_usage_view(name, group_by) for name, group_by in USAGE_VIEWS.items()]
+
+def init_ledger_tables(cur):
+    for ddl in LEDGER_DDL:
+        cur.execute(ddl)
+
+# ========== COST ==========
+def model_prices(model):
+    """
+    Return: (input, output, cache write, cache read) USD per million tokens, or None if unknown
+    """
+    override = get_config("claude", "prices", None)
+    if override:
+        return tuple(float(p) for p in override)
+    for key, prices in MODEL_PRICES:
+        if key in (model or ""):
+            return prices
+    return None
+
+def call_cost(model, input_tokens=0, output_tokens=0, cache_creation_input_tokens=0, cache_read_input_tokens=0):
+    prices = model_prices(model)
+    if prices is None:
+        return None
+    tokens = (input_tokens, output_tokens, cache_creation_input_tokens, cache_read_input_tokens)
+    return sum((t or 0) * p for t, p in zip(tokens, prices)) / 1e6
+
+def usage_fields(resp):
+    """
+    Return: token counts of a Messages API response, as extraction_calls columns
+    """
+    usage = resp.usage
+    return {
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+    }
+
+def record_call(**call):
+    """
+    One extraction_calls row, on its own connection: the ledger keeps calls whose
+    chunk transaction was rolled back. Never raises.
+    Return: cost_usd of the call (None: model prices unknown)
+    """
+    call.setdefault("cost_usd", call_cost(
+        call.get("model"),
+        call.get("input_tokens"),
+        call.get("output_tokens"),
+        call.get("cache_creation_input_tokens"),
+        call.get("cache_read_input_tokens"),
+    ))
+    call["call_id"] = uuid.uuid4().hex
+    columns = list(call)
+    try:
+        with pooled_connection() as conn:
+            conn.execute(
+                f"INSERT INTO extraction_calls ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                [call[c] for c in columns]
+            )
+    except Exception as e:
+        print(f"⚠️ Could not record extraction call for chunk {call.get('chunk_id')}: {e}")
+    return call["cost_usd"]
+
+# ========== USAGE / PROJECTIONS ==========
+def get_usage(view="extraction_usage_by_file"):
+    """
+    Return: rows of one of USAGE_VIEWS as dicts
+    """
+    if view not in USAGE_VIEWS:
+        raise ValueError(f"Unknown usage view: {view}")
+    with pooled_connection() as conn:
+        cur = conn.execute(f"SELECT * FROM {view} ORDER BY cost_usd DESC NULLS LAST")
+        names = [d.name for d in cur.description]
+        return [dict(zip(names, row)) for row in cur.fetchall()]
+
+def usage_profile(model, prompt_chars):
+    """
+    Per-call averages of the model's recent successful calls.
+    Input tokens are fitted as intercept + slope * chunk chars (prompt overhead + transcript).
+    """
+    with pooled_connection() as conn:
+        row = conn.execute("""
+            SELECT
+                COUNT(*),
+                regr_intercept(input_tokens, content_chars),
+                regr_slope(input_tokens, content_chars),
+                AVG(input_tokens),
+                AVG(output_tokens),
+                AVG(latency_ms)
+            FROM (
+                SELECT input_tokens, output_tokens, content_chars, latency_ms
+                FROM extraction_calls
+                WHERE model = %s AND parse_status = 'ok' AND stage IS DISTINCT FROM 'triage'
+                ORDER BY created_at DESC
+                LIMIT %s
+            ) recent
+        """, (model, PROFILE_WINDOW)).fetchone()
+
+    calls, intercept, slope, avg_input, avg_output, avg_latency_ms = row
+    if not calls:
+        return {
+            "basis": "default",
+            "calls": 0,
+            "input_intercept": prompt_chars / CHARS_PER_TOKEN,
+            "input_per_char": 1 / CHARS_PER_TOKEN,
+            "output_tokens": DEFAULT_OUTPUT_TOKENS,
+            "latency_s": DEFAULT_LATENCY_S,
+        }
+    if slope is None:  # every call had the same chunk size
+        intercept, slope = float(avg_input), 0.0
+    return {
+        "basis": "history",
+        "calls": calls,
+        "input_intercept": float(intercept),
+        "input_per_char": float(slope),
+        "output_tokens": float(avg_output),
+        "latency_s": float(avg_latency_ms) / 1000,
+    }
+
+def project(chunks, chars, model, prompt_chars):
+    """
+    Return: {"chunks", "input_tokens", "output_tokens", "cost_usd", "seconds", "basis", "calls"}
+    seconds: one file is extracted sequentially, one call per chunk
+    """
+    profile = usage_profile(model, prompt_chars)
+    input_tokens = chunks * profile["input_intercept"] + chars * profile["input_per_char"]
+    output_tokens = chunks * profile["output_tokens"]
+    return {
+        "chunks": chunks,
+        "input_tokens": int(input_tokens),
+        "output_tokens": int(output_tokens),
+        "cost_usd": call_cost(model, input_tokens, output_tokens),
+        "seconds": chunks * profile["latency_s"],
+        "basis": profile["basis"],
+        "calls": profile["calls"],
+    }
+
+def chunk_profile():
+    """
+    Return: (chunks per page, chars per chunk) of the indexed corpus
+    """
+    with pooled_connection() as conn:
+        per_page, chars = conn.execute("""
+            SELECT
+                COUNT(*)::float / NULLIF(COUNT(DISTINCT (filename, page)), 0),
+                AVG(chunk_chars)
+            FROM chunks
+        """).fetchone()
+    return (
+        float(per_page) if per_page else DEFAULT_CHUNKS_PER_PAGE,
+        float(chars) if chars else DEFAULT_CHUNK_CHARS,
+    )
@@ -4,22 +4,23 @@ import io
 import pickle
 import faiss
 import fitz  # PyMuPDF
-import dropbox
-import pytesseract
-from PyPDF2 import PdfReader
-import torch
-from PIL import Image
-from pdf2image import convert_from_bytes
 from concurrent.futures import ThreadPoolExecutor
-from sentence_transformers import SentenceTransformer
-import streamlit as st
-import pytesseract
 import sqlite3
 import hashlib
-
-# Nếu Windows, set đường dẫn cụ thể nếu không trong PATH
-if sys.platform.startswith("win"):
-    pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+import heapq
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+import numpy as np
+from cache_utils import LRUCache
+from config import get_config
+from telemetry import inc, span
 
 # ==============================
 # 🔧 1. CONFIGURATION
@@ -35,44 +36,83 @@ def load_local_config():
         return {}
 
 local_cfg = load_local_config()
-APP_KEY = st.secrets["dropbox"]["app_key"]
-APP_SECRET = st.secrets["dropbox"]["app_secret"]
-ACCESS_TOKEN = st.secrets["dropbox"]["access_token"]
-REFRESH_TOKEN = st.secrets["dropbox"]["refresh_token"] or local_cfg.get("refresh_token")
-OPENAI_API_KEY = st.secrets["openai"]["api_key"]
+
+def dropbox_credentials():
+    """
+    Return: (app_key, app_secret, refresh_token)
+    """
+    return (
+        get_config("dropbox", "app_key"),
+        get_config("dropbox", "app_secret"),
+        get_config("dropbox", "refresh_token", None) or local_cfg.get("refresh_token"),
+    )
 
 FOLDER_PATH = "/Apps/Document Brain/Agent"  
 FAISS_DIR = "data/faiss_store"
-INDEX_PATH = os.path.join(FAISS_DIR, "index.faiss")
+MANIFEST_NAME = "MANIFEST.json"
+GENERATIONS_SUBDIR = "generations"
+KEEP_GENERATIONS = 3
+PIN_NAME = ".readers"      # shared-locked by every reader of a generation (see pinned_snapshot)
+PIN_ATTEMPTS = 3
 META_PATH = os.path.join(FAISS_DIR, "metadata.pkl")
 SQLITE_DB_PATH = os.path.join(FAISS_DIR, "metadata.db")
+INDEX_PATH = os.path.join(FAISS_DIR, "index.faiss")   # single-index layout, imported into generation 1
 embedding_model = "text-embedding-3-large"
 SENTENCE_TRANSFORMER_NAME = "BAAI/bge-large-en-v1.5"  # or bge-small if constrained
 
 CHUNK_SIZE = 800 # 2000
 CHUNK_OVERLAP = 120 # 150
 
-# ========== MODEL LOADING (cached for streamlit) ==========
-@st.cache_resource(show_spinner=False)
+# ========== SHARDING ==========
+SHARD_BY = "file"          # "file" = 1 shard / deposition, "collection" = 1 shard / collection_id
+MAX_OPEN_SHARDS = 16       # LRU bound on mmap-ed shards kept open
+SEARCH_WORKERS = 4
+SEARCH_OVERFETCH = 4       # filtered search: per-shard fetch grows by this until k hits pass
+MANIFEST_CHECK_INTERVAL = 1.0  # seconds between manifest stat() calls of readers
+BGE_QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages: "
+
+# ========== LAZY HEAVY IMPORTS ==========
+# torch / OCR stacks are only loaded by the code paths that need them.
+def _pytesseract():
+    import pytesseract
+
+    # Nếu Windows, set đường dẫn cụ thể nếu không trong PATH
+    if sys.platform.startswith("win"):
+        pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+    return pytesseract
+
+# ========== MODEL LOADING (one per process) ==========
+_models = {}
+_models_lock = threading.Lock()
+
 def load_embedding_model(model_name=SENTENCE_TRANSFORMER_NAME):
-    return SentenceTransformer(model_name)
+    with _models_lock:
+        if model_name not in _models:
+            from sentence_transformers import SentenceTransformer
+            _models[model_name] = SentenceTransformer(model_name)
+        return _models[model_name]
 
 def get_dropbox_client():
     """
     Returns an authenticated Dropbox client.
     If no refresh token exists, runs OAuth flow to get one.
     """
+    import dropbox
+
+    app_key, app_secret, refresh_token = dropbox_credentials()
     dbx = dropbox.Dropbox(
-        oauth2_refresh_token=REFRESH_TOKEN,
-        app_key=APP_KEY,
-        app_secret=APP_SECRET,
+        oauth2_refresh_token=refresh_token,
+        app_key=app_key,
+        app_secret=app_secret,
     )
+    if refresh_token:
+        return dbx
 
     # Otherwise, run OAuth flow to get new refresh token
     print("⚙️ No refresh token found. Starting Dropbox OAuth flow...")
     auth_flow = dropbox.DropboxOAuth2FlowNoRedirect(
-        consumer_key=APP_KEY,
-        consumer_secret=APP_SECRET,     
+        consumer_key=app_key,
+        consumer_secret=app_secret,     
         token_access_type="offline"    
     )
 
@@ -95,18 +135,18 @@ def get_dropbox_client():
     print(f"✅ Refresh token saved to {CONFIG_FILE}")
     dbx = dropbox.Dropbox(
         oauth2_refresh_token=oauth_result.refresh_token,
-        app_key=APP_KEY,
-        app_secret=APP_SECRET,
+        app_key=app_key,
+        app_secret=app_secret,
     )
     return dbx
 
-def init_sqlite():
+def init_sqlite(db_path=SQLITE_DB_PATH):
     """
         Create table to store metadata if it does not exist.
 
     """
-    os.makedirs(FAISS_DIR, exist_ok=True)
-    conn = sqlite3.connect(SQLITE_DB_PATH)
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
     cur = conn.cursor()
     cur.execute("""
     CREATE TABLE IF NOT EXISTS chunks_v2 (
@@ -122,14 +162,39 @@ def init_sqlite():
         pdf_link TEXT
     )
     """)
+    # shard -> FAISS row -> chunk id
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS shard_rows (
+        shard TEXT,
+        row_id INTEGER,
+        chunk_id TEXT,
+        PRIMARY KEY (shard, row_id)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_shard_rows_chunk ON shard_rows (chunk_id)")
     conn.commit()
     conn.close()
 
-def insert_metadata(docs):
+def init_generation_db(db_path):
+    """
+        Generation-level metadata.db: which shards hold which files.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS shard_files (
+        shard TEXT,
+        filename TEXT,
+        PRIMARY KEY (shard, filename)
+    )
+    """)
+    conn.commit()
+    conn.close()
+
+def insert_metadata(docs, db_path=SQLITE_DB_PATH):
     """
         Insert new metadata into SQLite, skipping existing chunks.
     """
-    conn = sqlite3.connect(SQLITE_DB_PATH)
+    conn = sqlite3.connect(db_path)
     cur = conn.cursor()
     existing_ids = set(r[0] for r in cur.execute("SELECT id FROM chunks_v2").fetchall())
 
@@ -311,9 +376,15 @@ def smart_chunk_text(text: str, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
 
 # ========== OCR HELPERS ==========
 def ocr_image_bytes(img_bytes, lang="eng"):
-    return pytesseract.image_to_string(Image.open(io.BytesIO(img_bytes)), lang=lang)
+    from PIL import Image
+    with span("ocr", image_bytes=len(img_bytes)) as tags:
+        text = _pytesseract().image_to_string(Image.open(io.BytesIO(img_bytes)), lang=lang)
+        tags["chars"] = len(text)
+    return text
 
 def ocr_pages_from_pdf_bytes(pdf_bytes, dpi=200, lang="eng", max_workers=4):
+    from pdf2image import convert_from_bytes
+    pytesseract = _pytesseract()
     images = convert_from_bytes(pdf_bytes, dpi=dpi)
     texts = []
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
@@ -321,13 +392,13 @@ def ocr_pages_from_pdf_bytes(pdf_bytes, dpi=200, lang="eng", max_workers=4):
     return results
 
 # ========== LOAD & PREPROCESS DOCUMENTS ==========
-from dropbox.exceptions import ApiError
-
 def get_or_create_shared_link(dbx, path_lower: str) -> str:
     """
     Return a Dropbox shared link (preview link) for a file.
     If not exists, create one.
     """
+    from dropbox.exceptions import ApiError
+
     try:
         links = dbx.sharing_list_shared_links(
             path=path_lower,
@@ -347,6 +418,8 @@ def get_or_create_shared_link(dbx, path_lower: str) -> str:
         return None
 
 def load_documents_from_dropbox(incremental=True):
+    import dropbox
+
     dbx = get_dropbox_client()
     response = dbx.files_list_folder(FOLDER_PATH, recursive=True)
     docs = []
@@ -488,53 +561,672 @@ def load_documents_from_dropbox(incremental=True):
     print(f"Loaded {len(docs)} new chunks (unique files: {len(set(d['metadata']['source'] for d in docs))}).")
     return docs
 
-def build_faiss_index():
+# ========== SHARDED FAISS STORE ==========
+# Layout (every write publishes a new immutable generation):
+#   data/faiss_store/MANIFEST.json            -> {"generation": 12, "path": "generations/000012"}
+#   data/faiss_store/generations/000012/shards/<shard>.faiss   vectors
+#   data/faiss_store/generations/000012/shards/<shard>.db      chunks_v2 + shard_rows of the shard
+#   data/faiss_store/generations/000012/metadata.db            shard_files: shard -> filename
+# Unchanged shards (both files) are hard-linked between generations, so a write copies
+# only the shards it touches. Readers pin the generation named by the manifest for the
+# duration of a search; pinned generations are never pruned.
+# Stores from before generations (index.faiss + metadata.db under FAISS_DIR) are split
+# into shards as generation 1 by the first search or write.
+_open_shards = LRUCache(maxsize=MAX_OPEN_SHARDS)
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+_snapshot_lock = threading.Lock()
+_write_lock = threading.Lock()
+_current = {"snapshot": None, "manifest_mtime": None, "checked_at": 0.0}
+_local_pins = {}   # generation root -> readers in this process (platforms without fcntl)
+_pins_lock = threading.Lock()
+
+class Snapshot:
+    """
+    One published generation of shards + metadata.db.
+    """
+
+    def __init__(self, generation, root):
+        self.generation = generation
+        self.root = root
+
+    @property
+    def shard_dir(self):
+        return os.path.join(self.root, "shards")
+
+    @property
+    def db_path(self):
+        return os.path.join(self.root, "metadata.db")
+
+    def shard_path(self, shard):
+        return os.path.join(self.shard_dir, f"{shard}.faiss")
+
+    def shard_db_path(self, shard):
+        return os.path.join(self.shard_dir, f"{shard}.db")
+
+def _manifest_path():
+    return os.path.join(FAISS_DIR, MANIFEST_NAME)
+
+def _generations_dir():
+    return os.path.join(FAISS_DIR, GENERATIONS_SUBDIR)
+
+def _read_manifest():
+    path = _manifest_path()
+    if not os.path.exists(path):
+        # nothing published yet
+        return Snapshot(0, os.path.join(_generations_dir(), "000000"))
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    return Snapshot(manifest["generation"], os.path.join(FAISS_DIR, manifest["path"]))
+
+def current_snapshot(refresh=False):
+    """
+    Generation currently published by the manifest.
+    The manifest is re-checked at most every MANIFEST_CHECK_INTERVAL seconds, so a
+    new generation is picked up without restart while searches in flight keep
+    using the snapshot they started with.
+    """
+    now = time.monotonic()
+    with _snapshot_lock:
+        if (
+            refresh
+            or _current["snapshot"] is None
+            or now - _current["checked_at"] >= MANIFEST_CHECK_INTERVAL
+        ):
+            _current["checked_at"] = now
+            try:
+                mtime = os.stat(_manifest_path()).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if refresh or _current["snapshot"] is None or mtime != _current["manifest_mtime"]:
+                _current["snapshot"] = _read_manifest()
+                _current["manifest_mtime"] = mtime
+        return _current["snapshot"]
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # directories cannot be fsync-ed on some platforms
+    finally:
+        os.close(fd)
+
+@contextmanager
+def _writer_lock():
+    """
+    Serialize writers in this process and, where fcntl exists, across processes
+    (app + CLI workers share the same data/faiss_store).
+    """
+    with _write_lock:
+        os.makedirs(FAISS_DIR, exist_ok=True)
+        with open(os.path.join(FAISS_DIR, ".write.lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _write_manifest(generation, root):
+    manifest = {
+        "generation": generation,
+        "path": os.path.relpath(root, FAISS_DIR),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    tmp = _manifest_path() + f".tmp-{uuid.uuid4().hex}"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _manifest_path())
+    _fsync_path(FAISS_DIR)
+
+# ========== READER PINS ==========
+# A reader holds a shared flock on <generation>/.readers while it searches; the pruner only
+# removes a generation it can lock exclusively. flock() conflicts between open files of
+# the same process too, so this covers app threads, the CLI and ingest workers alike.
+def _pin(snap):
+    """
+    Return: handle keeping the generation from being pruned, or None if it is gone
+    """
+    path = os.path.join(snap.root, PIN_NAME)
+    if fcntl is None:
+        with _pins_lock:
+            if not os.path.isdir(snap.root):
+                return None
+            _local_pins[snap.root] = _local_pins.get(snap.root, 0) + 1
+        return path
+    try:
+        handle = open(path, "a")
+    except FileNotFoundError:
+        return None
+    fcntl.flock(handle, fcntl.LOCK_SH)
+    if not os.path.exists(path):   # pruned while we waited for the lock
+        handle.close()
+        return None
+    return handle
+
+def _unpin(snap, handle):
+    if fcntl is None:
+        with _pins_lock:
+            _local_pins[snap.root] -= 1
+            if not _local_pins[snap.root]:
+                del _local_pins[snap.root]
+    else:
+        handle.close()
+
+@contextmanager
+def pinned_snapshot():
+    """
+    Current snapshot, kept from _prune_generations until the block exits. Shards open
+    lazily, so a search must hold its generation until it has read every shard.
+    """
+    for attempt in range(PIN_ATTEMPTS):
+        snap = current_snapshot(refresh=attempt > 0)
+        if snap.generation == 0 and os.path.exists(INDEX_PATH):
+            _import_single_index()
+            snap = current_snapshot(refresh=True)
+        if snap.generation == 0:   # empty store, nothing to prune
+            yield snap
+            return
+        handle = _pin(snap)
+        if handle is not None:
+            break
+    else:
+        raise FileNotFoundError(f"Index generation {snap.generation} is missing from {FAISS_DIR}")
+    try:
+        yield snap
+    finally:
+        _unpin(snap, handle)
+
+def _prune_generation(root):
+    """
+    Remove one generation unless a reader has it pinned (it is retried by the next prune).
+    The directory is renamed away under the exclusive lock, so no reader can pin it after.
+    """
+    trash = os.path.join(os.path.dirname(root), f".deleted-{os.path.basename(root)}-{uuid.uuid4().hex[:8]}")
+    try:
+        if fcntl is None:
+            with _pins_lock:
+                if _local_pins.get(root):
+                    return False
+                os.rename(root, trash)
+        else:
+            with open(os.path.join(root, PIN_NAME), "a") as handle:
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                os.rename(root, trash)
+    except OSError:   # e.g. open files on Windows
+        return False
+    # open mmaps of this generation stay valid on POSIX after unlink
+    shutil.rmtree(trash, ignore_errors=True)
+    return True
+
+def _prune_generations(keep_from):
+    gens_dir = _generations_dir()
+    for name in os.listdir(gens_dir):
+        path = os.path.join(gens_dir, name)
+        if name.startswith(".deleted-"):
+            shutil.rmtree(path, ignore_errors=True)   # left by an interrupted prune
+        elif name.isdigit() and int(name) <= keep_from - KEEP_GENERATIONS:
+            if not _prune_generation(path):
+                print(f"📌 Generation {name} is still in use, kept until a later write")
+
+def _own_copy(path):
+    """
+    Before writing a staged file in place: replace a hard link shared with older
+    generations by a private copy. Only the shards a write touches are copied.
+    """
+    if os.path.exists(path) and os.stat(path).st_nlink > 1:
+        tmp = path + ".tmp"
+        shutil.copy2(path, tmp)
+        os.replace(tmp, path)
+
+def _import_single_index(snap=None):
+    """
+    One-time migration of a store from before generations: split index.faiss (row i =
+    i-th chunks_v2 row of metadata.db) into shards of the staged generation snap, or of a
+    new generation 1 when called by a reader.
+    """
+    if snap is None:
+        with new_generation():   # imports into the staged generation itself
+            return
+    if not os.path.exists(INDEX_PATH) or not os.path.exists(SQLITE_DB_PATH):
+        return
+
+    conn = sqlite3.connect(SQLITE_DB_PATH)
+    rows = conn.execute("""
+        SELECT id, filename, path, page, chunk_index, chunk_chars, has_ocr, collection_id, content, pdf_link
+        FROM chunks_v2
+        ORDER BY rowid
+    """).fetchall()
+    conn.close()
+    index = faiss.read_index(INDEX_PATH)
+    if index.ntotal != len(rows):
+        print(f"⚠️ {INDEX_PATH} has {index.ntotal} vectors for {len(rows)} chunks, not imported: "
+              f"re-run build_faiss_index to embed them again")
+        return
+
+    vectors = index.reconstruct_n(0, index.ntotal)
+    keys = ("bates_id", "source", "path", "page", "chunk_index", "chunk_chars", "has_ocr", "collection_id")
+    docs = [{"content": r[8], "metadata": dict(zip(keys, r[:8]), pdf_link=r[9])} for r in rows]
+    _add_docs(snap, docs, vectors)
+    print(f"🔀 Imported {len(rows)} vectors of {INDEX_PATH} into generation {snap.generation}")
+
+@contextmanager
+def new_generation():
+    """
+    Stage the next generation in a temp dir, copy-on-write from the current one,
+    and publish it with an atomic rename + manifest swap when the block succeeds.
+    On error the staged dir is discarded and readers never see it.
+    """
+    with _writer_lock():
+        base = current_snapshot(refresh=True)
+        generation = base.generation + 1
+        gens_dir = _generations_dir()
+        staging = os.path.join(gens_dir, f".tmp-{generation:06d}-{uuid.uuid4().hex[:8]}")
+        snap = Snapshot(generation, staging)
+        os.makedirs(snap.shard_dir)
+        open(os.path.join(staging, PIN_NAME), "a").close()
+
+        try:
+            if os.path.isdir(base.shard_dir):
+                for name in os.listdir(base.shard_dir):
+                    if name.endswith((".faiss", ".db")):
+                        _link_or_copy(os.path.join(base.shard_dir, name), os.path.join(snap.shard_dir, name))
+
+            # metadata.db only maps shards to files: copying it is O(files), not O(chunks)
+            if os.path.exists(base.db_path):
+                src = sqlite3.connect(base.db_path)
+                dst = sqlite3.connect(snap.db_path)
+                src.backup(dst)
+                dst.close()
+                src.close()
+            init_generation_db(snap.db_path)
+            if base.generation == 0:
+                _import_single_index(snap)
+
+            yield snap
+
+            for name in os.listdir(snap.shard_dir):
+                _fsync_path(os.path.join(snap.shard_dir, name))
+            _fsync_path(snap.db_path)
+
+            final = os.path.join(gens_dir, f"{generation:06d}")
+            os.rename(staging, final)
+            _fsync_path(gens_dir)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        _write_manifest(generation, final)
+        current_snapshot(refresh=True)
+        _prune_generations(generation)
+        print(f"📦 Published index generation {generation}")
+
+def shard_name(meta):
+    """
+    Shard key for a chunk: one shard per deposition (default) or per collection.
+    """
+    key = meta["collection_id"] if SHARD_BY == "collection" else meta["source"]
+    return hashlib.md5(str(key).encode("utf-8")).hexdigest()[:10]
+
+def _write_index_file(index, path):
+    # never write through an existing path: it may be a hard link shared with
+    # an older generation that readers still have open
+    tmp = path + ".tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+
+def get_indexed_chunk_ids(snap=None):
+    if snap is None:
+        with pinned_snapshot() as snap:
+            return get_indexed_chunk_ids(snap)
+
+    ids = set()
+    for db_path in {snap.shard_db_path(shard) for shard in list_shards(snap=snap)}:
+        conn = sqlite3.connect(db_path)
+        try:
+            ids.update(r[0] for r in conn.execute("SELECT chunk_id FROM shard_rows").fetchall())
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.close()
+    return ids
+
+def write_shard(snap, shard, embeddings, chunk_ids):
+    """
+    Append vectors to a shard of a staged generation and record row -> chunk mapping.
+    The shard's .db must already be a private copy with its tables (see _add_docs).
+    """
+    path = snap.shard_path(shard)
+
+    if os.path.exists(path):
+        # full read (not mmap) since we are going to mutate it
+        index = faiss.read_index(path)
+    else:
+        index = faiss.IndexFlatIP(embeddings.shape[1])
+
+    start = index.ntotal
+    index.add(embeddings)
+    _write_index_file(index, path)
+
+    conn = sqlite3.connect(snap.shard_db_path(shard))
+    conn.executemany(
+        "INSERT OR REPLACE INTO shard_rows (shard, row_id, chunk_id) VALUES (?, ?, ?)",
+        [(shard, start + i, cid) for i, cid in enumerate(chunk_ids)]
+    )
+    conn.commit()
+    conn.close()
+    print(f"💾 Shard {shard}: +{len(chunk_ids)} vectors (total {index.ntotal})")
+
+def open_shard(snap, shard):
+    """
+    Open a shard memory-mapped, reusing an already open handle when possible.
+    Only MAX_OPEN_SHARDS handles are kept; least recently used ones are dropped.
+    """
+    path = snap.shard_path(shard)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    # keyed by inode: a shard hard-linked into a newer generation reuses its handle
+    key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+    index = _open_shards.get(key)
+    if index is not None:
+        return index
+
+    flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        index = faiss.read_index(path, flags)
+    except Exception:
+        # index type without mmap support -> regular load
+        index = faiss.read_index(path)
+
+    _open_shards.put(key, index)
+    return index
+
+def list_shards(filenames=None, snap=None):
+    """
+    Shards holding chunks of the given files (all shards if None).
+    """
+    snap = snap or current_snapshot()
+    if not os.path.exists(snap.db_path):
+        return []
+    conn = sqlite3.connect(snap.db_path)
+    try:
+        if filenames:
+            marks = ",".join("?" * len(filenames))
+            rows = conn.execute(f"""
+                SELECT DISTINCT shard
+                FROM shard_files
+                WHERE filename IN ({marks})
+            """, list(filenames)).fetchall()
+        else:
+            rows = conn.execute("SELECT DISTINCT shard FROM shard_files").fetchall()
+    finally:
+        conn.close()
+    return [r[0] for r in rows]
+
+def embed_query(text, instruction=True):
+    """
+    instruction=False for passage-to-passage similarity (bge is symmetric without it).
+    """
+    model = load_embedding_model()
+    vec = model.encode(
+        [(BGE_QUERY_INSTRUCTION if instruction else "") + text],
+        normalize_embeddings=True
+    )
+    return np.asarray(vec, dtype="float32")
+
+def _search_one_shard(snap, shard, query, k):
+    index = open_shard(snap, shard)
+    if index is None or index.ntotal == 0:
+        return []
+    scores, rows = index.search(query, min(k, index.ntotal))
+    return [
+        (float(score), shard, int(row))
+        for score, row in zip(scores[0], rows[0])
+        if row != -1
+    ]
+
+def _hit_metadata(snap, hits, filenames, conns):
+    results = []
+    for score, shard, row in hits:
+        db_path = snap.shard_db_path(shard)
+        conn = conns.get(db_path) or conns.setdefault(db_path, sqlite3.connect(db_path))
+        meta = conn.execute("""
+            SELECT c.id, c.filename, c.page, c.chunk_index, c.content, c.pdf_link
+            FROM shard_rows r
+            JOIN chunks_v2 c ON c.id = r.chunk_id
+            WHERE r.shard = ? AND r.row_id = ?
+        """, (shard, row)).fetchone()
+        if meta is None:
+            continue
+        chunk_id, filename, page, chunk_index, content, pdf_link = meta
+        if filenames and filename not in filenames:
+            # collection shards may hold other files
+            continue
+        results.append({
+            "chunk_id": chunk_id,
+            "score": score,
+            "filename": filename,
+            "page": page,
+            "chunk_index": chunk_index,
+            "content": content,
+            "pdf_link": pdf_link,
+        })
+    return results
+
+def search_shards(query, k=10, filenames=None):
+    """
+    Search all relevant shards in parallel and merge into a global top-k.
+    query: text or a (1, dim) float32 embedding
+    filenames: only hits of these files; shards holding other files too are searched
+    deeper (SEARCH_OVERFETCH) until k hits pass or the shards run out
+    Return: [{"chunk_id", "score", "filename", "page", "chunk_index", "content", "pdf_link"}, ...]
+    """
+    if isinstance(query, str):
+        query = embed_query(query)
+
+    # pin one generation so vectors and metadata always match, and keep it from being
+    # pruned while shards are still being opened
+    with pinned_snapshot() as snap:
+        shards = list_shards(filenames, snap)
+        if not shards:
+            return []
+
+        conns = {}
+        try:
+            fetch = k
+            while True:
+                futures = [_search_pool.submit(_search_one_shard, snap, s, query, fetch) for s in shards]
+                per_shard = [f.result() for f in futures]
+                hits = heapq.nlargest(fetch, (h for hs in per_shard for h in hs), key=lambda h: h[0])
+                results = _hit_metadata(snap, hits, filenames, conns)
+                # done when k passed the filter or no shard has rows left beyond fetch
+                if len(results) >= k or all(len(hs) < fetch for hs in per_shard):
+                    break
+                fetch *= SEARCH_OVERFETCH
+        finally:
+            for conn in conns.values():
+                conn.close()
+
+    return results[:k]
+
+def add_to_shards(docs, embeddings):
+    """
+    FAISS path of the vector store: metadata -> SQLite, vectors -> one shard per file,
+    both published together as one new generation.
+    """
+    with new_generation() as snap:
+        return _add_docs(snap, docs, embeddings)
+
+def _add_docs(snap, docs, embeddings):
+    """
+    Return: number of shards written
+    """
+    metadatas = [d["metadata"] for d in docs]
+
+    by_shard = {}
+    for i, meta in enumerate(metadatas):
+        by_shard.setdefault(shard_name(meta), []).append(i)
+
+    for shard, rows in by_shard.items():
+        # --- Lưu metadata vào SQLite của shard ---
+        db_path = snap.shard_db_path(shard)
+        _own_copy(db_path)
+        init_sqlite(db_path)
+        insert_metadata([docs[i] for i in rows], db_path)
+
+        # --- Ghi từng shard (1 file FAISS / deposition) ---
+        write_shard(
+            snap,
+            shard,
+            embeddings[rows],
+            [metadatas[i]["bates_id"] for i in rows]
+        )
+
+    conn = sqlite3.connect(snap.db_path)
+    conn.executemany(
+        "INSERT OR IGNORE INTO shard_files (shard, filename) VALUES (?, ?)",
+        sorted({(shard, metadatas[i]["source"]) for shard, rows in by_shard.items() for i in rows})
+    )
+    conn.commit()
+    conn.close()
+    return len(by_shard)
+
+def remove_from_shards(filenames):
+    """
+    Drop all vectors of the given files in a new generation. Row ids of the remaining
+    vectors are renumbered since IndexFlat.remove_ids compacts the shard.
+    """
+    if not filenames or (current_snapshot().generation == 0 and not os.path.exists(INDEX_PATH)):
+        return 0
+
+    marks = ",".join("?" * len(filenames))
+    removed_total = 0
+    with new_generation() as snap:
+        shards = list_shards(filenames, snap)
+        for shard in shards:
+            path = snap.shard_path(shard)
+            db_path = snap.shard_db_path(shard)
+            _own_copy(db_path)
+            conn = sqlite3.connect(db_path)
+            removed = [r[0] for r in conn.execute(f"""
+                SELECT r.row_id
+                FROM shard_rows r
+                JOIN chunks_v2 c ON c.id = r.chunk_id
+                WHERE r.shard = ? AND c.filename IN ({marks})
+            """, [shard] + list(filenames)).fetchall()]
+            total = conn.execute("SELECT COUNT(*) FROM shard_rows WHERE shard = ?", (shard,)).fetchone()[0]
+            removed_total += len(removed)
+
+            if len(removed) >= total:
+                conn.close()
+                for p in (path, db_path):
+                    if os.path.exists(p):
+                        os.remove(p)
+                continue
+
+            index = faiss.read_index(path)
+            index.remove_ids(np.array(sorted(removed), dtype="int64"))
+            _write_index_file(index, path)
+
+            keep = conn.execute("""
+                SELECT row_id, chunk_id FROM shard_rows
+                WHERE shard = ? ORDER BY row_id
+            """, (shard,)).fetchall()
+            removed_set = set(removed)
+            keep = [cid for row, cid in keep if row not in removed_set]
+            conn.execute("DELETE FROM shard_rows WHERE shard = ?", (shard,))
+            conn.executemany(
+                "INSERT INTO shard_rows (shard, row_id, chunk_id) VALUES (?, ?, ?)",
+                [(shard, i, cid) for i, cid in enumerate(keep)]
+            )
+            conn.execute(f"DELETE FROM chunks_v2 WHERE filename IN ({marks})", list(filenames))
+            conn.commit()
+            conn.close()
+
+        conn = sqlite3.connect(snap.db_path)
+        conn.execute(f"DELETE FROM shard_files WHERE filename IN ({marks})", list(filenames))
+        conn.commit()
+        conn.close()
+
+    print(f"🗑️ Removed {removed_total} vectors of {len(filenames)} files from {len(shards)} shards.")
+    return removed_total
+
+def build_faiss_index(store=None, batch_size=None, dry_run=False, progress=None):
+    """
+    Embed new Dropbox chunks into the configured vector store
+    (FAISS shards by default, see vector_store.vector_backend).
+    batch_size: chunks per encode call (default: by hardware)
+    dry_run: stop after counting the chunks that would be embedded
+    progress: optional fn(stage, **counters), called after each encode call
+    Return: number of chunks embedded (or to embed on a dry run)
+    """
+    from vector_store import get_vector_store
+    store = store or get_vector_store()
+
     docs = load_documents_from_dropbox()
     if not docs:
         print("❌ No PDF files found in the Dropbox folder.")
-        return
+        return 0
+
+    # skip chunks already embedded (and duplicate ids within this run)
+    seen = store.indexed_chunk_ids()
+    new_docs = []
+    for d in docs:
+        bates_id = d["metadata"]["bates_id"]
+        if bates_id in seen:
+            continue
+        seen.add(bates_id)
+        new_docs.append(d)
+    docs = new_docs
+
+    if not docs:
+        print("✅ All chunks already indexed.")
+        return 0
+
+    if dry_run:
+        print(f"📝 Dry run: {len(docs)} chunks from {len(set(d['metadata']['source'] for d in docs))} PDFs to embed ({store.name}).")
+        return len(docs)
 
     texts = [doc["content"] for doc in docs]
-    metadatas = [doc["metadata"] for doc in docs]
 
     model = load_embedding_model()
     # choose batch size by hardware
-    batch_size = 32 if torch.cuda.is_available() else 8
-
-    print(f"🧠 Encoding {len(texts)} chunks with batch_size={batch_size} ...")
-    embeddings = model.encode(
-        texts,
-        batch_size=batch_size,
-        normalize_embeddings=True,
-        show_progress_bar=True
-    )
-    import numpy as np
-    embeddings = np.array(embeddings).astype("float32")
+    import torch
+    model_batch = 32 if torch.cuda.is_available() else 8
+    batch_size = batch_size or model_batch * 16
 
-    # If index exists, load and append; else create new IP (inner product) index (works with normalized embeddings as cosine)
-    os.makedirs(FAISS_DIR, exist_ok=True)
-    if os.path.exists(INDEX_PATH):
-        try:
-            index = faiss.read_index(INDEX_PATH)
-            print("Loaded existing FAISS index, appending vectors...")
-            index.add(embeddings)
-        except Exception as e:
-            print(f"Failed to load existing index: {e}. Creating new index.")
-            print("💾 Building FAISS index...")
-            index = faiss.IndexFlatIP(embeddings.shape[1])
-            index.add(embeddings)
-    else:
-        index = faiss.IndexFlatIP(embeddings.shape[1])
-        index.add(embeddings)
+    print(f"🧠 Encoding {len(texts)} chunks with batch_size={model_batch} ...")
+    parts = []
+    for start in range(0, len(texts), batch_size):
+        with span("embed.batch", chunks=len(texts[start:start + batch_size]), model_batch=model_batch):
+            parts.append(model.encode(
+                texts[start:start + batch_size],
+                batch_size=model_batch,
+                normalize_embeddings=True,
+                show_progress_bar=progress is None
+            ))
+        inc("chunks_embedded_total", len(parts[-1]))
+        if progress:
+            progress("embed", chunks_total=len(texts), chunks_embedded=start + len(parts[-1]))
+    embeddings = np.vstack(parts).astype("float32")
 
-    faiss.write_index(index, INDEX_PATH)
-    print(f"FAISS index saved to {INDEX_PATH}")
+    with span("vector_store.add", backend=store.name, chunks=len(docs)):
+        store.add(docs, embeddings)
 
-    # --- Lưu metadata vào SQLite ---
-    init_sqlite()
-    new_docs = [{"content": t, "metadata": m} for t, m in zip(texts, metadatas)]
-    insert_metadata(new_docs)
-
-    print(f"✅ Indexed {len(new_docs)} chunks from {len(set(d['metadata']['source'] for d in docs))} PDFs.")
-    print(f"📁 SQLite metadata: {SQLITE_DB_PATH}")
-    
+    print(f"✅ Indexed {len(texts)} chunks from {len(set(d['metadata']['source'] for d in docs))} PDFs ({store.name}).")
+    return len(texts)
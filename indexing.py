@@ -1,37 +1,11 @@
 import os, re, sys, io, json
-import tempfile
 import fitz  # PyMuPDF
-import dropbox
-import pytesseract
 import hashlib
-from PyPDF2 import PdfReader
-from PIL import Image
-from pdf2image import convert_from_bytes
+import threading
 from concurrent.futures import ThreadPoolExecutor
-from sentence_transformers import SentenceTransformer
-import streamlit as st
-import pytesseract
-from sshtunnel import SSHTunnelForwarder
-import psycopg
-
-SSH_HOST = st.secrets["ssh"]["SSH_HOST"]
-SSH_PORT = st.secrets["ssh"]["SSH_PORT"]
-SSH_USER = st.secrets["ssh"]["SSH_USER"]
-SSH_PRIVATE_KEY = st.secrets["ssh"]["SSH_PRIVATE_KEY"]
-# SSH_KEY = os.path.join(
-#     os.environ["USERPROFILE"],
-#     ".ssh",
-#     st.secrets["ssh"]["SSH_KEY_PATH"]
-# )
-DB_NAME = st.secrets["database"]["DB_NAME"]
-DB_USER = st.secrets["database"]["DB_USER"]
-DB_PORT = st.secrets["database"]["DB_PORT"]
-DB_HOST = st.secrets["database"]["DB_HOST"]
-DB_PASSWORD = st.secrets["database"]["DB_PASSWORD"]
-
-# Nếu Windows, set đường dẫn cụ thể nếu không trong PATH
-if sys.platform.startswith("win"):
-    pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+from config import get_config
+from db_utils import CHUNKS_FTS_DDL, DATA_VERSIONS_DDL, bump_data_version, pooled_connection
+from telemetry import current_tags, inc, span
 
 # ==============================
 # 🔧 1. CONFIGURATION
@@ -47,39 +21,66 @@ def load_local_config():
         return {}
 
 local_cfg = load_local_config()
-APP_KEY = st.secrets["dropbox"]["app_key"]
-APP_SECRET = st.secrets["dropbox"]["app_secret"]
-ACCESS_TOKEN = st.secrets["dropbox"]["access_token"]
-REFRESH_TOKEN = st.secrets["dropbox"]["refresh_token"] or local_cfg.get("refresh_token")
-OPENAI_API_KEY = st.secrets["openai"]["api_key"]
 FOLDER_PATH = "/Apps/Document Brain/Agent"  
 embedding_model = "text-embedding-3-large"
 SENTENCE_TRANSFORMER_NAME = "BAAI/bge-large-en-v1.5"  # or bge-small if constrained
 
 CHUNK_SIZE = 800 # 2000
 CHUNK_OVERLAP = 120 # 150
+INSERT_BATCH_SIZE = 500
+
+def dropbox_credentials():
+    """
+    Return: (app_key, app_secret, refresh_token)
+    """
+    return (
+        get_config("dropbox", "app_key"),
+        get_config("dropbox", "app_secret"),
+        get_config("dropbox", "refresh_token", None) or local_cfg.get("refresh_token"),
+    )
+
+# ========== LAZY HEAVY IMPORTS ==========
+# torch / OCR stacks are only loaded by the code paths that need them.
+def _pytesseract():
+    import pytesseract
+
+    # Nếu Windows, set đường dẫn cụ thể nếu không trong PATH
+    if sys.platform.startswith("win"):
+        pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+    return pytesseract
+
+# ========== MODEL LOADING (one per process) ==========
+_models = {}
+_models_lock = threading.Lock()
 
-# ========== MODEL LOADING (cached for streamlit) ==========
-@st.cache_resource(show_spinner=False)
 def load_embedding_model(model_name=SENTENCE_TRANSFORMER_NAME):
-    return SentenceTransformer(model_name)
+    with _models_lock:
+        if model_name not in _models:
+            from sentence_transformers import SentenceTransformer
+            _models[model_name] = SentenceTransformer(model_name)
+        return _models[model_name]
 
 def get_dropbox_client():
     """
     Returns an authenticated Dropbox client.
     If no refresh token exists, runs OAuth flow to get one.
     """
+    import dropbox
+
+    app_key, app_secret, refresh_token = dropbox_credentials()
     dbx = dropbox.Dropbox(
-        oauth2_refresh_token=REFRESH_TOKEN,
-        app_key=APP_KEY,
-        app_secret=APP_SECRET,
+        oauth2_refresh_token=refresh_token,
+        app_key=app_key,
+        app_secret=app_secret,
     )
+    if refresh_token:
+        return dbx
 
     # Otherwise, run OAuth flow to get new refresh token
     print("⚙️ No refresh token found. Starting Dropbox OAuth flow...")
     auth_flow = dropbox.DropboxOAuth2FlowNoRedirect(
-        consumer_key=APP_KEY,
-        consumer_secret=APP_SECRET,     
+        consumer_key=app_key,
+        consumer_secret=app_secret,     
         token_access_type="offline"    
     )
 
@@ -102,33 +103,38 @@ def get_dropbox_client():
     print(f"✅ Refresh token saved to {CONFIG_FILE}")
     dbx = dropbox.Dropbox(
         oauth2_refresh_token=oauth_result.refresh_token,
-        app_key=APP_KEY,
-        app_secret=APP_SECRET,
+        app_key=app_key,
+        app_secret=app_secret,
     )
     return dbx
 
-def load_documents_from_streamlit(uploaded_file):
+def load_documents_from_streamlit(uploaded_file, progress=None):
     """
     uploaded_file: streamlit UploadedFile
     """
-    docs = []
+    return load_documents_from_bytes(uploaded_file.read(), uploaded_file.name, progress)
 
-    pdf_bytes = uploaded_file.read()
-    filename = uploaded_file.name
+def docs_from_pages(pages, filename, collection_id="streamlit_upload"):
+    """
+    pages: output of extract_pages
+    Return: chunk docs ({"id", "content", "metadata"}) ready for insert_metadata
+    """
+    docs = []
 
     file_uid = hashlib.md5(filename.encode("utf-8")).hexdigest()[:10]
 
-    pages = extract_pages(pdf_bytes)
-
     for page_obj in pages:
         page_num = page_obj["page"]
         text = page_obj["text"]
 
-        chunks = smart_chunk_text(
-            text,
-            CHUNK_SIZE,
-            CHUNK_OVERLAP
-        )
+        with span("chunk", filename=filename, page=page_num) as tags:
+            chunks = smart_chunk_text(
+                text,
+                CHUNK_SIZE,
+                CHUNK_OVERLAP
+            )
+            tags["chunks"] = len(chunks)
+        inc("chunks_created_total", len(chunks), filename=filename)
 
         for idx, chunk in enumerate(chunks):
             bates_id = f"{file_uid}_{page_num:03d}_{idx:02d}"
@@ -144,10 +150,18 @@ def load_documents_from_streamlit(uploaded_file):
                     "chunk_index": idx,
                     "chunk_chars": len(chunk),
                     "has_ocr": page_obj["has_ocr"],
-                    "collection_id": "streamlit_upload"
+                    "collection_id": collection_id
                 }
             })
 
+    return docs
+
+def load_documents_from_bytes(pdf_bytes, filename, progress=None):
+    """
+    progress: optional fn(stage, **counters), see ingest_jobs.make_progress
+    """
+    docs = docs_from_pages(extract_pages(pdf_bytes, progress), filename)
+
     print(f"📄 Loaded {len(docs)} chunks from uploaded file: {filename}")
     return docs
 
@@ -156,33 +170,7 @@ def init_postgresql():
         Create table to store metadata if it does not exist.
 
     """
-    # --- write SSH key to temp file ---
-    with tempfile.NamedTemporaryFile(delete=False) as key_file:
-        key_file.write(SSH_PRIVATE_KEY.encode())
-        ssh_key_path = key_file.name
-
-    # --- SSH Tunnel ---
-    tunnel = SSHTunnelForwarder(
-        (SSH_HOST, SSH_PORT),
-        ssh_username=SSH_USER,
-        ssh_pkey=ssh_key_path,
-        allow_agent=False,
-        host_pkey_directories=[],
-        remote_bind_address=(DB_HOST, DB_PORT),
-    )
-    
-    tunnel.start()
-
-    try:
-        conn = psycopg.connect(
-            host=DB_HOST,
-            port=tunnel.local_bind_port,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            connect_timeout=5,
-        )
-
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
             CREATE TABLE IF NOT EXISTS chunks (
@@ -197,43 +185,22 @@ def init_postgresql():
                 content TEXT
             )
             """)
-            conn.commit()
-            conn.close()
-    finally:
-        tunnel.stop()
+            # read / written by issue extraction
+            cur.execute("""
+            ALTER TABLE chunks
+                ADD COLUMN IF NOT EXISTS pdf_link TEXT,
+                ADD COLUMN IF NOT EXISTS issue_extracted INTEGER DEFAULT 0
+            """)
+            for ddl in CHUNKS_FTS_DDL:
+                cur.execute(ddl)
+            cur.execute(DATA_VERSIONS_DDL)
         
-def insert_metadata(docs):
+def insert_metadata(docs, progress=None, batch_size=INSERT_BATCH_SIZE):
     """
         Insert new metadata into SQLite, skipping existing chunks.
+        progress: optional fn(stage, **counters), called after each batch of batch_size rows
     """
-    
-    # --- write SSH key to temp file ---
-    with tempfile.NamedTemporaryFile(delete=False) as key_file:
-        key_file.write(SSH_PRIVATE_KEY.encode())
-        ssh_key_path = key_file.name
-
-    # --- SSH Tunnel ---
-    tunnel = SSHTunnelForwarder(
-        (SSH_HOST, SSH_PORT),
-        ssh_username=SSH_USER,
-        ssh_pkey=ssh_key_path,
-        allow_agent=False,
-        host_pkey_directories=[],
-        remote_bind_address=(DB_HOST, DB_PORT),
-    )
-    
-    tunnel.start()
-
-    try:
-        conn = psycopg.connect(
-            host=DB_HOST,
-            port=tunnel.local_bind_port,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            connect_timeout=5,
-        )
-
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
             existing_ids = set(r[0] for r in cur.execute("SELECT chunk_id FROM chunks").fetchall())
 
@@ -254,19 +221,24 @@ def insert_metadata(docs):
                     d["content"]
                 ))
 
-            cur.executemany("""
-                INSERT INTO chunks (
-                    chunk_id, filename, path, page, chunk_index, chunk_chars, has_ocr, collection_id, content
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (chunk_id) DO NOTHING
-            """, new_rows)
+            if progress:
+                progress("write", chunks_total=len(new_rows), chunks_written=0)
+
+            for start in range(0, len(new_rows), batch_size):
+                batch = new_rows[start:start + batch_size]
+                cur.executemany("""
+                    INSERT INTO chunks (
+                        chunk_id, filename, path, page, chunk_index, chunk_chars, has_ocr, collection_id, content
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (chunk_id) DO NOTHING
+                """, batch)
+                if progress:
+                    progress("write", chunks_total=len(new_rows), chunks_written=start + len(batch))
+
+            if new_rows:
+                bump_data_version(cur, "chunks")
 
-            conn.commit()
-            conn.close()
-            print(f"💾 Saved {len(new_rows)} metadata entries to PostgreSQL.")
-    
-    finally:
-        tunnel.stop()
+    print(f"💾 Saved {len(new_rows)} metadata entries to PostgreSQL.")
 
 _SPEAKER_RE = re.compile(r'^(MR|MS|MRS|DR)\.\s+([A-Z][A-Z\s\-]+):', re.I)
 
@@ -358,9 +330,15 @@ def smart_chunk_text(text: str, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
 
 # ========== OCR HELPERS ==========
 def ocr_image_bytes(img_bytes, lang="eng"):
-    return pytesseract.image_to_string(Image.open(io.BytesIO(img_bytes)), lang=lang)
+    from PIL import Image
+    with span("ocr", image_bytes=len(img_bytes)) as tags:
+        text = _pytesseract().image_to_string(Image.open(io.BytesIO(img_bytes)), lang=lang)
+        tags["chars"] = len(text)
+    return text
 
 def ocr_pages_from_pdf_bytes(pdf_bytes, dpi=200, lang="eng", max_workers=4):
+    from pdf2image import convert_from_bytes
+    pytesseract = _pytesseract()
     images = convert_from_bytes(pdf_bytes, dpi=dpi)
     texts = []
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
@@ -374,19 +352,35 @@ def _file_uid(entry):
     """
     return hashlib.md5(entry.path_lower.encode("utf-8")).hexdigest()[:10]
 
-def extract_pages(pdf_bytes):
+def extract_pages(pdf_bytes, progress=None):
+    """
+    progress: optional fn(stage, **counters), called after each page
+    """
     doc = fitz.open(stream=io.BytesIO(pdf_bytes), filetype="pdf")
     pages = []
+    ocr_count = 0
+
+    if progress:
+        progress("parse", pages_total=doc.page_count, pages_parsed=0, pages_ocr=0)
 
     for page_index in range(doc.page_count):
         page = doc[page_index]
         page_num = page_index + 1
 
-        text = page.get_text("text") or ""
+        with span("pdf.parse_page", page=page_num) as tags:
+            text = page.get_text("text") or ""
+
+            has_ocr = not text.strip()
+            if has_ocr:
+                pix = page.get_pixmap(dpi=200)
+                text = ocr_image_bytes(pix.tobytes("png"))
+                ocr_count += 1
+            tags["has_ocr"] = has_ocr
 
-        if not text.strip():
-            pix = page.get_pixmap(dpi=200)
-            text = ocr_image_bytes(pix.tobytes("png"))
+        inc("pages_parsed_total", ocr=has_ocr, filename=current_tags().get("filename"))
+
+        if progress:
+            progress("parse", pages_total=doc.page_count, pages_parsed=page_num, pages_ocr=ocr_count)
 
         text = clean_transcript_text(text)
         if not text:
@@ -395,12 +389,15 @@ def extract_pages(pdf_bytes):
         pages.append({
             "page": page_num,
             "text": text,
-            "has_ocr": False
+            "has_ocr": has_ocr
         })
 
+    doc.close()
     return pages
 
 def load_documents_from_dropbox_v2():
+    import dropbox
+
     dbx = get_dropbox_client()
     response = dbx.files_list_folder(FOLDER_PATH, recursive=True)
     docs = []
@@ -455,21 +452,31 @@ def load_documents_from_dropbox_v2():
     print(f"Loaded {len(docs)} chunks from {len(set(d['metadata']['source'] for d in docs))} PDFs")
     return docs
 
-def build_index(uploaded_file):
-    docs = load_documents_from_streamlit(uploaded_file)
+def ingest_pdf(pdf_bytes, filename, progress=None, batch_size=INSERT_BATCH_SIZE):
+    """
+    Parse (OCR when a page has no text layer), chunk and store one PDF.
+    progress: optional fn(stage, **counters), see ingest_jobs.make_progress
+    Return: number of chunks
+    """
+    with span("ingest.pdf", filename=filename, pdf_bytes=len(pdf_bytes)) as tags:
+        docs = load_documents_from_bytes(pdf_bytes, filename, progress)
 
-    if not docs:
-        print("❌ No content found in uploaded PDF.")
-        return
+        if not docs:
+            print("❌ No content found in uploaded PDF.")
+            tags["chunks"] = 0
+            return 0
 
-    texts = [doc["content"] for doc in docs]
-    metadatas = [doc["metadata"] for doc in docs]
+        texts = [doc["content"] for doc in docs]
+        metadatas = [doc["metadata"] for doc in docs]
 
-    # --- Lưu metadata vào SQLite ---
-    init_postgresql()
-    new_docs = [{"content": t, "metadata": m} for t, m in zip(texts, metadatas)]
-    insert_metadata(new_docs)
+        # --- Lưu metadata vào SQLite ---
+        init_postgresql()
+        new_docs = [{"content": t, "metadata": m} for t, m in zip(texts, metadatas)]
+        insert_metadata(new_docs, progress, batch_size)
+        tags["chunks"] = len(new_docs)
 
     print(f"✅ Indexed {len(new_docs)} chunks from {len(set(d['metadata']['source'] for d in docs))} PDFs.")
-   
+    return len(new_docs)
 
+def build_index(uploaded_file, progress=None):
+    return ingest_pdf(uploaded_file.read(), uploaded_file.name, progress)
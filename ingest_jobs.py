@@ -0,0 +1,435 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from db_utils import pooled_connection
+from telemetry import drain_metrics, flush as flush_spans, inc, merge_metrics, span
+
+INGEST_WORKERS = 1                # OCR + embeddings: one upload / batch parsed at a time
+EXTRACT_WORKERS = 2               # LLM calls of ingested files, off the ingest slot
+BATCH_PROCESSES = min(4, os.cpu_count() or 1)   # parse + chunk + insert, one file per process
+PROGRESS_FLUSH_INTERVAL = 1.0     # seconds between progress writes of a running job
+JOB_HEARTBEAT_SECONDS = 60        # unfinished jobs of this process touch updated_at
+JOB_STALE_SECONDS = 180           # unfinished job without a heartbeat -> process died
+# not finished yet; waiting_extract: ingested, queued for issue extraction
+OPEN_STATUSES = ("queued", "running", "waiting_extract")
+
+# stage -> (done column, total column)
+STAGE_COUNTERS = {
+    "parse": ("pages_parsed", "pages_total"),
+    "write": ("chunks_written", "chunks_total"),
+    "embed": ("chunks_embedded", "chunks_total"),
+    "extract": ("extract_done", "extract_total"),
+}
+STAGE_LABELS = {
+    "parse": "Parsing pages",
+    "write": "Writing chunks",
+    "embed": "Embedding chunks",
+    "extract": "Extracting issues",
+}
+PROGRESS_COLUMNS = [
+    "pages_total",
+    "pages_parsed",
+    "pages_ocr",
+    "chunks_total",
+    "chunks_written",
+    "chunks_embedded",
+    "extract_total",
+    "extract_done",
+    "issues_extracted",
+]
+
+INGEST_JOBS_DDL = f"""
+    CREATE TABLE IF NOT EXISTS ingest_jobs (
+        job_id TEXT PRIMARY KEY,
+        batch_id TEXT,
+        filename TEXT NOT NULL,
+        created_by TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        stage TEXT,
+        {", ".join(f"{c} INTEGER NOT NULL DEFAULT 0" for c in PROGRESS_COLUMNS)},
+        error TEXT,
+        created_at TIMESTAMPTZ DEFAULT now(),
+        started_at TIMESTAMPTZ,
+        stage_started_at TIMESTAMPTZ,
+        updated_at TIMESTAMPTZ DEFAULT now(),
+        finished_at TIMESTAMPTZ
+    )
+"""
+
+_ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+_extract_executor = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="extract")
+_tables_ready = False
+_tables_lock = threading.Lock()
+_live_jobs = set()   # open jobs owned by this process, kept fresh by the heartbeat
+_live_lock = threading.Lock()
+_heartbeat_thread = None
+
+def init_ingest_tables():
+    global _tables_ready
+
+    with _tables_lock:
+        if _tables_ready:
+            return
+        with pooled_connection() as conn:
+            conn.execute(INGEST_JOBS_DDL)
+            conn.execute("ALTER TABLE ingest_jobs ADD COLUMN IF NOT EXISTS batch_id TEXT")
+            # build_faiss_index reports "embed" progress
+            conn.execute("ALTER TABLE ingest_jobs ADD COLUMN IF NOT EXISTS chunks_embedded INTEGER NOT NULL DEFAULT 0")
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ingest_jobs_user_created
+                ON ingest_jobs (created_by, created_at DESC)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ingest_jobs_batch
+                ON ingest_jobs (batch_id)
+            """)
+            # open jobs nobody heartbeats any more: their process was restarted
+            conn.execute("""
+                UPDATE ingest_jobs
+                SET status = 'interrupted', finished_at = now(), updated_at = now()
+                WHERE status = ANY(%s) AND updated_at < now() - make_interval(secs => %s)
+            """, (list(OPEN_STATUSES), JOB_STALE_SECONDS))
+        _tables_ready = True
+
+# ========== HEARTBEAT ==========
+def _touch_jobs(job_ids):
+    with pooled_connection() as conn:
+        conn.execute("UPDATE ingest_jobs SET updated_at = now() WHERE job_id = ANY(%s)", (job_ids,))
+
+def _beat():
+    with _live_lock:
+        job_ids = list(_live_jobs)
+    if not job_ids:
+        return
+    try:
+        _touch_jobs(job_ids)
+    except Exception as e:
+        print(f"⚠️ Ingest job heartbeat failed: {e}")
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        _beat()
+
+def _track(job_id):
+    """
+    Keep an open job from reading back as interrupted while it waits or runs here.
+    """
+    global _heartbeat_thread
+
+    with _live_lock:
+        _live_jobs.add(job_id)
+        if _heartbeat_thread is None:
+            _heartbeat_thread = threading.Thread(target=_heartbeat_loop, daemon=True, name="ingest-heartbeat")
+            _heartbeat_thread.start()
+
+def _release(job_id):
+    with _live_lock:
+        _live_jobs.discard(job_id)
+
+def _update_job(job_id, stamps=(), **fields):
+    """
+    stamps: timestamp columns set to now() in the same statement
+    """
+    sets = [f"{name} = %s" for name in fields] + [f"{name} = now()" for name in stamps]
+    with pooled_connection() as conn:
+        conn.execute(
+            f"UPDATE ingest_jobs SET {', '.join(sets + ['updated_at = now()'])} WHERE job_id = %s",
+            list(fields.values()) + [job_id]
+        )
+
+def make_progress(job_id):
+    """
+    Progress callback for one job: progress(stage, **counters).
+    counters are PROGRESS_COLUMNS values (absolute, not increments).
+    Writes are throttled to PROGRESS_FLUSH_INTERVAL, stage changes are written at once.
+    """
+    state = {"stage": None, "flushed_at": 0.0}
+
+    def progress(stage, **counters):
+        unknown = set(counters) - set(PROGRESS_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown progress counters: {sorted(unknown)}")
+
+        now = time.monotonic()
+        if stage != state["stage"]:
+            state["stage"] = stage
+            _update_job(job_id, stamps=["stage_started_at"], stage=stage, **counters)
+            state["flushed_at"] = now
+            return
+
+        done_col, total_col = STAGE_COUNTERS.get(stage, (None, None))
+        total = counters.get(total_col)
+        finished = total is not None and counters.get(done_col, -1) >= total
+        if finished or now - state["flushed_at"] >= PROGRESS_FLUSH_INTERVAL:
+            _update_job(job_id, **counters)
+            state["flushed_at"] = now
+
+    return progress
+
+def _ingest_step(job_id, pdf_bytes, filename):
+    """
+    Parse, chunk and insert one file. Runs in a worker thread or a batch process.
+    Return: number of chunks
+    """
+    # heavy imports stay out of the Streamlit script path
+    from indexing import ingest_pdf
+
+    _update_job(job_id, stamps=["started_at"], status="running")
+    with span("job.ingest", job_id=job_id, filename=filename):
+        return ingest_pdf(pdf_bytes, filename, progress=make_progress(job_id))
+
+def _ingest_in_process(job_id, pdf_bytes, filename):
+    """
+    _ingest_step in a batch process. Metrics recorded here go back to the parent with
+    the result, or on the exception, for merge_metrics().
+    Return: (number of chunks, metrics)
+    """
+    try:
+        chunks = _ingest_step(job_id, pdf_bytes, filename)
+    except Exception as e:
+        e.metrics = drain_metrics()
+        raise
+    finally:
+        # pool workers exit without atexit hooks
+        flush_spans()
+    return chunks, drain_metrics()
+
+def _extract_step(job_id, filename):
+    from issue_extractor import run_issue_extraction
+
+    with span("job.extract", job_id=job_id, filename=filename):
+        run_issue_extraction(filename, progress=make_progress(job_id))
+
+def _fail_job(job_id, filename, error):
+    print(f"❌ Ingest job {job_id} ({filename}) failed: {error}")
+    _update_job(job_id, stamps=["finished_at"], status="failed", error=str(error))
+    _release(job_id)
+    inc("ingest_jobs_total", status="failed")
+
+def _finish_job(job_id):
+    _update_job(job_id, stamps=["finished_at"], status="done", stage=None)
+    _release(job_id)
+    inc("ingest_jobs_total", status="done")
+
+def _run_extract(job_id, filename):
+    try:
+        _update_job(job_id, status="running")
+        _extract_step(job_id, filename)
+    except Exception as e:
+        _fail_job(job_id, filename, e)
+    else:
+        _finish_job(job_id)
+
+def _after_ingest(job_id, filename, extract_issues):
+    """
+    Ingest done: hand the file to the extraction slot, so the ingest slot moves on.
+    Return: the extraction future, or None when the job is finished
+    """
+    if not extract_issues:
+        _finish_job(job_id)
+        return None
+    _update_job(job_id, status="waiting_extract", stage=None)
+    return _extract_executor.submit(_run_extract, job_id, filename)
+
+def _run_job(job_id, pdf_bytes, filename, extract_issues):
+    try:
+        _ingest_step(job_id, pdf_bytes, filename)
+    except Exception as e:
+        _fail_job(job_id, filename, e)
+    else:
+        _after_ingest(job_id, filename, extract_issues)
+
+def _create_job(filename, created_by, batch_id=None):
+    job_id = uuid.uuid4().hex
+    with pooled_connection() as conn:
+        conn.execute(
+            "INSERT INTO ingest_jobs (job_id, batch_id, filename, created_by) VALUES (%s, %s, %s, %s)",
+            (job_id, batch_id, filename, created_by)
+        )
+    return job_id
+
+def submit_ingest_job(pdf_bytes, filename, created_by=None, extract_issues=True):
+    """
+    Queue an upload for parsing, indexing and issue extraction in the background.
+    State lives in ingest_jobs, so the job outlives the browser session.
+    Return: job id
+    """
+    init_ingest_tables()
+    job_id = _create_job(filename, created_by)
+    _track(job_id)
+    _ingest_executor.submit(_run_job, job_id, pdf_bytes, filename, extract_issues)
+    return job_id
+
+# ========== BATCH INGEST ==========
+def _run_pool(jobs, extract_issues, processes, ctx):
+    """
+    One process pool over jobs. A worker that dies (fitz / Tesseract segfault, OOM kill)
+    breaks the pool and every unfinished future with it.
+    Return: (jobs left unfinished by a broken pool, extraction futures)
+    """
+    finished, extractions = set(), []
+    with ProcessPoolExecutor(max_workers=processes, mp_context=ctx) as pool:
+        futures = {
+            pool.submit(_ingest_in_process, job_id, pdf_bytes, filename): (job_id, filename)
+            for job_id, filename, pdf_bytes in jobs
+        }
+
+        for future in as_completed(futures):
+            job_id, filename = futures[future]
+            try:
+                _, metrics = future.result()
+            except BrokenProcessPool:
+                continue
+            except Exception as e:
+                merge_metrics(getattr(e, "metrics", None))
+                _fail_job(job_id, filename, e)
+                finished.add(job_id)
+                continue
+
+            finished.add(job_id)
+            merge_metrics(metrics)
+            extraction = _after_ingest(job_id, filename, extract_issues)
+            if extraction is not None:
+                extractions.append(extraction)
+
+    left = [job for job in jobs if job[0] not in finished]
+    if left and processes == 1:
+        # one file at a time: the first unfinished file is the one that killed the worker
+        job_id, filename, _ = left[0]
+        _fail_job(job_id, filename, "worker process crashed while parsing (segfault or out of memory)")
+        left = left[1:]
+    return left, extractions
+
+def _report_batch(batch_id, extractions):
+    wait(extractions)
+    summary = summarize_jobs(list_ingest_jobs(batch_id=batch_id, limit=None))
+    print(f"📦 Batch {batch_id} finished")
+    print(f"   • Files: {summary['done']}/{summary['files']} done, {summary['failed']} failed, {summary['skipped']} skipped")
+    print(f"   • Pages: {summary['pages']} ({summary['pages_ocr']} OCR)")
+    print(f"   • Chunks written: {summary['chunks_written']}")
+    print(f"   • Issues extracted: {summary['issues_extracted']}")
+    for failure in summary["failures"]:
+        print(f"   • ❌ {failure['filename']}: {failure['error']}")
+
+def _run_batch(batch_id, jobs, extract_issues, processes):
+    """
+    jobs: list of (job_id, filename, pdf_bytes)
+    Files go through parse/chunk/insert in parallel processes; each file that finishes
+    waits (status waiting_extract) for issue extraction (API-bound) on the extraction
+    slot, which frees this one for the next upload.
+    A failing file only fails its own job: when a worker process dies, the files it
+    left unfinished are resubmitted to a new pool, one at a time so the file that
+    crashes it again is the only one failed.
+    """
+    # spawn: the parent holds threads, an SSH tunnel and pooled sockets
+    ctx = multiprocessing.get_context("spawn")
+    pending, extractions = jobs, []
+    while pending:
+        pending, started = _run_pool(pending, extract_issues, processes, ctx)
+        extractions += started
+        if pending:
+            inc("ingest_pool_restarts_total")
+            print(f"⚠️ Batch {batch_id}: a worker process died, retrying {len(pending)} files one at a time")
+            processes = 1
+
+    # summary once the last extraction is done, without holding the ingest slot
+    threading.Thread(target=_report_batch, args=(batch_id, extractions), daemon=True).start()
+
+def submit_ingest_batch(files, created_by=None, extract_issues=True, processes=BATCH_PROCESSES):
+    """
+    Queue several uploads as one batch (one ingest_jobs row per file).
+    files: list of (filename, pdf_bytes); a repeated filename is ingested once, its other
+    copies get a "skipped" job so the batch reports them
+    Return: batch id (see list_ingest_jobs(batch_id=...) and summarize_jobs)
+    """
+    init_ingest_tables()
+    batch_id = uuid.uuid4().hex
+
+    seen, jobs = set(), []
+    for filename, pdf_bytes in files:
+        if filename in seen:
+            job_id = _create_job(filename, created_by, batch_id)
+            _update_job(
+                job_id, stamps=["finished_at"], status="skipped",
+                error="Another file of this batch has the same name; only the first one is ingested"
+            )
+            inc("ingest_jobs_total", status="skipped")
+            print(f"⚠️ Batch {batch_id}: {filename} appears more than once, ingesting the first copy")
+            continue
+        seen.add(filename)
+        job_id = _create_job(filename, created_by, batch_id)
+        _track(job_id)
+        jobs.append((job_id, filename, pdf_bytes))
+
+    _ingest_executor.submit(_run_batch, batch_id, jobs, extract_issues, max(1, min(processes, len(jobs))))
+    return batch_id
+
+def _job_from_row(row):
+    job = dict(row)
+    now = job.pop("db_now")
+
+    if job["status"] in OPEN_STATUSES and (now - job["updated_at"]).total_seconds() > JOB_STALE_SECONDS:
+        job["status"] = "interrupted"
+
+    job["eta_seconds"] = None
+    stage = job["stage"]
+    if job["status"] == "running" and stage in STAGE_COUNTERS and job["stage_started_at"]:
+        done_col, total_col = STAGE_COUNTERS[stage]
+        done, total = job[done_col], job[total_col]
+        elapsed = (now - job["stage_started_at"]).total_seconds()
+        if done and total > done:
+            job["eta_seconds"] = elapsed / done * (total - done)
+    return job
+
+def list_ingest_jobs(created_by=None, batch_id=None, limit=10):
+    """
+    Most recent jobs (of one user / one batch if given), newest first. limit=None: all
+    Return: list of dicts with the ingest_jobs columns + eta_seconds for the current stage
+    """
+    init_ingest_tables()
+    sql = "SELECT *, now() AS db_now FROM ingest_jobs WHERE TRUE"
+    params = []
+    if created_by is not None:
+        sql += " AND created_by = %s"
+        params.append(created_by)
+    if batch_id is not None:
+        sql += " AND batch_id = %s"
+        params.append(batch_id)
+    sql += " ORDER BY created_at DESC, filename LIMIT %s"
+    params.append(limit)
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            columns = [c.name for c in cur.description]
+            return [_job_from_row(zip(columns, r)) for r in cur.fetchall()]
+
+def summarize_jobs(jobs):
+    """
+    Aggregate of a batch (or any list of jobs from list_ingest_jobs).
+    """
+    summary = {
+        "files": len(jobs),
+        "queued": 0,
+        "running": 0,
+        "waiting_extract": 0,
+        "done": 0,
+        "failed": 0,
+        "interrupted": 0,
+        "skipped": 0,
+        "pages": sum(j["pages_total"] for j in jobs),
+        "pages_ocr": sum(j["pages_ocr"] for j in jobs),
+        "chunks_written": sum(j["chunks_written"] for j in jobs),
+        "issues_extracted": sum(j["issues_extracted"] for j in jobs),
+        "failures": [],
+    }
+    for job in jobs:
+        summary[job["status"]] = summary.get(job["status"], 0) + 1
+        if job["status"] == "failed":
+            summary["failures"].append({"filename": job["filename"], "error": job["error"]})
+    return summary
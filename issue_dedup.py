@@ -0,0 +1,268 @@
+"""
+Overlap-aware dedup of extracted issues within a file.
+
+smart_chunk_text repeats CHUNK_OVERLAP characters of the previous chunk and Q/A pairs often
+span chunks, so neighbouring chunks quote the same testimony, whole or one quote inside the
+other. dedup_file() groups those issues and keeps one canonical row per group:
+
+    deposition_issues.duplicate_of   canonical issue_id (NULL: canonical or unique issue)
+    issue_sources                    canonical issue_id -> every member issue, chunk and page
+
+Quotes are normalized to word shingles. Candidate pairs come from MinHash LSH buckets
+(near-duplicates anywhere in the file) and from issues of the same or adjacent chunks
+(a short quote inside a long one has a low Jaccard score, but the overlap puts them side
+by side). Each candidate is confirmed on the exact shingle sets. Confirmed pairs chain
+(two different answers can each contain the same stock phrase), so every member of a
+connected group is checked again against its canonical: a member the canonical doesn't
+contain starts a canonical of its own. Cost is linear in the shingles of the file:
+buckets are paired along a chain, never all-pairs.
+Every run recomputes the file, so re-extraction can't leave stale links.
+"""
+import re
+import time
+import zlib
+import numpy as np
+from telemetry import inc, span
+
+SHINGLE_SIZE = 3              # words per shingle
+NUM_PERM = 64                 # MinHash signature length
+LSH_BANDS = 16                # 16 bands x 4 rows: pairs from ~0.5 Jaccard up collide
+MIN_LSH_SHINGLES = 5          # shorter quotes ("No, sir.") skip LSH, merge only identical neighbours
+NEIGHBOUR_CHUNKS = 1          # chunks on either side, in (page, chunk_index) order
+CONTAINMENT_THRESHOLD = 0.8   # |A ∩ B| / min(|A|, |B|) of the shingle sets
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+DEDUP_DDL = [
+    "ALTER TABLE deposition_issues ADD COLUMN IF NOT EXISTS duplicate_of TEXT",
+    """
+    CREATE TABLE IF NOT EXISTS issue_sources (
+        issue_id TEXT,
+        source_issue_id TEXT,
+        filename TEXT,
+        chunk_id TEXT,
+        page INTEGER,
+        PRIMARY KEY (issue_id, source_issue_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_issue_sources_file ON issue_sources (filename)",
+]
+
+def init_dedup_tables(cur):
+    for ddl in DEDUP_DDL:
+        cur.execute(ddl)
+
+# ========== SHINGLES / MINHASH ==========
+def shingles(text):
+    """
+    Return: set of crc32 hashes of the quote's word k-grams (lowercase, punctuation and
+    Q./A. markers ignored); a quote shorter than SHINGLE_SIZE words is one shingle
+    """
+    words = [w for w in _WORD_RE.findall((text or "").lower()) if w not in ("q", "a")]
+    if len(words) < SHINGLE_SIZE:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+    return {
+        zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode())
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+def minhash(shingle_set):
+    h = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set)) % _PRIME
+    return ((_PERM_A[:, None] * h[None, :] + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+def _lsh_pairs(sets):
+    """
+    Candidate pairs of quotes sharing an LSH band. Bucket members are paired along a chain
+    ordered by size, so a bucket of n quotes costs n - 1 pairs.
+    """
+    rows = NUM_PERM // LSH_BANDS
+    buckets = {}
+    for i, s in enumerate(sets):
+        if len(s) < MIN_LSH_SHINGLES:
+            continue
+        sig = minhash(s)
+        for band in range(LSH_BANDS):
+            key = (band, sig[band * rows:(band + 1) * rows].tobytes())
+            buckets.setdefault(key, []).append(i)
+
+    pairs = set()
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda i: len(sets[i]))
+        pairs.update(zip(members, members[1:]))
+    return pairs
+
+def _neighbour_pairs(positions):
+    """
+    Candidate pairs of issues from the same chunk or up to NEIGHBOUR_CHUNKS chunks apart.
+    positions: chunk position of each issue in file order
+    """
+    by_chunk = {}
+    for i, pos in enumerate(positions):
+        by_chunk.setdefault(pos, []).append(i)
+
+    pairs = set()
+    for pos, members in by_chunk.items():
+        pairs.update((a, b) for n, a in enumerate(members) for b in members[n + 1:])
+        for offset in range(1, NEIGHBOUR_CHUNKS + 1):
+            pairs.update((a, b) for a in members for b in by_chunk.get(pos + offset, []))
+    return pairs
+
+def _same_testimony(sa, sb):
+    if min(len(sa), len(sb)) < MIN_LSH_SHINGLES:
+        # short answers repeat for real ("No, sir."): merge only identical quotes
+        return sa == sb
+    return len(sa & sb) / min(len(sa), len(sb)) >= CONTAINMENT_THRESHOLD
+
+def _contains(canonical, member):
+    if min(len(canonical), len(member)) < MIN_LSH_SHINGLES:
+        return canonical == member
+    return len(canonical & member) / len(member) >= CONTAINMENT_THRESHOLD
+
+def find_duplicates(issues):
+    """
+    issues: list of dicts with issue_id, quoted_text, chunk_pos, page, risk_rank
+    Return: (groups as lists of indexes into issues with the canonical first, candidate pairs)
+    Canonical: a quote found in the transcript (quote_verify.py), then the longest quote (the
+    container), then highest risk, then the first page. Every other member of a group is
+    contained in its canonical.
+    """
+    sets = [shingles(it["quoted_text"]) for it in issues]
+    candidates = _lsh_pairs(sets) | _neighbour_pairs([it["chunk_pos"] for it in issues])
+
+    parent = list(range(len(issues)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in candidates:
+        if sets[a] and sets[b] and _same_testimony(sets[a], sets[b]):
+            parent[find(a)] = find(b)
+
+    components = {}
+    for i in range(len(issues)):
+        components.setdefault(find(i), []).append(i)
+
+    def rank(i):
+        it = issues[i]
+        return (it.get("unmatched", False), -len(sets[i]), it["risk_rank"], it["page"] if it["page"] is not None else 0, it["issue_id"])
+
+    # split chains: each member joins the first canonical (in rank order) that contains it
+    groups = []
+    for component in components.values():
+        if len(component) < 2:
+            continue
+        split = []
+        for i in sorted(component, key=rank):
+            for group in split:
+                if _contains(sets[group[0]], sets[i]):
+                    group.append(i)
+                    break
+            else:
+                split.append([i])
+        groups.extend(g for g in split if len(g) > 1)
+
+    return groups, len(candidates)
+
+# ========== DB ==========
+def dedup_file(filename):
+    """
+    Recompute duplicate_of / issue_sources for one file.
+    Return: {"file", "issues", "groups", "duplicates", "candidates", "seconds"}
+    """
+    from db_utils import RISK_RANK_SQL, bump_data_version, issues_scope, pooled_connection
+
+    started = time.perf_counter()
+    with span("dedup.file", filename=filename) as tags, pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT
+                    d.issue_id,
+                    d.chunk_id,
+                    d.page,
+                    d.quoted_text,
+                    {RISK_RANK_SQL},
+                    d.quote_status = 'unmatched'
+                FROM deposition_issues d
+                WHERE d.filename = %s
+            """, (filename,))
+            rows = cur.fetchall()
+
+            # chunk position in file order: adjacent chunks differ by 1 across page breaks too
+            cur.execute("""
+                SELECT chunk_id
+                FROM chunks
+                WHERE filename = %s
+                ORDER BY page, chunk_index
+            """, (filename,))
+            positions = {chunk_id: pos for pos, (chunk_id,) in enumerate(cur.fetchall())}
+            for _, chunk_id, *_ in rows:
+                # chunk gone: a position no other chunk is next to
+                positions.setdefault(chunk_id, -(NEIGHBOUR_CHUNKS + 1) * (len(positions) + 1))
+
+            issues = [
+                {
+                    "issue_id": issue_id,
+                    "chunk_id": chunk_id,
+                    "page": page,
+                    "quoted_text": quoted_text,
+                    "risk_rank": risk_rank,
+                    "unmatched": bool(unmatched),
+                    "chunk_pos": positions[chunk_id],
+                }
+                for issue_id, chunk_id, page, quoted_text, risk_rank, unmatched in rows
+            ]
+            groups, candidates = find_duplicates(issues)
+
+            duplicate_ids, canonical_ids, sources = [], [], []
+            for group in groups:
+                canonical = issues[group[0]]["issue_id"]
+                for i in group:
+                    it = issues[i]
+                    sources.append((canonical, it["issue_id"], filename, it["chunk_id"], it["page"]))
+                    if i != group[0]:
+                        duplicate_ids.append(it["issue_id"])
+                        canonical_ids.append(canonical)
+
+            cur.execute("""
+                UPDATE deposition_issues
+                SET duplicate_of = NULL
+                WHERE filename = %s AND duplicate_of IS NOT NULL
+            """, (filename,))
+            cur.execute("DELETE FROM issue_sources WHERE filename = %s", (filename,))
+            if duplicate_ids:
+                cur.execute("""
+                    UPDATE deposition_issues d
+                    SET duplicate_of = u.canonical
+                    FROM unnest(%s::text[], %s::text[]) AS u(issue_id, canonical)
+                    WHERE d.issue_id = u.issue_id
+                """, (duplicate_ids, canonical_ids))
+                cur.executemany("""
+                    INSERT INTO issue_sources (issue_id, source_issue_id, filename, chunk_id, page)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, sources)
+
+            # invalidate cached issue pages / facets in the review app
+            bump_data_version(cur, issues_scope(filename))
+
+        tags.update(issues=len(issues), groups=len(groups), duplicates=len(duplicate_ids))
+
+    inc("issues_deduplicated_total", len(duplicate_ids), filename=filename)
+    result = {
+        "file": filename,
+        "issues": len(issues),
+        "groups": len(groups),
+        "duplicates": len(duplicate_ids),
+        "candidates": candidates,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    print(f"🧹 {filename}: {len(duplicate_ids)} duplicate issues merged into {len(groups)} canonical issues")
+    return result
@@ -1,32 +1,40 @@
 # backend/issue_extractor.py
-import tempfile
 import uuid, json, re, os
-import psycopg
-from anthropic import Anthropic
-import streamlit as st
+import hashlib
+import threading
+import time
 from tqdm import tqdm  
-from sshtunnel import SSHTunnelForwarder
-
-SSH_HOST = st.secrets["ssh"]["SSH_HOST"]
-SSH_PORT = st.secrets["ssh"]["SSH_PORT"]
-SSH_USER = st.secrets["ssh"]["SSH_USER"]
-SSH_PRIVATE_KEY = st.secrets["ssh"]["SSH_PRIVATE_KEY"]
-# SSH_KEY = os.path.join(
-#     os.environ["USERPROFILE"],
-#     ".ssh",
-#     st.secrets["ssh"]["SSH_KEY_PATH"]
-# )
-DB_NAME = st.secrets["database"]["DB_NAME"]
-DB_USER = st.secrets["database"]["DB_USER"]
-DB_PORT = st.secrets["database"]["DB_PORT"]
-DB_HOST = st.secrets["database"]["DB_HOST"]
-DB_PASSWORD = st.secrets["database"]["DB_PASSWORD"]
-
-ANTHROPIC_MODEL = st.secrets["claude"]["anthropic_model"]
-ANTHROPIC_API_KEY = st.secrets["claude"]["api_key"]
+from config import get_config
+from db_utils import DATA_VERSIONS_DDL, ISSUE_INDEXES_DDL, bump_data_version, cached_query, issues_scope, pooled_connection
+from extraction_ledger import call_cost, chunk_profile, init_ledger_tables, project, record_call, usage_fields
+from issue_dedup import dedup_file, init_dedup_tables
+from quote_verify import init_verify_tables, verify_file
+from telemetry import inc, span
+
 # DB_PATH = "data/faiss_store/metadata.db"
 
-client = Anthropic(api_key=ANTHROPIC_API_KEY)
+_client = None
+_client_lock = threading.Lock()
+_tables_ready = False
+_tables_lock = threading.Lock()
+
+def get_anthropic_model():
+    return get_config("claude", "anthropic_model")
+
+def get_client():
+    """
+    Anthropic client, built on first use (not at import).
+    """
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            from anthropic import Anthropic
+            _client = Anthropic(
+                api_key=get_config("claude", "api_key"),
+                base_url=get_config("claude", "base_url", None),  # None: api.anthropic.com
+            )
+        return _client
 
 PROMPT = """
     You are a legal analyst for U.S. mass tort litigation. Review the deposition excerpt and extract only statements useful to plaintiffs.
@@ -37,20 +45,7 @@ PROMPT = """
 
     Focus on statements relevant to failure to warn, causation, exposure, corporate knowledge, or regulatory compliance, especially those impacting Daubert admissibility such as methodology, data gaps, uncertainty, or limitations.
 
-    If nothing relevant appears, return an empty issues array.
-
-    Respond with only valid JSON and nothing else, using this structure exactly:
-
-    {
-        "issues": [
-            {
-            "issue_type": "failure_to_warn | causation | exposure_pathway | corporate_knowledge | regulatory_compliance | alternative_causes | damages_injury_timeline | other",
-            "quoted_text": "exact quote from the transcript",
-            "legal_relevance": "brief legal relevance",
-            "risk_level": "high | medium | low"
-            }
-        ]
-    }
+    Record every statement with the record_issues tool, one item per statement. If nothing relevant appears, call it with an empty issues array.
 """
 
 REQUIRED_KEYS = {
@@ -60,86 +55,422 @@ REQUIRED_KEYS = {
     "risk_level"
 }
 
+ISSUE_TYPES = [
+    "failure_to_warn",
+    "causation",
+    "exposure_pathway",
+    "corporate_knowledge",
+    "regulatory_compliance",
+    "alternative_causes",
+    "damages_injury_timeline",
+    "other",
+]
+
+# forced tool call: the API returns the issues as schema-shaped tool input, not free text
+EXTRACTION_TOOL = {
+    "name": "record_issues",
+    "description": "Record the statements from the deposition excerpt that are useful to plaintiffs.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "issues": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "issue_type": {"type": "string", "enum": ISSUE_TYPES},
+                        "quoted_text": {"type": "string", "description": "exact quote from the transcript"},
+                        "legal_relevance": {"type": "string", "description": "brief legal relevance"},
+                        "risk_level": {"type": "string", "enum": ["high", "medium", "low"]},
+                    },
+                    "required": sorted(REQUIRED_KEYS),
+                },
+            },
+        },
+        "required": ["issues"],
+    },
+}
+
+# stamped on extraction_calls, deposition_issues and issue_progress rows;
+# changes whenever PROMPT or the tool schema is edited (see reextraction.py)
+PROMPT_VERSION = hashlib.sha256(
+    (PROMPT + json.dumps(EXTRACTION_TOOL, sort_keys=True)).encode("utf-8")
+).hexdigest()[:12]
+
+MAX_TOKENS = 1024
+MAX_CONTINUATIONS = 2   # follow-up calls after a reply cut off at MAX_TOKENS
+
+CONTINUE_PROMPT = (
+    "Your record_issues call was cut off at the output limit after {n} complete issues, recorded above. "
+    "Call record_issues again with only the remaining statements of the transcript, if any."
+)
+
 def extract_json(text):
     match = re.search(r"\{.*\}", text, re.S)
     return match.group(0) if match else None
 
 def init_issue_tables():
-    
-    # --- write SSH key to temp file ---
-    with tempfile.NamedTemporaryFile(delete=False) as key_file:
-        key_file.write(SSH_PRIVATE_KEY.encode())
-        ssh_key_path = key_file.name
-
-    # --- SSH Tunnel ---
-    tunnel = SSHTunnelForwarder(
-        (SSH_HOST, SSH_PORT),
-        ssh_username=SSH_USER,
-        ssh_pkey=ssh_key_path,
-        allow_agent=False,
-        host_pkey_directories=[],
-        remote_bind_address=(DB_HOST, DB_PORT),
-    )
-    
-    tunnel.start()
+    global _tables_ready
+
+    with _tables_lock:
+        if _tables_ready:
+            return
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+
+                # track chunk đã extract hay chưa
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS issue_progress (
+                        chunk_id TEXT PRIMARY KEY,
+                        filename TEXT,
+                        extracted INTEGER DEFAULT 0
+                    )
+                """)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS deposition_issues (
+                        issue_id TEXT PRIMARY KEY,
+                        chunk_id TEXT,
+                        filename TEXT,
+                        page INTEGER,
+                        speaker_role TEXT,
+                        issue_type TEXT,
+                        quoted_text TEXT,
+                        legal_relevance TEXT,
+                        risk_level TEXT,
+                        pdf_link TEXT
+                    )
+                """)
+
+                # prompt / model stamps: which chunks are out of date (reextraction.py)
+                cur.execute("""
+                    ALTER TABLE deposition_issues
+                        ADD COLUMN IF NOT EXISTS prompt_version TEXT,
+                        ADD COLUMN IF NOT EXISTS model TEXT
+                """)
+                cur.execute("""
+                    ALTER TABLE issue_progress
+                        ADD COLUMN IF NOT EXISTS prompt_version TEXT,
+                        ADD COLUMN IF NOT EXISTS model TEXT,
+                        ADD COLUMN IF NOT EXISTS extracted_at TIMESTAMPTZ
+                """)
+                # cascade (triage.py): score of the triage model, NULL = sent straight to the primary model
+                cur.execute("""
+                    ALTER TABLE issue_progress
+                        ADD COLUMN IF NOT EXISTS triage_model TEXT,
+                        ADD COLUMN IF NOT EXISTS triage_score DOUBLE PRECISION
+                """)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_deposition_issues_chunk
+                    ON deposition_issues (chunk_id)
+                """)
+                cur.execute(DATA_VERSIONS_DDL)
+
+                # filters / sort / keyset pages of the review tab
+                for ddl in ISSUE_INDEXES_DDL:
+                    cur.execute(ddl)
+
+                # tokens / latency / outcome of every messages.create
+                init_ledger_tables(cur)
+
+                # merged duplicates of overlapping chunks
+                init_dedup_tables(cur)
+
+                # quote found verbatim / fuzzy / not at all in the transcript
+                init_verify_tables(cur)
+        _tables_ready = True
+
+def new_call(chunk_id, filename, content, **fields):
+    """
+    Ledger row (extraction_calls) for one chunk, filled in by call_extraction.
+    """
+    return {
+        "chunk_id": chunk_id,
+        "filename": filename,
+        "model": get_anthropic_model(),
+        "prompt_version": PROMPT_VERSION,
+        "stage": "extract",
+        "content_chars": len(content),
+        "parse_status": "api_error",
+        **fields,
+    }
 
+class IssueStreamParser:
+    """
+    Incremental parse of the tool input {"issues": [{...}, ...]} as input_json deltas arrive.
+    Each issue object is decoded once its closing brace streams in, so a reply cut off at
+    MAX_TOKENS still yields every issue completed before the cut.
+    """
+    ISSUE_DEPTH = 3   # { "issues": [ { ...
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.current = []
+        self.issues = []
+        self.errors = 0
+
+    def feed(self, text):
+        for ch in text:
+            if self.depth >= self.ISSUE_DEPTH:
+                self.current.append(ch)
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+                if self.depth == self.ISSUE_DEPTH:
+                    self.current = [ch]
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == self.ISSUE_DEPTH - 1 and self.current:
+                    self._finish("".join(self.current))
+                    self.current = []
+
+    def _finish(self, text):
+        try:
+            issue = json.loads(text)
+        except ValueError:
+            self.errors += 1
+            return
+        if isinstance(issue, dict) and REQUIRED_KEYS.issubset(issue):
+            self.issues.append(issue)
+        else:
+            self.errors += 1
+
+def _stream_round(messages, call):
+    """
+    One streamed messages.create with the forced record_issues call. Adds its usage,
+    retries and latency to call.
+    Return: (issues, stop_reason, tool_use_id)
+    """
+    started = time.perf_counter()
+    parser = IssueStreamParser()
+    text, tool_use_id, stop_reason = [], None, None
+    usage = {"input_tokens": 0, "output_tokens": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
     try:
-        conn = psycopg.connect(
-            host=DB_HOST,
-            port=tunnel.local_bind_port,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            connect_timeout=5,
+        raw = get_client().messages.with_raw_response.create(
+            model=call["model"],
+            max_tokens=MAX_TOKENS,
+            temperature=0,
+            tools=[EXTRACTION_TOOL],
+            tool_choice={"type": "tool", "name": EXTRACTION_TOOL["name"]},
+            messages=messages,
+            stream=True,
         )
-        
-        with conn.cursor() as cur:
+        call["retries"] += getattr(raw, "retries_taken", 0)
+
+        for event in raw.parse():
+            if event.type == "message_start":
+                usage.update(usage_fields(event.message))
+            elif event.type == "content_block_start" and event.content_block.type == "tool_use":
+                tool_use_id = event.content_block.id
+            elif event.type == "content_block_delta":
+                if event.delta.type == "input_json_delta":
+                    parser.feed(event.delta.partial_json)
+                elif event.delta.type == "text_delta":
+                    text.append(event.delta.text)
+            elif event.type == "message_delta":
+                stop_reason = event.delta.stop_reason
+                usage["output_tokens"] = event.usage.output_tokens
+    finally:
+        call["latency_ms"] += (time.perf_counter() - started) * 1000
+        for key, value in usage.items():
+            call[key] += value or 0
+        call["stop_reason"] = stop_reason
+
+    issues = parser.issues
+    if tool_use_id is None:
+        # no tool call (should not happen with tool_choice): fall back to JSON in the text
+        json_text = extract_json("".join(text))
+        if not json_text:
+            call["parse_status"] = "no_json"
+            raise ValueError("No tool call or JSON found")
+        try:
+            data = json.loads(json_text)
+        except ValueError:
+            call["parse_status"] = "invalid_json"
+            raise
+        issues = [it for it in data.get("issues", []) if isinstance(it, dict) and REQUIRED_KEYS.issubset(it)]
+    elif parser.errors:
+        inc("extract_invalid_issues_total", parser.errors)
+        if not issues and stop_reason != "max_tokens":
+            call["parse_status"] = "invalid_json"
+            raise ValueError(f"{parser.errors} malformed issues in the tool input")
+
+    return issues, stop_reason, tool_use_id
+
+def call_extraction(content, call):
+    """
+    Streamed, schema-constrained extraction of a chunk. A reply cut off at MAX_TOKENS keeps
+    its complete issues and is continued (up to MAX_CONTINUATIONS follow-ups) instead of
+    re-running the chunk. Fills call with usage, latency, retries, continuations, cost,
+    stop reason and parse status; raises if the call or the parse fails.
+    Return: list of issues with every REQUIRED_KEYS field
+    """
+    call.update(
+        latency_ms=0.0, retries=0, continuations=0,
+        input_tokens=0, output_tokens=0, cache_creation_input_tokens=0, cache_read_input_tokens=0,
+    )
+    messages = [{"role": "user", "content": PROMPT + "\n\nTranscript:\n" + content}]
+    issues, seen = [], set()
+    parsed = False
 
-            # track chunk đã extract hay chưa
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS issue_progress (
-                    chunk_id TEXT PRIMARY KEY,
-                    filename TEXT,
-                    extracted INTEGER DEFAULT 0
-                )
-            """)
-
-            conn.commit()
-            conn.close()
-            
+    try:
+        with span("llm.messages_create", model=call["model"]) as llm_tags:
+            for round_no in range(MAX_CONTINUATIONS + 1):
+                new, stop_reason, tool_use_id = _stream_round(messages, call)
+                for it in new:
+                    if it["quoted_text"] not in seen:   # a continuation may repeat the last issue
+                        seen.add(it["quoted_text"])
+                        issues.append(it)
+
+                if stop_reason != "max_tokens" or tool_use_id is None:
+                    break
+                if round_no == MAX_CONTINUATIONS:
+                    inc("extract_truncated_total")
+                    print(f"⚠️ chunk {call.get('chunk_id')}: still truncated after "
+                          f"{MAX_CONTINUATIONS} continuations, keeping {len(issues)} issues")
+                    break
+
+                call["continuations"] += 1
+                inc("extract_continuations_total")
+                messages += [
+                    {"role": "assistant", "content": [{
+                        "type": "tool_use", "id": tool_use_id, "name": EXTRACTION_TOOL["name"],
+                        "input": {"issues": new},
+                    }]},
+                    {"role": "user", "content": [{
+                        "type": "tool_result", "tool_use_id": tool_use_id,
+                        "content": CONTINUE_PROMPT.format(n=len(new)),
+                    }]},
+                ]
+
+            llm_tags.update(
+                input_tokens=call["input_tokens"],
+                output_tokens=call["output_tokens"],
+                continuations=call["continuations"],
+            )
+        parsed = True
     finally:
-        tunnel.stop()
+        call["cost_usd"] = call_cost(
+            call["model"],
+            call["input_tokens"],
+            call["output_tokens"],
+            call["cache_creation_input_tokens"],
+            call["cache_read_input_tokens"],
+        )
+        inc("llm_tokens_total", call["input_tokens"], direction="input")
+        inc("llm_tokens_total", call["output_tokens"], direction="output")
+        inc("llm_retries_total", call["retries"])
+        # parse failure rate: llm_calls_total{status=~"no_json|invalid_json"} / llm_calls_total
+        inc("llm_calls_total", status="ok" if parsed else call["parse_status"])
+
+    return issues
+
+def get_extraction_backlog(filenames=None):
+    """
+    Files with chunks not yet sent for issue extraction.
+    Return: list of (filename, pending chunks), largest first
+    """
+    init_issue_tables()
 
-def run_issue_extraction(filename: str):
+    sql = """
+        SELECT f.filename, COUNT(*) AS pending
+        FROM chunks f
+        LEFT JOIN issue_progress p
+            ON f.chunk_id = p.chunk_id
+        WHERE (p.extracted IS NULL OR p.extracted = 0)
+    """
+    params = []
+    if filenames:
+        sql += " AND f.filename = ANY(%s)"
+        params.append(list(filenames))
+    sql += " GROUP BY f.filename ORDER BY pending DESC, f.filename"
+
+    with pooled_connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+def project_file_extraction(filename):
+    """
+    Projected tokens, cost and time of the file's pending chunks (see extraction_ledger.project).
+    """
     init_issue_tables()
 
-    # --- write SSH key to temp file ---
-    with tempfile.NamedTemporaryFile(delete=False) as key_file:
-        key_file.write(SSH_PRIVATE_KEY.encode())
-        ssh_key_path = key_file.name
-
-    # --- SSH Tunnel ---
-    tunnel = SSHTunnelForwarder(
-        (SSH_HOST, SSH_PORT),
-        ssh_username=SSH_USER,
-        ssh_pkey=ssh_key_path,
-        allow_agent=False,
-        host_pkey_directories=[],
-        remote_bind_address=(DB_HOST, DB_PORT),
-    )
-    
-    tunnel.start()
+    with pooled_connection() as conn:
+        chunks, chars = conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(length(f.content)), 0)
+            FROM chunks f
+            LEFT JOIN issue_progress p
+                ON f.chunk_id = p.chunk_id
+            WHERE f.filename = %s
+            AND (p.extracted IS NULL OR p.extracted = 0)
+        """, (filename,)).fetchone()
+
+    return project(chunks, chars, get_anthropic_model(), len(PROMPT))
+
+def project_upload_extraction(pages):
+    """
+    Same projection for PDFs not ingested yet, from their page count.
+    """
+    init_issue_tables()
 
-    try:
-        conn = psycopg.connect(
-            host=DB_HOST,
-            port=tunnel.local_bind_port,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            connect_timeout=5,
-        )
-        
+    # AVG over every chunk: recomputed only when an ingest bumps the chunks version
+    chunks_per_page, chunk_chars = cached_query("chunks", "chunk_profile", chunk_profile)
+    chunks = round(pages * chunks_per_page)
+    return project(chunks, chunks * chunk_chars, get_anthropic_model(), len(PROMPT))
+
+def mark_extracted(cur, chunk_id, filename, call, triage=None, score=None):
+    """
+    Chunk done: issue_extracted flag + issue_progress row stamped with prompt / model / triage score.
+    call: the primary call, or triage.triage_stamp() for a chunk the triage model dropped
+    """
+    cur.execute("""
+        UPDATE chunks
+        SET issue_extracted = 1
+        WHERE chunk_id = %s
+    """, (chunk_id,))
+
+    cur.execute("""
+        INSERT INTO issue_progress
+            (chunk_id, filename, extracted, prompt_version, model, extracted_at, triage_model, triage_score)
+        VALUES (%s, %s, 1, %s, %s, now(), %s, %s)
+        ON CONFLICT (chunk_id) DO UPDATE
+        SET extracted = 1,
+            prompt_version = EXCLUDED.prompt_version,
+            model = EXCLUDED.model,
+            extracted_at = EXCLUDED.extracted_at,
+            triage_model = EXCLUDED.triage_model,
+            triage_score = EXCLUDED.triage_score
+    """, (
+        chunk_id,
+        filename,
+        call["prompt_version"],
+        call["model"],
+        triage["model"] if triage and score is not None else None,
+        score,
+    ))
+
+def run_issue_extraction(filename: str, progress=None, limit=None, triage=None):
+    """
+    progress: optional fn(stage, **counters), called after each chunk
+    limit: max chunks handled in this run (the rest stay pending)
+    triage: cascade settings (triage.triage_settings); None = from the settings, False = off
+    """
+    init_issue_tables()
+
+    if triage is None:
+        from triage import triage_settings
+        triage = triage_settings()
+
+    with span("extract.file", filename=filename) as file_tags, pooled_connection() as conn:
         with conn.cursor() as cur:
             # 🔍 Lấy chunk CHƯA extract cho file được chọn
             cur.execute("""
@@ -154,7 +485,9 @@ def run_issue_extraction(filename: str):
                     ON f.chunk_id = p.chunk_id
                 WHERE f.filename = %s
                 AND (p.extracted IS NULL OR p.extracted = 0)
-            """, (filename,))
+                ORDER BY f.page, f.chunk_index
+                LIMIT %s
+            """, (filename, limit))
             rows = cur.fetchall()
 
             total = len(rows)
@@ -164,94 +497,123 @@ def run_issue_extraction(filename: str):
             print(f"🚀 Starting issue extraction for file '{filename}'")
             print(f"   • Chunks to process: {total}")
 
-            for chunk_id, content, page, filename, pdf_link in tqdm(
+            if progress:
+                progress("extract", extract_total=total, extract_done=0, issues_extracted=0)
+
+            # cascade: chunks the triage model scores below threshold skip the primary model
+            scores = {}
+            dropped = 0
+            if triage and rows:
+                from triage import triage_chunks, triage_stamp
+                scores = triage_chunks([(r[0], r[1]) for r in rows], triage, filename)
+                print(f"   • Triage ({triage['model']}, threshold {triage['threshold']}): "
+                      f"{sum(1 for r in rows if scores.get(r[0], 1.0) >= triage['threshold'])}/{total} escalated")
+
+            for done, (chunk_id, content, page, filename, pdf_link) in enumerate(tqdm(
                 rows,
                 total=total,
                 desc=f"Extracting {filename}",
                 unit="chunk"
-            ):
-                try:
-                    resp = client.messages.create(
-                        model=ANTHROPIC_MODEL,
-                        max_tokens=1024,
-                        temperature=0,
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": PROMPT + "\n\nTranscript:\n" + content
-                            }
-                        ]
-                    )
-
-                    raw_text = resp.content[0].text
-                    json_text = extract_json(raw_text)
-                    if not json_text:
-                        raise ValueError("No JSON found")
-
-                    data = json.loads(json_text)
-                    issues = data.get("issues", [])
-
-                    for it in issues:
-                        if not REQUIRED_KEYS.issubset(it):
-                            continue
+            ), start=1):
+                call = new_call(chunk_id, filename, content)
+                score = scores.get(chunk_id)
+
+                if score is not None and score < triage["threshold"]:
+                    # không có testimony liên quan: done with 0 issues, no primary call,
+                    # stamped with the triage prompt / model that made the decision
+                    try:
+                        mark_extracted(cur, chunk_id, filename, triage_stamp(triage), triage, score)
+                        bump_data_version(cur, "chunks", issues_scope(filename))
+                        conn.commit()
+                        dropped += 1
+                    except Exception as e:
+                        conn.rollback()
+                        failed += 1
+                        print(f"\n[ERROR] chunk_id={chunk_id}: {e}")
+                    if progress:
+                        progress("extract", extract_total=total, extract_done=done, issues_extracted=extracted)
+                    continue
 
-                        cur.execute("""
-                            INSERT INTO deposition_issues
-                            (
-                                issue_id,
+                try:
+                    with span("extract.chunk", filename=filename, chunk_id=chunk_id, page=page) as tags:
+                        issues = call_extraction(content, call)
+                        call["parse_status"] = "db_error"
+
+                        for it in issues:
+                            cur.execute("""
+                                INSERT INTO deposition_issues
+                                (
+                                    issue_id,
+                                    chunk_id,
+                                    filename,
+                                    page,
+                                    issue_type,
+                                    quoted_text,
+                                    legal_relevance,
+                                    risk_level,
+                                    pdf_link,
+                                    prompt_version,
+                                    model
+                                )
+                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                            """, (
+                                str(uuid.uuid4()),
                                 chunk_id,
                                 filename,
                                 page,
-                                issue_type,
-                                quoted_text,
-                                legal_relevance,
-                                risk_level,
-                                pdf_link
-                            )
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """, (
-                            str(uuid.uuid4()),
-                            chunk_id,
-                            filename,
-                            page,
-                            it["issue_type"],
-                            it["quoted_text"],
-                            it["legal_relevance"],
-                            it["risk_level"],
-                            pdf_link
-                        ))
-
-                        extracted += 1
-
-                    cur.execute("""
-                        UPDATE chunks
-                        SET issue_extracted = 1
-                        WHERE chunk_id = %s
-                    """, (chunk_id,))
-
-                    cur.execute("""
-                        INSERT INTO issue_progress
-                            (chunk_id, filename, extracted)
-                        VALUES (%s, %s, 1)
-                    """, (chunk_id, filename))
-
-                    conn.commit() 
+                                it["issue_type"],
+                                it["quoted_text"],
+                                it["legal_relevance"],
+                                it["risk_level"],
+                                pdf_link,
+                                call["prompt_version"],
+                                call["model"]
+                            ))
+
+                        mark_extracted(cur, chunk_id, filename, call, triage, score)
+
+                        # invalidate cached file stats / issues in the review app
+                        bump_data_version(cur, "chunks", issues_scope(filename))
+
+                        conn.commit() 
+                        extracted += len(issues)
+                        call.update(parse_status="ok", issues_found=len(issues))
+                        tags["issues"] = len(issues)
+                        inc("issues_extracted_total", len(issues), filename=filename)
 
                 except Exception as e:
+                    # drop this chunk's partial writes, keep the connection usable
+                    conn.rollback()
                     failed += 1
+                    inc("extract_chunks_failed_total", filename=filename)
+                    call["error"] = str(e)[:1000]
                     print(f"\n[ERROR] chunk_id={chunk_id}: {e}")
 
-            conn.close()
+                record_call(**call)
+
+                if progress:
+                    progress("extract", extract_total=total, extract_done=done, issues_extracted=extracted)
+
+            # quotes checked against the transcript, then neighbouring chunks quoting the
+            # same testimony merged (recomputes the whole file)
+            if extracted:
+                verify_file(filename)
+                dedup_file(filename)
+
+            file_tags.update(chunks=total, issues=extracted, failed=failed, triage_dropped=dropped)
 
             print("\n✅ DONE")
             print(f"   • File: {filename}")
             print(f"   • Chunks processed: {total}")
             print(f"   • Issues extracted: {extracted}")
             print(f"   • Failed chunks: {failed}")
+            if triage:
+                print(f"   • Dropped by triage: {dropped}")
 
             return extracted
-    finally:
-        tunnel.stop()
         
 if __name__ == "__main__":
-    run_issue_extraction()
+    # python issue_extractor.py FILE [FILE ...] | --all
+    import sys
+    from cli import main
+    sys.exit(main(["extract", *sys.argv[1:]]))
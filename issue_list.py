@@ -0,0 +1,201 @@
+import math
+import streamlit as st
+
+ISSUE_PAGE_SIZE = 25
+PAGE_SIZE_OPTIONS = [10, 25, 50, 100]
+
+RISK_COLORS = {
+    "HIGH": "#fee2e2",
+    "MEDIUM": "#fef3c7",
+    "LOW": "#ecfeff"
+}
+RISK_TEXT = {
+    "HIGH": "#991b1b",
+    "MEDIUM": "#92400e",
+    "LOW": "#065f46"
+}
+
+def risk_badge(risk):
+    risk = str(risk).upper()
+
+    if risk not in RISK_COLORS:
+        return f"<span>{risk}</span>"
+
+    return f"""
+    <span style="
+        background:{RISK_COLORS[risk]};
+        color:{RISK_TEXT[risk]};
+        padding:4px 10px;
+        border-radius:6px;
+        font-size:12px;
+        font-weight:600;
+    ">
+        {risk}
+    </span>
+    """
+
+def paginate(df, page_index: int, page_size: int = ISSUE_PAGE_SIZE):
+    """
+    Visible window of an already filtered/sorted frame.
+    Return: (df_page, page_index clamped to range, page_count)
+    """
+    page_count = max(1, math.ceil(len(df) / page_size))
+    page_index = min(max(page_index, 0), page_count - 1)
+    start = page_index * page_size
+    return df.iloc[start:start + page_size], page_index, page_count
+
+def render_pager(total: int, page_index: int, page_count: int, key: str = "issues"):
+    """
+    Prev / next controls. Return the new page index (takes effect on this run).
+    """
+    p_col1, p_col2, p_col3 = st.columns([1, 2, 1])
+    with p_col1:
+        if st.button("◀ Prev", key=f"{key}_prev", disabled=page_index <= 0, use_container_width=True):
+            page_index -= 1
+    with p_col3:
+        if st.button("Next ▶", key=f"{key}_next", disabled=page_index >= page_count - 1, use_container_width=True):
+            page_index += 1
+    with p_col2:
+        st.markdown(
+            f'<div class="status" style="text-align:center;padding-top:8px">'
+            f'Page {page_index + 1} of {page_count} · {total} issues</div>',
+            unsafe_allow_html=True
+        )
+    return page_index
+
+def select_issue(row, page, pdf_link):
+    st.session_state.selected_page = page
+    st.session_state.current_pdf_link = pdf_link
+    st.session_state.selected_issue = {
+        "issue_id": row["issue_id"],
+        "filename": row["filename"],
+        "issue_type": row["issue_type"],
+        "pdf_link": pdf_link,
+    }
+
+def render_issue_card(row, similar_lookup=None):
+    """
+    One issue in the left column. Widget keys derive from issue_id so they stay
+    stable when the visible window moves.
+    similar_lookup: optional fn(quoted_text, exclude=filename) -> hits for "find similar testimony"
+    """
+    page = int(row["page"])
+    pdf_link = row["pdf_link"].split("?")[0]
+
+    header = (
+        f"<div style='display:flex; align-items:center; gap:8px;'>"
+        f"{risk_badge(row['risk'])}"
+        f"<strong>Page.{row['page']}</strong>"
+        f"<span>– {row['issue_type']}</span>"
+        f"</div>"
+    )
+
+    with st.expander("Click to view details", expanded=False):
+        st.markdown(
+            f"<div style='margin-bottom:8px'>{header}</div>",
+            unsafe_allow_html=True
+        )
+
+        st.markdown("**Quoted testimony**")
+        st.code(row["quoted_text"], language="text")
+
+        quote_status = row.get("quote_status")
+        if quote_status == "unmatched":
+            st.warning(
+                f"Quote not found in the transcript (best match {row.get('quote_score') or 0:.0%}). "
+                "Check the page before citing it."
+            )
+        elif quote_status == "fuzzy":
+            st.caption(f"Quote matches the transcript approximately ({row.get('quote_score') or 0:.0%}).")
+
+        source_pages = row.get("source_pages")
+        if source_pages is not None and len(source_pages) > 1:
+            st.caption(f"Also quoted by neighbouring chunks – pages {', '.join(map(str, source_pages))}")
+
+        st.markdown("**Legal relevance**")
+        st.write(row["legal_relevance"])
+
+        if st.button(
+            "👁 View in PDF",
+            key=f"view_pdf_{row['issue_id']}",
+            use_container_width=True
+        ):
+            select_issue(row, page, pdf_link)
+
+        if similar_lookup is None:
+            return
+
+        if st.button(
+            "🔗 Find similar testimony",
+            key=f"similar_{row['issue_id']}",
+            use_container_width=True
+        ):
+            st.session_state.similar_issue = row["issue_id"]
+
+        if st.session_state.get("similar_issue") == row["issue_id"]:
+            similar = similar_lookup(
+                row["quoted_text"],
+                exclude=row["filename"]
+            )
+            if not similar:
+                st.caption("No similar testimony found in other depositions.")
+
+            for hit in similar:
+                st.markdown(
+                    f"**{hit['filename']}** – Page.{hit['page']} "
+                    f"<span style='color:#6b7280;font-size:12px'>(score {hit['score']:.2f})</span>",
+                    unsafe_allow_html=True
+                )
+                st.caption(hit["content"][:300])
+                if hit.get("pdf_link") and st.button(
+                    "Jump to page",
+                    key=f"similar_hit_{row['issue_id']}_{hit['chunk_id']}"
+                ):
+                    st.session_state.review_file = hit["filename"]
+                    st.session_state.selected_page = int(hit["page"])
+                    st.session_state.current_pdf_link = hit["pdf_link"].split("?")[0]
+                    st.session_state.selected_issue = None
+
+def render_issue_list(df, page_index: int, page_size: int = ISSUE_PAGE_SIZE, similar_lookup=None):
+    """
+    Render only the visible window of df: O(page size) widgets per rerun.
+    Return the (possibly changed) page index.
+    """
+    df_page, page_index, page_count = paginate(df, page_index, page_size)
+    new_index = render_pager(len(df), page_index, page_count)
+    if new_index != page_index:
+        df_page, page_index, _ = paginate(df, new_index, page_size)
+
+    for row in df_page.to_dict("records"):
+        render_issue_card(row, similar_lookup)
+
+    return page_index
+
+def render_keyset_list(fetch_page, total: int, page_size: int = ISSUE_PAGE_SIZE, similar_lookup=None):
+    """
+    Render one page fetched from the database with keyset pagination.
+    fetch_page: fn(after) -> (records, next cursor or None)
+    Cursors of visited pages are kept in st.session_state.issue_cursors
+    (reset it to [None] when the file, filters or sort change).
+    Return the (possibly changed) page index.
+    """
+    cursors = st.session_state.issue_cursors
+    page_count = max(1, math.ceil(total / page_size))
+    page_index = min(max(st.session_state.issue_page, 0), len(cursors) - 1)
+
+    records, next_cursor = fetch_page(cursors[page_index])
+    new_index = render_pager(total, page_index, page_count)
+
+    if new_index > page_index and next_cursor is not None:
+        del cursors[new_index:]
+        cursors.append(next_cursor)
+        records, _ = fetch_page(next_cursor)
+        page_index = new_index
+    elif new_index < page_index:
+        records, _ = fetch_page(cursors[new_index])
+        page_index = new_index
+
+    for row in records:
+        render_issue_card(row, similar_lookup)
+
+    return page_index
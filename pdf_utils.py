@@ -1,9 +1,15 @@
 import fitz
 import io, json, base64, os
-import dropbox
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 import requests
+from requests.adapters import HTTPAdapter
 import json
-import streamlit as st
+from cache_utils import LRUCache
+from config import get_config
 
 CONFIG_FILE = "config.json"
 def load_local_config():
@@ -15,12 +21,99 @@ def load_local_config():
     else:
         return {}
 local_cfg = load_local_config()
-APP_KEY = st.secrets["dropbox"]["app_key"]
-APP_SECRET = st.secrets["dropbox"]["app_secret"]
-ACCESS_TOKEN = st.secrets["dropbox"]["access_token"]
-REFRESH_TOKEN = st.secrets["dropbox"]["refresh_token"] or local_cfg.get("refresh_token")
 
-def download_dropbox_pdf_raw(shared_link: str, access_token: str) -> bytes:
+def pdf_cache_settings():
+    """
+    Return: {"max_bytes", "spill_dir", "spill_max_bytes", "revalidate_seconds"} from [pdf_cache]
+    """
+    return {
+        "max_bytes": get_config("pdf_cache", "max_mb", 512, cast=int) * 1024 * 1024,
+        "spill_dir": get_config("pdf_cache", "spill_dir", None),     # optional on-disk second tier
+        "spill_max_bytes": get_config("pdf_cache", "spill_max_mb", 4096, cast=int) * 1024 * 1024,
+        "revalidate_seconds": get_config("pdf_cache", "revalidate_seconds", 300, cast=int),
+    }
+
+MAX_OPEN_DOCS = 8                           # files with parsed fitz.Document handles kept open
+MAX_DOCS_PER_FILE = 2                       # handles per file (concurrent sessions)
+PAGE_CACHE_MAX_BYTES = 128 * 1024 * 1024    # rendered pages (PNG / one-page PDF)
+VIEWER_DPI = 120
+
+DROPBOX_TOKEN_URL = "https://api.dropboxapi.com/oauth2/token"
+TOKEN_REFRESH_MARGIN = 300      # refresh this many seconds before the access token expires
+HTTP_POOL_SIZE = 8              # keep-alive connections per Dropbox host
+HTTP_TIMEOUT = (5, 120)         # (connect, read) seconds
+
+class DropboxAuthError(RuntimeError):
+    """The access token was rejected (expired or revoked)."""
+
+# ========== SHARED HTTP SESSION + ACCESS TOKEN ==========
+# One keep-alive session and one access token per process, shared by all sessions / threads.
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))
+
+_token = (None, 0.0)   # (access token, monotonic expiry)
+_token_lock = threading.Lock()
+
+def _refresh_token():
+    return get_config("dropbox", "refresh_token", None) or local_cfg.get("refresh_token")
+
+def _refresh_access_token():
+    """
+    Exchange the refresh token for a short-lived access token.
+    Return: (access_token, monotonic expiry)
+    """
+    r = _http.post(
+        DROPBOX_TOKEN_URL,
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": _refresh_token(),
+            "client_id": get_config("dropbox", "app_key"),
+            "client_secret": get_config("dropbox", "app_secret"),
+        },
+        timeout=HTTP_TIMEOUT,
+    )
+    if r.status_code != 200:
+        raise RuntimeError(f"Dropbox token refresh failed {r.status_code}: {r.text[:500]}")
+
+    body = r.json()
+    return body["access_token"], time.monotonic() + int(body.get("expires_in", 14400))
+
+def get_runtime_access_token():
+    """
+    Cached Dropbox access token, refreshed TOKEN_REFRESH_MARGIN seconds before expiry.
+    Only one thread refreshes; the others wait for its token.
+    """
+    global _token
+
+    if not _refresh_token():
+        return get_config("dropbox", "access_token")  # long-lived token, nothing to refresh
+
+    token, expires_at = _token
+    if token and time.monotonic() < expires_at - TOKEN_REFRESH_MARGIN:
+        return token
+
+    with _token_lock:
+        token, expires_at = _token
+        if token and time.monotonic() < expires_at - TOKEN_REFRESH_MARGIN:
+            return token
+        _token = _refresh_access_token()
+        return _token[0]
+
+def invalidate_access_token(token):
+    """
+    Drop a token Dropbox rejected, unless another thread already replaced it.
+    """
+    global _token
+
+    with _token_lock:
+        if _token[0] == token:
+            _token = (None, 0.0)
+
+def download_dropbox_pdf(shared_link: str, access_token: str, etag: str = None):
+    """
+    Conditional download of a shared-link file.
+    Return: (content or None if not modified, etag, rev)
+    """
     url = "https://content.dropboxapi.com/2/sharing/get_shared_link_file"
 
     headers = {
@@ -29,8 +122,16 @@ def download_dropbox_pdf_raw(shared_link: str, access_token: str) -> bytes:
             "url": shared_link.split("?")[0]  # remove ?dl=1, rlkey...
         })
     }
+    if etag:
+        headers["If-None-Match"] = etag
 
-    r = requests.post(url, headers=headers)
+    r = _http.post(url, headers=headers, timeout=HTTP_TIMEOUT)
+
+    if r.status_code == 304:
+        return None, etag, None
+
+    if r.status_code == 401:
+        raise DropboxAuthError(f"Dropbox rejected the access token: {r.content[:200]}")
 
     # ⚠️ Không dùng r.json() vì response là BINARY
     if r.status_code != 200:
@@ -40,19 +141,162 @@ def download_dropbox_pdf_raw(shared_link: str, access_token: str) -> bytes:
             f"Body (first 500 bytes): {r.content[:500]}"
         )
 
-    return r.content
+    try:
+        rev = json.loads(r.headers.get("Dropbox-API-Result", "{}")).get("rev")
+    except ValueError:
+        rev = None
 
-def get_runtime_access_token():
-    dbx = dropbox.Dropbox(
-        oauth2_refresh_token=REFRESH_TOKEN,
-        app_key=APP_KEY,
-        app_secret=APP_SECRET,
+    return r.content, r.headers.get("ETag"), rev
+
+def download_dropbox_pdf_raw(shared_link: str, access_token: str) -> bytes:
+    content, _, _ = download_dropbox_pdf(shared_link, access_token)
+    return content
+
+# ========== SHARED PDF CACHE ==========
+# One copy of each deposition per process, shared by all sessions:
+#   memory (byte-size LRU) -> optional spill dir -> Dropbox (revalidated by ETag)
+
+def _pdf_key(pdf_link: str) -> str:
+    return pdf_link.split("?")[0]
+
+def _spill_paths(spill_dir, key):
+    name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return (
+        os.path.join(spill_dir, f"{name}.pdf"),
+        os.path.join(spill_dir, f"{name}.json"),
     )
 
-    # 🔥 trigger refresh token -> access token
-    dbx.users_get_current_account()
+def _prune_spill_dir(spill_dir, max_bytes):
+    files = [
+        os.path.join(spill_dir, f)
+        for f in os.listdir(spill_dir)
+        if f.endswith(".pdf")
+    ]
+    files.sort(key=os.path.getmtime)
+    total = sum(os.path.getsize(f) for f in files)
+    while files and total > max_bytes:
+        oldest = files.pop(0)
+        total -= os.path.getsize(oldest)
+        for path in (oldest, oldest[:-4] + ".json"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def _spill_to_disk(key, entry):
+    settings = pdf_cache_settings()
+    spill_dir = settings["spill_dir"]
+    if not spill_dir:
+        return
+    try:
+        os.makedirs(spill_dir, exist_ok=True)
+        data_path, meta_path = _spill_paths(spill_dir, key)
+        tmp = data_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(entry["data"])
+        os.replace(tmp, data_path)
+        with open(meta_path, "w") as f:
+            json.dump({"etag": entry["etag"], "rev": entry["rev"]}, f)
+        _prune_spill_dir(spill_dir, settings["spill_max_bytes"])
+    except OSError as e:
+        print(f"⚠️ Cannot spill PDF to {spill_dir}: {e}")
+
+def _load_spilled(key):
+    spill_dir = pdf_cache_settings()["spill_dir"]
+    if not spill_dir:
+        return None
+    data_path, meta_path = _spill_paths(spill_dir, key)
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        with open(data_path, "rb") as f:
+            data = f.read()
+    except (OSError, ValueError):
+        return None
+    # checked_at=0 -> revalidate against Dropbox before first use
+    return {"data": data, "etag": meta.get("etag"), "rev": meta.get("rev"), "checked_at": 0.0}
+
+_pdf_cache = None   # sized from the settings on first use, see _get_pdf_cache
+_pdf_cache_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _get_pdf_cache():
+    global _pdf_cache
+    with _pdf_cache_lock:
+        if _pdf_cache is None:
+            _pdf_cache = LRUCache(
+                maxsize=None,
+                maxbytes=pdf_cache_settings()["max_bytes"],
+                sizeof=lambda entry: len(entry["data"]),
+                on_evict=_spill_to_disk,
+            )
+        return _pdf_cache
+
+def _fetch_pdf(key, entry):
+    etag = entry["etag"] if entry else None
+    access_token = get_runtime_access_token()
+    try:
+        content, etag, rev = download_dropbox_pdf(key, access_token, etag=etag)
+    except DropboxAuthError:
+        # revoked / expired early: refresh once and retry
+        invalidate_access_token(access_token)
+        content, etag, rev = download_dropbox_pdf(key, get_runtime_access_token(), etag=etag)
+
+    if content is None:
+        # 304: cached copy is still current
+        entry = dict(entry, checked_at=time.monotonic())
+    else:
+        entry = {"data": content, "etag": etag, "rev": rev, "checked_at": time.monotonic()}
+
+    _get_pdf_cache().put(key, entry)
+    return entry
+
+def get_pdf_entry(pdf_link: str) -> dict:
+    """
+    Cache entry {"data", "etag", "rev", "checked_at"} for a Dropbox shared link.
+    Concurrent requests for the same file share a single download.
+    """
+    key = _pdf_key(pdf_link)
+
+    entry = _get_pdf_cache().get(key)
+    if entry and time.monotonic() - entry["checked_at"] < pdf_cache_settings()["revalidate_seconds"]:
+        return entry
+
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        owner = fut is None
+        if owner:
+            fut = Future()
+            _inflight[key] = fut
+
+    if not owner:
+        return fut.result()
+
+    known = entry or _load_spilled(key)
+    try:
+        fresh = _fetch_pdf(key, known)
+    except Exception as e:
+        if known is None:
+            fut.set_exception(e)
+            raise
+        # Dropbox unreachable: keep serving the copy we have (in memory or spilled)
+        print(f"⚠️ Revalidation failed for {key}: {e}")
+        fresh = known
+        if entry is None:
+            _get_pdf_cache().put(key, fresh)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+    fut.set_result(fresh)
+    return fresh
 
-    return dbx._oauth2_access_token
+def get_pdf_bytes(pdf_link: str) -> bytes:
+    """
+    PDF bytes for a Dropbox shared link from the process-wide cache.
+    """
+    return get_pdf_entry(pdf_link)["data"]
 
 def render_pdfjs_from_bytes(pdf_bytes: bytes, page: int = 1, height: int = 900):
     b64_pdf = base64.b64encode(pdf_bytes).decode("utf-8")
@@ -98,25 +342,195 @@ def render_pdfjs_from_bytes(pdf_bytes: bytes, page: int = 1, height: int = 900):
     ></iframe>
     """
 
-    st.components.v1.html(html, height=height, scrolling=True)
+    import streamlit.components.v1 as components
+    components.html(html, height=height, scrolling=True)
+
+def copy_pages(src, page_numbers) -> bytes:
+    """
+    Build one PDF from 1-based pages of an open document, in the given order.
+    Consecutive pages are copied as one range and insert_pdf(final=False) keeps the
+    object map between ranges, so fonts/images shared by pages are copied once.
+    """
+    if not page_numbers:
+        raise ValueError("No pages requested")
+    for p in page_numbers:
+        if p < 1 or p > src.page_count:
+            raise ValueError("Invalid page number")
+
+    runs = []
+    for p in page_numbers:
+        if runs and p == runs[-1][1] + 1:
+            runs[-1][1] = p
+        else:
+            runs.append([p, p])
+
+    dst = fitz.open()
+    for i, (first, last) in enumerate(runs):
+        dst.insert_pdf(src, from_page=first - 1, to_page=last - 1, final=(i == len(runs) - 1))
+
+    data = dst.tobytes(garbage=3, deflate=True)
+    dst.close()
+    return data
 
 def extract_single_page_pdf(pdf_bytes: bytes, page_number: int) -> bytes:
     """
     page_number: 1-based (page 1 = first page)
+    Parses pdf_bytes on every call; prefer extract_page_pdf(pdf_link, page) in the app.
     """
     src = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        return copy_pages(src, [page_number])
+    finally:
+        src.close()
 
-    if page_number < 1 or page_number > src.page_count:
-        raise ValueError("Invalid page number")
+# ========== OPEN DOCUMENT CACHE + SERVER-SIDE PAGE RENDERING ==========
+# Parsed fitz documents stay open across reruns and sessions, so page views and
+# downloads never re-parse the whole PDF. Only the requested page is sent to
+# the browser instead of shipping the whole PDF as base64.
 
-    dst = fitz.open()
-    dst.insert_pdf(src, from_page=page_number - 1, to_page=page_number - 1)
+def _close_docs(key, pool):
+    # a handle may still be in use: close in the background once it is released
+    def close():
+        # no handle is added or handed out once the pool is marked closed
+        with pool["lock"]:
+            pool["closed"] = True
+            handles = list(pool["handles"])
+        for handle in handles:
+            with handle["lock"]:
+                handle["closed"] = True
+                handle["doc"].close()
+    _prefetch_pool.submit(close)
 
-    buffer = io.BytesIO()
-    dst.save(buffer)
-    dst.close()
-    src.close()
+_doc_cache = LRUCache(maxsize=MAX_OPEN_DOCS, on_evict=_close_docs)
+_doc_cache_lock = threading.Lock()
+_page_cache = LRUCache(maxsize=None, maxbytes=PAGE_CACHE_MAX_BYTES, sizeof=len)
+_prefetch_pool = ThreadPoolExecutor(max_workers=2)
+
+def _doc_key(pdf_link, entry):
+    # a new revision of the file gets new handles
+    return (_pdf_key(pdf_link), entry["etag"] or entry["rev"], len(entry["data"]))
+
+@contextmanager
+def acquire_document(pdf_link: str):
+    """
+    Exclusive use of a parsed fitz.Document for a shared link (fitz is not thread-safe).
+    Up to MAX_DOCS_PER_FILE handles are opened per file so concurrent sessions on
+    the same deposition do not queue behind each other; MAX_OPEN_DOCS files are kept.
+    Yield: (doc_key, doc)
+    """
+    entry = get_pdf_entry(pdf_link)
+    key = _doc_key(pdf_link, entry)
+
+    while True:
+        with _doc_cache_lock:
+            pool = _doc_cache.get(key)
+            if pool is None:
+                pool = {"handles": [], "lock": threading.Lock(), "next": 0, "page_count": None, "closed": False}
+                _doc_cache.put(key, pool)
+
+        handle = None
+        with pool["lock"]:
+            if pool["closed"]:
+                # evicted after we looked it up: the cache holds a new pool now
+                continue
 
-    return buffer.getvalue()
+            for h in pool["handles"]:
+                if h["lock"].acquire(blocking=False):
+                    handle = h
+                    break
 
+            if handle is None and len(pool["handles"]) < MAX_DOCS_PER_FILE:
+                handle = {"doc": fitz.open(stream=entry["data"], filetype="pdf"), "lock": threading.Lock(), "closed": False}
+                handle["lock"].acquire()
+                pool["handles"].append(handle)
+                pool["page_count"] = handle["doc"].page_count
 
+            if handle is None:
+                # all busy: wait on the next handle in rotation
+                handle = pool["handles"][pool["next"] % len(pool["handles"])]
+                pool["next"] += 1
+                wait = True
+            else:
+                wait = False
+
+        if wait:
+            handle["lock"].acquire()
+            if handle["closed"]:
+                # the pool was evicted and closed this handle while we waited
+                handle["lock"].release()
+                continue
+        break
+
+    try:
+        yield key, handle["doc"]
+    finally:
+        handle["lock"].release()
+
+def _render(doc, page_number, mode, dpi):
+    if mode == "png":
+        if page_number < 1 or page_number > doc.page_count:
+            raise ValueError("Invalid page number")
+        return doc[page_number - 1].get_pixmap(dpi=dpi).tobytes("png")
+    return copy_pages(doc, [page_number])
+
+def _page_cache_key(pdf_link, page_number, mode, dpi):
+    doc_key = _doc_key(pdf_link, get_pdf_entry(pdf_link))
+    return (doc_key, page_number, mode, dpi if mode == "png" else None)
+
+def _cached_page(pdf_link, page_number, mode, dpi):
+    cache_key = _page_cache_key(pdf_link, page_number, mode, dpi)
+
+    data = _page_cache.get(cache_key)
+    if data is None:
+        with acquire_document(pdf_link) as (_, doc):
+            data = _render(doc, page_number, mode, dpi)
+        _page_cache.put(cache_key, data)
+    return data
+
+def _prefetch(pdf_link, page_number, mode, dpi):
+    try:
+        _cached_page(pdf_link, page_number, mode, dpi)
+    except Exception as e:
+        print(f"⚠️ Prefetch of page {page_number} failed: {e}")
+
+def get_page_count(pdf_link: str) -> int:
+    with acquire_document(pdf_link) as (_, doc):
+        return doc.page_count
+
+def get_page_render(pdf_link: str, page_number: int, mode: str = "png", dpi: int = VIEWER_DPI) -> bytes:
+    """
+    One page of a deposition, as PNG (mode="png") or a one-page PDF (mode="pdf").
+    Renders are LRU-cached and the neighbouring pages are prefetched in the background.
+    """
+    data = _cached_page(pdf_link, page_number, mode, dpi)
+
+    page_count = get_page_count(pdf_link)
+    for neighbour in (page_number + 1, page_number - 1):
+        if 1 <= neighbour <= page_count and _page_cache_key(pdf_link, neighbour, mode, dpi) not in _page_cache:
+            _prefetch_pool.submit(_prefetch, pdf_link, neighbour, mode, dpi)
+
+    return data
+
+def extract_page_pdf(pdf_link: str, page_number: int) -> bytes:
+    """
+    One-page PDF for download, memoized by (file, page).
+    """
+    return _cached_page(pdf_link, page_number, "pdf", None)
+
+def extract_pages_pdf(pdf_link: str, page_numbers) -> bytes:
+    """
+    One PDF with many pages of a deposition (in the given order) from the open document.
+    """
+    with acquire_document(pdf_link) as (_, doc):
+        return copy_pages(doc, list(page_numbers))
+
+def render_pdf_page(pdf_link: str, page: int = 1, mode: str = "png", dpi: int = VIEWER_DPI, height: int = 900):
+    """
+    Page-view mode of the transcript viewer: ships only the requested page.
+    """
+    import streamlit as st
+
+    if mode == "png":
+        st.image(get_page_render(pdf_link, page, "png", dpi), use_container_width=True)
+    else:
+        render_pdfjs_from_bytes(get_page_render(pdf_link, page, "pdf"), page=1, height=height)
@@ -0,0 +1,342 @@
+"""
+Verbatim check of extracted quotes against the transcript text they came from.
+
+Each quoted_text is searched in its chunk, then the chunk stitched to its neighbours (quotes
+that run across a chunk boundary), then the whole page stitched from its chunks:
+
+    exact        raw substring
+    normalized   same words, differing only in case, whitespace or punctuation
+    fuzzy        bounded word alignment scores >= FUZZY_THRESHOLD
+    unmatched    best alignment below it (likely paraphrased or hallucinated), or a quote
+                 that adds or drops a negation or a number of the aligned testimony
+
+Exact and normalized matches must start and end on word boundaries ("We warn" is not in
+"We warned them"). Both run on every level before any fuzzy alignment. The fuzzy pass
+is anchored: word 3-grams of the quote vote for start positions through a 3-gram index of
+the source, and only the best MAX_WINDOWS windows (quote length + slack) are aligned.
+The score counts source words skipped by the quote as well as quote words not in the
+source: 2 * aligned / (quote words + words of the aligned source span).
+Results go to deposition_issues: quote_status, quote_score, quote_source, quote_chunk_id and
+quote_start / quote_end, character offsets into that chunk's content (the end may run into
+the next chunk).
+"""
+import re
+import time
+from bisect import bisect_right
+from collections import Counter
+from difflib import SequenceMatcher
+from telemetry import inc, span
+
+QUOTE_STATUSES = ("exact", "normalized", "fuzzy", "unmatched")
+FUZZY_THRESHOLD = 0.85   # 2 * aligned words / (quote words + source span words)
+ANCHOR_SIZE = 3          # words per anchor
+MAX_ANCHORS = 12         # anchors sampled across a quote
+MAX_ANCHOR_HITS = 8      # positions per anchor (boilerplate phrases repeat)
+MAX_WINDOWS = 3          # candidate windows aligned per source
+MIN_SLACK = 3            # words of slack on each side of a window
+MIN_OVERLAP, MAX_OVERLAP = 20, 400   # chars: chunk overlap detected when stitching chunks
+
+NOT_FOUND = {"quote_status": "unmatched", "quote_score": 0.0, "quote_source": None,
+             "quote_chunk_id": None, "quote_start": None, "quote_end": None}
+
+_TOKEN_RE = re.compile(r"\w+(?:'\w+)*")
+# words that flip the meaning of testimony when a quote adds or drops them
+NEGATIONS = frozenset({"not", "no", "never", "nor", "neither", "none", "nothing", "nobody", "cannot"})
+# one-to-one replacements: character offsets stay valid after translate()
+_FOLD = str.maketrans({"’": "'", "‘": "'", "“": '"', "”": '"', "–": "-", "—": "-"})
+
+VERIFY_DDL = """
+    ALTER TABLE deposition_issues
+        ADD COLUMN IF NOT EXISTS quote_status TEXT,
+        ADD COLUMN IF NOT EXISTS quote_score REAL,
+        ADD COLUMN IF NOT EXISTS quote_source TEXT,
+        ADD COLUMN IF NOT EXISTS quote_chunk_id TEXT,
+        ADD COLUMN IF NOT EXISTS quote_start INTEGER,
+        ADD COLUMN IF NOT EXISTS quote_end INTEGER
+"""
+
+def init_verify_tables(cur):
+    cur.execute(VERIFY_DDL)
+
+def tokenize(text):
+    """
+    Return: (lowercased words, their (start, end) character spans in text)
+    """
+    words, spans = [], []
+    for m in _TOKEN_RE.finditer((text or "").translate(_FOLD)):
+        words.append(m.group().lower())
+        spans.append(m.span())
+    return words, spans
+
+def critical_words(words):
+    """
+    Return: Counter of the negations and numbers among words
+    """
+    return Counter(
+        "not" if w in NEGATIONS or w.endswith("n't") else w
+        for w in words
+        if w in NEGATIONS or w.endswith("n't") or any(c.isdigit() for c in w)
+    )
+
+def _on_boundaries(text, start, end):
+    """
+    Return: True unless text[start:end] cuts a word in two at either end
+    """
+    return (
+        (start == 0 or not (text[start - 1].isalnum() and text[start].isalnum()))
+        and (end == len(text) or not (text[end - 1].isalnum() and text[end].isalnum()))
+    )
+
+def overlap_length(prev, content):
+    """
+    Return: length of the longest suffix of prev that content starts with (the overlap
+    smart_chunk_text prepends), 0 below MIN_OVERLAP chars
+    """
+    for n in range(min(len(prev), len(content), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if content.startswith(prev[-n:]):
+            return n
+    return 0
+
+class SourceText:
+    """
+    Text of consecutive chunks stitched back together (each chunk's overlap with the previous
+    one dropped, so a quote across the boundary reads contiguously); normalized forms are
+    built on first use and reused by every quote checked against it.
+    segments: [(chunk_id, offset of the chunk's first character in text)]
+    """
+    def __init__(self, chunks):
+        parts, self.segments, offset, prev = [], [], 0, None
+        for chunk_id, content in chunks:
+            content = content or ""
+            skip = overlap_length(prev, content) if prev else 0
+            if parts and not skip:
+                parts.append("\n")
+                offset += 1
+            parts.append(content[skip:])
+            self.segments.append((chunk_id, offset - skip))
+            offset += len(content) - skip
+            prev = content
+        self.text = "".join(parts)
+        self._bases = [base for _, base in self.segments]
+        self._words = None
+        self._grams = None
+
+    def words(self):
+        if self._words is None:
+            self._words, self._spans = tokenize(self.text)
+            self._joined = " ".join(self._words)
+            self._word_starts = []
+            pos = 0
+            for w in self._words:
+                self._word_starts.append(pos)
+                pos += len(w) + 1
+        return self._words
+
+    def grams(self):
+        if self._grams is None:
+            words = self.words()
+            self._grams = {}
+            for i in range(len(words) - ANCHOR_SIZE + 1):
+                self._grams.setdefault(tuple(words[i:i + ANCHOR_SIZE]), []).append(i)
+        return self._grams
+
+    def locate(self, start, end):
+        """
+        Return: (chunk_id, start, end) of a text span, relative to the chunk it starts in
+        """
+        i = max(bisect_right(self._bases, start) - 1, 0)
+        chunk_id, base = self.segments[i]
+        return chunk_id, start - base, end - base
+
+    def find(self, needle):
+        """
+        Raw exact search. Return: (start, end) character offsets or None
+        """
+        pos = self.text.find(needle)
+        while pos >= 0:
+            if _on_boundaries(self.text, pos, pos + len(needle)):
+                return pos, pos + len(needle)
+            pos = self.text.find(needle, pos + 1)
+        return None
+
+    def find_words(self, words):
+        """
+        Normalized exact search. Return: (first, last) word index or None
+        """
+        self.words()
+        needle = " ".join(words)
+        pos = self._joined.find(needle)
+        while pos >= 0:
+            first = bisect_right(self._word_starts, pos) - 1
+            end = pos + len(needle)
+            # starts and ends on a word boundary
+            if self._word_starts[first] == pos and (end == len(self._joined) or self._joined[end] == " "):
+                return first, first + len(words) - 1
+            pos = self._joined.find(needle, pos + 1)
+        return None
+
+    def align(self, words):
+        """
+        Anchored, bounded fuzzy alignment. Return: (score, first, last) word index or None
+        """
+        n = len(words)
+        if n < ANCHOR_SIZE:
+            return None
+        grams, source = self.grams(), self.words()
+
+        votes = Counter()
+        step = max(1, (n - ANCHOR_SIZE + 1) // MAX_ANCHORS)
+        for i in range(0, n - ANCHOR_SIZE + 1, step):
+            for j in grams.get(tuple(words[i:i + ANCHOR_SIZE]), ())[:MAX_ANCHOR_HITS]:
+                votes[j - i] += 1
+
+        best = None
+        slack = max(MIN_SLACK, n // 5)
+        for start, _ in votes.most_common(MAX_WINDOWS):
+            lo, hi = max(0, start - slack), min(len(source), start + n + slack)
+            matcher = SequenceMatcher(None, words, source[lo:hi], autojunk=False)
+            blocks = [b for b in matcher.get_matching_blocks() if b.size]
+            if not blocks:
+                continue
+            first, last = lo + blocks[0].b, lo + blocks[-1].b + blocks[-1].size - 1
+            # source words inside the span the quote skipped count against it too
+            score = 2 * sum(b.size for b in blocks) / (n + last - first + 1)
+            if best is None or score > best[0]:
+                best = (score, first, last)
+        return best
+
+    def word_span(self, first, last):
+        return self._spans[first][0], self._spans[last][1]
+
+def verify_quote(quote, levels):
+    """
+    levels: [(source name, SourceText)], tried in order
+    Return: {"quote_status", "quote_score", "quote_source", "quote_chunk_id", "quote_start", "quote_end"}
+    """
+    needle = (quote or "").strip()
+    words, _ = tokenize(needle)
+    if not words:
+        return dict(NOT_FOUND)
+
+    def result(status, score, name, source, start, end):
+        chunk_id, start, end = source.locate(start, end)
+        return {"quote_status": status, "quote_score": round(score, 4), "quote_source": name,
+                "quote_chunk_id": chunk_id, "quote_start": start, "quote_end": end}
+
+    for name, source in levels:
+        hit = source.find(needle)
+        if hit:
+            return result("exact", 1.0, name, source, *hit)
+        hit = source.find_words(words)
+        if hit:
+            return result("normalized", 1.0, name, source, *source.word_span(*hit))
+
+    best = None
+    for name, source in levels:
+        hit = source.align(words)
+        if hit and (best is None or hit[0] > best[0][0]):
+            best = (hit, name, source)
+            if hit[0] >= FUZZY_THRESHOLD:
+                break
+
+    if best is None:
+        return dict(NOT_FOUND)
+    (score, first, last), name, source = best
+    # "I did know" aligns well with "I did not know": never a fuzzy match
+    changed = critical_words(words) != critical_words(source.words()[first:last + 1])
+    status = "fuzzy" if score >= FUZZY_THRESHOLD and not changed else "unmatched"
+    return result(status, score, name, source, *source.word_span(first, last))
+
+def source_levels(chunks):
+    """
+    chunks: [(chunk_id, page, content)] of one file in (page, chunk_index) order
+    Return: fn(chunk_id) -> [(source name, SourceText)], SourceTexts cached per chunk / page
+    """
+    position = {chunk_id: i for i, (chunk_id, _, _) in enumerate(chunks)}
+    by_page = {}
+    for chunk_id, page, content in chunks:
+        by_page.setdefault(page, []).append((chunk_id, content))
+    cache = {}
+
+    def cached(key, build):
+        if key not in cache:
+            cache[key] = SourceText(build())
+        return cache[key]
+
+    def levels(chunk_id):
+        i = position.get(chunk_id)
+        if i is None:   # chunk gone: nothing to check against
+            return []
+        page = chunks[i][1]
+        return [
+            ("chunk", cached(("chunk", i), lambda: [(chunks[i][0], chunks[i][2])])),
+            ("neighbours", cached(("neighbours", i), lambda: [
+                (c[0], c[2]) for c in chunks[max(i - 1, 0):i + 2]
+            ])),
+            ("page", cached(("page", page), lambda: by_page[page])),
+        ]
+
+    return levels
+
+# ========== DB ==========
+def verify_file(filename, force=False):
+    """
+    Verify the file's quotes not checked yet (force: every quote).
+    Return: {"file", "quotes", <status>: count, "seconds", "quotes_per_s"}
+    """
+    from db_utils import bump_data_version, issues_scope, pooled_connection
+
+    started = time.perf_counter()
+    with span("verify.file", filename=filename) as tags, pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT issue_id, chunk_id, quoted_text
+                FROM deposition_issues
+                WHERE filename = %s
+                {"" if force else "AND quote_status IS NULL"}
+            """, (filename,))
+            issues = cur.fetchall()
+
+            counts = Counter()
+            results = []
+            if issues:
+                cur.execute("""
+                    SELECT chunk_id, page, content
+                    FROM chunks
+                    WHERE filename = %s
+                    ORDER BY page, chunk_index
+                """, (filename,))
+                levels = source_levels(cur.fetchall())
+
+                for issue_id, chunk_id, quoted_text in issues:
+                    r = verify_quote(quoted_text, levels(chunk_id))
+                    counts[r["quote_status"]] += 1
+                    results.append((issue_id, r))
+
+                columns = ["quote_status", "quote_score", "quote_source", "quote_chunk_id", "quote_start", "quote_end"]
+                types = ["text", "real", "text", "text", "int", "int"]
+                cur.execute(f"""
+                    UPDATE deposition_issues d
+                    SET {', '.join(f"{c} = u.{c}" for c in columns)}
+                    FROM unnest(%s::text[], {', '.join(f"%s::{t}[]" for t in types)})
+                        AS u(issue_id, {', '.join(columns)})
+                    WHERE d.issue_id = u.issue_id
+                """, [[issue_id for issue_id, _ in results]] + [[r[c] for _, r in results] for c in columns])
+
+                # invalidate cached issue pages in the review app
+                bump_data_version(cur, issues_scope(filename))
+
+        tags.update(quotes=len(issues), **counts)
+
+    for status, n in counts.items():
+        inc("quotes_verified_total", n, status=status)
+    seconds = time.perf_counter() - started
+    if counts["unmatched"]:
+        print(f"⚠️ {filename}: {counts['unmatched']} of {len(issues)} quotes not found in the transcript")
+    return {
+        "file": filename,
+        "quotes": len(issues),
+        **{status: counts[status] for status in QUOTE_STATUSES},
+        "seconds": round(seconds, 3),
+        "quotes_per_s": round(len(issues) / seconds, 1) if seconds else None,
+    }
@@ -0,0 +1,510 @@
+"""
+Selective re-extraction after PROMPT or the model changes.
+
+Chunks whose issue_progress stamp (prompt_version, model) differs from the current one are
+re-run in priority order under a chunk / USD budget, through the triage cascade when one is
+configured (chunks the triage model drops are stamped with its prompt / model, see triage.py). New issues are staged next to the live
+ones (staged_issues) so the review app keeps serving the old results until the run is
+promoted; diff_run() compares the two, discard_run() drops the staged side.
+
+    run = start_run(filenames=None, priority="risk", budget_usd=20)
+    diff_run(run["run_id"])
+    promote_run(run["run_id"])
+"""
+import uuid
+from db_utils import RISK_RANK_SQL, bump_data_version, issues_scope, pooled_connection
+from extraction_ledger import model_prices, project, record_call
+from issue_dedup import dedup_file
+from issue_extractor import (
+    PROMPT, PROMPT_VERSION, call_extraction, get_anthropic_model, init_issue_tables, new_call
+)
+from quote_verify import verify_file
+from telemetry import inc, span
+from triage import TRIAGE_PROMPT_VERSION, triage_chunks, triage_settings, triage_stamp
+
+# priority name -> ORDER BY of stale chunks (i: the chunk's live issues, p: issue_progress)
+PRIORITIES = {
+    "risk": "COALESCE(i.best_rank, 4), i.issues DESC, c.filename, c.page, c.chunk_index",
+    "page": "c.filename, c.page, c.chunk_index",
+    "oldest": "p.extracted_at ASC NULLS FIRST, c.filename, c.page, c.chunk_index",
+}
+
+RUN_BATCH_SIZE = 50   # stale chunks fetched per query
+
+RUN_STATUSES = ("running", "completed", "budget_exhausted", "promoted", "discarded")
+
+REEXTRACTION_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS extraction_runs (
+        run_id TEXT PRIMARY KEY,
+        prompt_version TEXT,
+        model TEXT,
+        filenames TEXT[],
+        priority TEXT,
+        max_chunks INTEGER,
+        budget_usd DOUBLE PRECISION,
+        status TEXT,
+        chunks_done INTEGER DEFAULT 0,
+        chunks_failed INTEGER DEFAULT 0,
+        spent_usd DOUBLE PRECISION DEFAULT 0,
+        created_at TIMESTAMPTZ DEFAULT now(),
+        finished_at TIMESTAMPTZ,
+        promoted_at TIMESTAMPTZ
+    )
+    """,
+    """
+    ALTER TABLE extraction_runs
+        ADD COLUMN IF NOT EXISTS triage_model TEXT,
+        ADD COLUMN IF NOT EXISTS triage_threshold DOUBLE PRECISION
+    """,
+    # chunks re-run by a run (also those that now yield no issue)
+    """
+    CREATE TABLE IF NOT EXISTS staged_chunks (
+        run_id TEXT,
+        chunk_id TEXT,
+        filename TEXT,
+        issues INTEGER,
+        staged_at TIMESTAMPTZ DEFAULT now(),
+        PRIMARY KEY (run_id, chunk_id)
+    )
+    """,
+    # the stamp promote_run() gives the chunk: primary or triage prompt / model
+    """
+    ALTER TABLE staged_chunks
+        ADD COLUMN IF NOT EXISTS prompt_version TEXT,
+        ADD COLUMN IF NOT EXISTS model TEXT,
+        ADD COLUMN IF NOT EXISTS triage_model TEXT,
+        ADD COLUMN IF NOT EXISTS triage_score DOUBLE PRECISION
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS staged_issues (
+        run_id TEXT,
+        issue_id TEXT PRIMARY KEY,
+        chunk_id TEXT,
+        filename TEXT,
+        page INTEGER,
+        issue_type TEXT,
+        quoted_text TEXT,
+        legal_relevance TEXT,
+        risk_level TEXT,
+        pdf_link TEXT,
+        prompt_version TEXT,
+        model TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_staged_issues_run_chunk ON staged_issues (run_id, chunk_id)",
+]
+
+def init_reextraction_tables():
+    init_issue_tables()
+    with pooled_connection() as conn:
+        for ddl in REEXTRACTION_DDL:
+            conn.execute(ddl)
+
+def _stale_filter(filenames, triage=None):
+    """
+    triage: cascade settings; chunks it dropped stay current while its prompt / model do
+    Return: (SQL conditions, params) selecting extracted chunks with an out-of-date stamp
+    """
+    conditions = [
+        "p.extracted = 1",
+        "(p.prompt_version IS DISTINCT FROM %s OR p.model IS DISTINCT FROM %s)",
+    ]
+    params = [PROMPT_VERSION, get_anthropic_model()]
+    if triage:
+        conditions.append("(p.prompt_version IS DISTINCT FROM %s OR p.model IS DISTINCT FROM %s)")
+        params += [TRIAGE_PROMPT_VERSION, triage["model"]]
+    if filenames:
+        conditions.append("c.filename = ANY(%s)")
+        params.append(list(filenames))
+    return conditions, params
+
+def stale_summary(filenames=None):
+    """
+    Out-of-date chunks per file and the projected cost of re-running them.
+    Return: {"files": [(filename, chunks)], "projection": extraction_ledger.project(...)}
+    """
+    init_reextraction_tables()
+    conditions, params = _stale_filter(filenames, triage_settings())
+
+    with pooled_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT c.filename, COUNT(*), COALESCE(SUM(length(c.content)), 0)
+            FROM chunks c
+            JOIN issue_progress p ON p.chunk_id = c.chunk_id
+            WHERE {" AND ".join(conditions)}
+            GROUP BY c.filename
+            ORDER BY COUNT(*) DESC, c.filename
+        """, params).fetchall()
+
+    chunks = sum(r[1] for r in rows)
+    chars = sum(r[2] for r in rows)
+    return {
+        "files": [(filename, n) for filename, n, _ in rows],
+        "projection": project(chunks, chars, get_anthropic_model(), len(PROMPT)),
+    }
+
+def get_run(run_id):
+    with pooled_connection() as conn:
+        cur = conn.execute("SELECT * FROM extraction_runs WHERE run_id = %s", (run_id,))
+        row = cur.fetchone()
+        if row is None:
+            raise KeyError(f"Unknown re-extraction run: {run_id}")
+        return dict(zip([d.name for d in cur.description], row))
+
+def _run_triage(run):
+    """
+    Return: the cascade settings a run was started with, None when it runs without one
+    """
+    if not run.get("triage_model"):
+        return None
+    return triage_settings(run["triage_model"], run["triage_threshold"])
+
+def _next_chunks(run, n, exclude=()):
+    conditions, params = _stale_filter(run["filenames"], _run_triage(run))
+    if exclude:
+        conditions.append("NOT (c.chunk_id = ANY(%s))")
+        params.append(list(exclude))
+    order = PRIORITIES[run["priority"]]
+
+    with pooled_connection() as conn:
+        return conn.execute(f"""
+            SELECT c.chunk_id, c.content, c.page, c.filename, c.pdf_link
+            FROM chunks c
+            JOIN issue_progress p ON p.chunk_id = c.chunk_id
+            LEFT JOIN staged_chunks s ON s.run_id = %s AND s.chunk_id = c.chunk_id
+            LEFT JOIN LATERAL (
+                SELECT MIN({RISK_RANK_SQL}) AS best_rank, COUNT(*) AS issues
+                FROM deposition_issues d
+                WHERE d.chunk_id = c.chunk_id
+            ) i ON TRUE
+            WHERE s.chunk_id IS NULL
+            AND {" AND ".join(conditions)}
+            ORDER BY {order}
+            LIMIT %s
+        """, [run["run_id"], *params, n]).fetchall()
+
+def _stage_chunk(run_id, chunk_id, filename, page, pdf_link, issues, call, triage=None, score=None):
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.executemany("""
+                INSERT INTO staged_issues (
+                    run_id, issue_id, chunk_id, filename, page, issue_type,
+                    quoted_text, legal_relevance, risk_level, pdf_link, prompt_version, model
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, [(
+                run_id, str(uuid.uuid4()), chunk_id, filename, page, it["issue_type"],
+                it["quoted_text"], it["legal_relevance"], it["risk_level"], pdf_link,
+                call["prompt_version"], call["model"]
+            ) for it in issues])
+            cur.execute("""
+                INSERT INTO staged_chunks
+                    (run_id, chunk_id, filename, issues, prompt_version, model, triage_model, triage_score)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, (run_id, chunk_id, filename, len(issues), call["prompt_version"], call["model"],
+                  triage["model"] if triage and score is not None else None, score))
+
+def _update_run(run_id, **fields):
+    sets = ", ".join(f"{name} = %s" for name in fields)
+    with pooled_connection() as conn:
+        conn.execute(f"UPDATE extraction_runs SET {sets} WHERE run_id = %s", [*fields.values(), run_id])
+
+def _check_budget(model, budget_usd):
+    # unknown prices: every call costs None, a USD cap would never stop the run
+    if budget_usd is not None and model_prices(model) is None:
+        raise ValueError(f"No prices known for {model}: set [claude] prices to use a USD budget")
+
+def _triage_spend(run_id):
+    with pooled_connection() as conn:
+        return float(conn.execute(
+            "SELECT COALESCE(SUM(cost_usd), 0) FROM extraction_calls WHERE run_id = %s AND stage = 'triage'",
+            (run_id,)
+        ).fetchone()[0])
+
+def _triage_batch(run_id, batch, triage):
+    """
+    Score a batch of stale chunks, one triage_chunks() pass per file (ledger rows carry it).
+    Return: ({chunk_id: score}, USD spent)
+    """
+    by_file = {}
+    for chunk_id, content, _, filename, _ in batch:
+        by_file.setdefault(filename, []).append((chunk_id, content))
+
+    before = _triage_spend(run_id)
+    scores = {}
+    for filename, chunks in by_file.items():
+        scores.update(triage_chunks(chunks, triage, filename, run_id=run_id))
+    return scores, _triage_spend(run_id) - before
+
+def start_run(filenames=None, priority="risk", max_chunks=None, budget_usd=None, progress=None, triage=None):
+    """
+    New run over the out-of-date chunks of filenames (default: every file).
+    priority: one of PRIORITIES ("risk": chunks with high-risk issues first)
+    max_chunks / budget_usd: caps over the whole run (chunks staged / USD from the ledger)
+    triage: cascade settings (triage.triage_settings); None = from the settings, False = off
+    Return: the run (see get_run)
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority} (one of {', '.join(PRIORITIES)})")
+    if triage is None:
+        triage = triage_settings()
+    _check_budget(get_anthropic_model(), budget_usd)
+    if triage:
+        _check_budget(triage["model"], budget_usd)
+    init_reextraction_tables()
+
+    run_id = uuid.uuid4().hex[:12]
+    with pooled_connection() as conn:
+        conn.execute("""
+            INSERT INTO extraction_runs
+                (run_id, prompt_version, model, filenames, priority, max_chunks, budget_usd, status,
+                 triage_model, triage_threshold)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, 'running', %s, %s)
+        """, (run_id, PROMPT_VERSION, get_anthropic_model(), list(filenames) if filenames else None,
+              priority, max_chunks, budget_usd,
+              triage["model"] if triage else None, triage["threshold"] if triage else None))
+    return resume_run(run_id, progress=progress)
+
+def resume_run(run_id, max_chunks=None, budget_usd=None, progress=None):
+    """
+    Continue a run (new limits replace the stored ones). The stamp must still be current.
+    Stale chunks go through the run's triage cascade first: those scored below its threshold
+    are staged with no issues and the triage stamp, without a primary call.
+    Chunks that fail are left stale for a later run, not retried in this one.
+    progress: optional fn(stage, **counters), called after each chunk
+    """
+    init_reextraction_tables()
+    run = get_run(run_id)
+    if run["status"] in ("promoted", "discarded"):
+        raise ValueError(f"Run {run_id} is {run['status']}")
+    if (run["prompt_version"], run["model"]) != (PROMPT_VERSION, get_anthropic_model()):
+        raise ValueError(
+            f"Run {run_id} was started for prompt {run['prompt_version']} / {run['model']}, "
+            f"current is {PROMPT_VERSION} / {get_anthropic_model()}: start a new run"
+        )
+
+    max_chunks = max_chunks if max_chunks is not None else run["max_chunks"]
+    budget_usd = budget_usd if budget_usd is not None else run["budget_usd"]
+    triage = _run_triage(run)
+    _check_budget(run["model"], budget_usd)
+    if triage:
+        _check_budget(triage["model"], budget_usd)
+    done, failed, spent = run["chunks_done"], run["chunks_failed"], run["spent_usd"] or 0.0
+    _update_run(run_id, status="running", max_chunks=max_chunks, budget_usd=budget_usd)
+
+    print(f"🔁 Re-extraction run {run_id} ({run['priority']} first, prompt {PROMPT_VERSION}, {run['model']})")
+    status = "completed"
+    failed_ids = set()   # not staged: left stale for a later run instead of retried here
+    with span("reextract.run", run_id=run_id) as tags:
+        while status == "completed":
+            room = max_chunks - done if max_chunks else RUN_BATCH_SIZE
+            if room <= 0:
+                status = "budget_exhausted"
+                break
+
+            batch = _next_chunks(run, min(room, RUN_BATCH_SIZE), failed_ids)
+            if not batch:
+                break
+
+            scores = {}
+            if triage:
+                if budget_usd is not None and spent >= budget_usd:
+                    status = "budget_exhausted"
+                    break
+                scores, triage_usd = _triage_batch(run_id, batch, triage)
+                spent += triage_usd
+
+            for chunk_id, content, page, filename, pdf_link in batch:
+                score = scores.get(chunk_id)
+                if score is not None and score < triage["threshold"]:
+                    try:
+                        _stage_chunk(run_id, chunk_id, filename, page, pdf_link, [], triage_stamp(triage),
+                                     triage, score)
+                        done += 1
+                    except Exception as e:
+                        failed += 1
+                        failed_ids.add(chunk_id)
+                        print(f"[ERROR] chunk_id={chunk_id}: {e}")
+                    inc("reextract_chunks_total", status="triage_dropped")
+                    _update_run(run_id, chunks_done=done, chunks_failed=failed, spent_usd=spent)
+                    if progress:
+                        progress("reextract", chunks_done=done, chunks_failed=failed, spent_usd=round(spent, 4))
+                    continue
+
+                # stop before a call that would likely cross the USD cap
+                per_call = spent / (done + failed) if done + failed else 0.0
+                if budget_usd is not None and spent + per_call > budget_usd:
+                    status = "budget_exhausted"
+                    break
+
+                call = new_call(chunk_id, filename, content, run_id=run_id)
+                try:
+                    with span("reextract.chunk", filename=filename, chunk_id=chunk_id, page=page):
+                        issues = call_extraction(content, call)
+                        call["parse_status"] = "db_error"
+                        _stage_chunk(run_id, chunk_id, filename, page, pdf_link, issues, call, triage, score)
+                        call.update(parse_status="ok", issues_found=len(issues))
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    failed_ids.add(chunk_id)
+                    call["error"] = str(e)[:1000]
+                    print(f"[ERROR] chunk_id={chunk_id}: {e}")
+
+                spent += record_call(**call) or 0.0
+                inc("reextract_chunks_total", status=call["parse_status"])
+                _update_run(run_id, chunks_done=done, chunks_failed=failed, spent_usd=spent)
+
+                if progress:
+                    progress("reextract", chunks_done=done, chunks_failed=failed, spent_usd=round(spent, 4))
+
+        tags.update(status=status, chunks=done, failed=failed, spent_usd=round(spent, 4))
+
+    with pooled_connection() as conn:
+        conn.execute(
+            "UPDATE extraction_runs SET status = %s, finished_at = now() WHERE run_id = %s",
+            (status, run_id)
+        )
+
+    print(f"✅ Run {run_id}: {status}, {done} chunks staged, {failed} failed, ${spent:.2f} spent")
+    return get_run(run_id)
+
+def list_runs(limit=20):
+    with pooled_connection() as conn:
+        cur = conn.execute("SELECT * FROM extraction_runs ORDER BY created_at DESC LIMIT %s", (limit,))
+        names = [d.name for d in cur.description]
+        return [dict(zip(names, row)) for row in cur.fetchall()]
+
+# ========== DIFF / PROMOTE / DISCARD ==========
+def _norm(text):
+    return " ".join((text or "").lower().split())
+
+def diff_run(run_id):
+    """
+    Live vs staged issues of the chunks a run re-extracted, matched on the normalized quote.
+    Return: {"chunks", "unchanged_chunks", "added", "removed", "risk_changed", "files": {...}}
+    """
+    init_reextraction_tables()
+    with pooled_connection() as conn:
+        live = conn.execute("""
+            SELECT d.chunk_id, d.filename, d.page, d.quoted_text, d.risk_level, d.issue_type
+            FROM deposition_issues d
+            JOIN staged_chunks s ON s.chunk_id = d.chunk_id AND s.run_id = %s
+        """, (run_id,)).fetchall()
+        staged = conn.execute("""
+            SELECT chunk_id, filename, page, quoted_text, risk_level, issue_type
+            FROM staged_issues
+            WHERE run_id = %s
+        """, (run_id,)).fetchall()
+        chunks = conn.execute(
+            "SELECT chunk_id, filename FROM staged_chunks WHERE run_id = %s", (run_id,)
+        ).fetchall()
+
+    def by_chunk(rows):
+        out = {}
+        for chunk_id, filename, page, quote, risk, issue_type in rows:
+            out.setdefault(chunk_id, {})[_norm(quote)] = {
+                "chunk_id": chunk_id, "filename": filename, "page": page,
+                "quoted_text": quote, "risk_level": risk, "issue_type": issue_type,
+            }
+        return out
+
+    old, new = by_chunk(live), by_chunk(staged)
+    result = {"run_id": run_id, "chunks": len(chunks), "unchanged_chunks": 0,
+              "added": [], "removed": [], "risk_changed": [], "files": {}}
+
+    for chunk_id, filename in chunks:
+        before, after = old.get(chunk_id, {}), new.get(chunk_id, {})
+        added = [after[q] for q in after.keys() - before.keys()]
+        removed = [before[q] for q in before.keys() - after.keys()]
+        changed = [
+            {**after[q], "old_risk_level": before[q]["risk_level"]}
+            for q in after.keys() & before.keys()
+            if _norm(after[q]["risk_level"]) != _norm(before[q]["risk_level"])
+        ]
+        result["added"] += added
+        result["removed"] += removed
+        result["risk_changed"] += changed
+        if not (added or removed or changed):
+            result["unchanged_chunks"] += 1
+
+        f = result["files"].setdefault(filename, {"chunks": 0, "added": 0, "removed": 0, "risk_changed": 0})
+        f["chunks"] += 1
+        f["added"] += len(added)
+        f["removed"] += len(removed)
+        f["risk_changed"] += len(changed)
+
+    return result
+
+def promote_run(run_id, force=False):
+    """
+    Swap a run's staged issues in for the live ones of its chunks and re-stamp them,
+    in one transaction. force: also promote a run stopped by its budget.
+    Return: number of chunks promoted
+    """
+    init_reextraction_tables()
+    run = get_run(run_id)
+    if run["status"] in ("promoted", "discarded", "running"):
+        raise ValueError(f"Run {run_id} is {run['status']}")
+    if run["status"] != "completed" and not force:
+        raise ValueError(f"Run {run_id} is {run['status']}: resume it or promote with force")
+
+    with span("reextract.promote", run_id=run_id), pooled_connection() as conn:
+        with conn.cursor() as cur:
+            files = [r[0] for r in cur.execute(
+                "SELECT DISTINCT filename FROM staged_chunks WHERE run_id = %s", (run_id,)
+            ).fetchall()]
+
+            cur.execute("""
+                DELETE FROM deposition_issues
+                WHERE chunk_id IN (SELECT chunk_id FROM staged_chunks WHERE run_id = %s)
+            """, (run_id,))
+            cur.execute("""
+                INSERT INTO deposition_issues (
+                    issue_id, chunk_id, filename, page, issue_type, quoted_text,
+                    legal_relevance, risk_level, pdf_link, prompt_version, model
+                )
+                SELECT
+                    issue_id, chunk_id, filename, page, issue_type, quoted_text,
+                    legal_relevance, risk_level, pdf_link, prompt_version, model
+                FROM staged_issues
+                WHERE run_id = %s
+            """, (run_id,))
+            cur.execute("""
+                UPDATE issue_progress p
+                SET prompt_version = COALESCE(s.prompt_version, %s), model = COALESCE(s.model, %s),
+                    extracted_at = s.staged_at, triage_model = s.triage_model, triage_score = s.triage_score
+                FROM staged_chunks s
+                WHERE s.run_id = %s AND p.chunk_id = s.chunk_id
+            """, (run["prompt_version"], run["model"], run_id))
+            promoted = cur.rowcount
+
+            cur.execute("DELETE FROM staged_issues WHERE run_id = %s", (run_id,))
+            cur.execute("DELETE FROM staged_chunks WHERE run_id = %s", (run_id,))
+            cur.execute(
+                "UPDATE extraction_runs SET status = 'promoted', promoted_at = now() WHERE run_id = %s",
+                (run_id,)
+            )
+
+            # invalidate cached file stats / issues in the review app
+            if files:
+                bump_data_version(cur, "chunks", *[issues_scope(f) for f in files])
+
+    # the swapped-in issues may duplicate ones of neighbouring chunks, and old links are stale
+    for filename in files:
+        verify_file(filename)
+        dedup_file(filename)
+
+    print(f"✅ Promoted run {run_id}: {promoted} chunks in {len(files)} files")
+    return promoted
+
+def discard_run(run_id):
+    init_reextraction_tables()
+    with pooled_connection() as conn:
+        conn.execute("DELETE FROM staged_issues WHERE run_id = %s", (run_id,))
+        conn.execute("DELETE FROM staged_chunks WHERE run_id = %s", (run_id,))
+        conn.execute(
+            "UPDATE extraction_runs SET status = 'discarded', finished_at = now() WHERE run_id = %s",
+            (run_id,)
+        )
+    print(f"🗑️ Discarded run {run_id}")
@@ -0,0 +1,213 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from cache_utils import LRUCache
+from db_utils import init_search_tables, search_chunks_fulltext
+from index import embed_query
+from telemetry import inc, observe
+from vector_store import get_vector_store
+
+RRF_K = 60                 # reciprocal rank fusion constant
+CANDIDATES_PER_SOURCE = 50
+SEARCH_TIMEOUT = 0.18      # seconds for the whole search; sources not done by then are "pending"
+SIMILAR_TOP_K = 5
+SIMILAR_OVERFETCH = 4      # first fetch k * this; grown until k hits survive the filters
+SIMILAR_MAX_FETCH = 400
+SIMILAR_PER_FILE = 2       # spread results across depositions
+
+_executor = ThreadPoolExecutor(max_workers=4)
+_warmup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-warmup")
+_warmup = None
+_warmup_lock = threading.Lock()
+_inflight = {}   # (source, query, filters) -> future still running after its search timed out
+_inflight_lock = threading.Lock()
+
+# shared by every session of the app process
+_embedding_cache = LRUCache(maxsize=1024)   # quoted_text -> vector
+_similar_cache = LRUCache(maxsize=512)      # (index version, quoted_text, k, exclude file) -> hits
+
+# ========== WARM-UP ==========
+def _warm():
+    init_search_tables()        # SSH tunnel + pool, content_tsv on databases from before it
+    embed_query("warm up")      # embedding model
+    get_vector_store().version()
+
+def warm_search():
+    """
+    Open the pool and load the embedding model in the background, once per process, so
+    the first search doesn't pay for them. Return: the warm-up future
+    """
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = _warmup_executor.submit(_warm)
+        return _warmup
+
+def search_ready():
+    return _warmup is not None and _warmup.done()
+
+# ========== HYBRID SEARCH ==========
+def _timed(source, fn, *args):
+    """
+    Return: (fn(*args), seconds). Latency is observed even when the caller stopped waiting.
+    """
+    started = time.perf_counter()
+    try:
+        return fn(*args), time.perf_counter() - started
+    finally:
+        observe("search_source_seconds", time.perf_counter() - started, source=source)
+
+def _keyword_hits(query, filenames, pages, limit):
+    rows = search_chunks_fulltext(query, filenames=filenames, pages=pages, limit=limit)
+    return [
+        {
+            "chunk_id": chunk_id,
+            "filename": filename,
+            "page": page,
+            "chunk_index": chunk_index,
+            "content": content,
+            "pdf_link": pdf_link,
+        }
+        for chunk_id, filename, page, chunk_index, content, pdf_link, _ in rows
+    ]
+
+def _vector_hits(query, filenames, pages, limit):
+    # over-fetch when filtering by page, the vector store only filters by file
+    hits = get_vector_store().search(query, k=limit * 4 if pages else limit, filenames=filenames)
+    if pages:
+        pages = set(pages)
+        hits = [h for h in hits if h["page"] in pages]
+    return hits[:limit]
+
+def _submit(source, fn, query, filenames, pages, limit):
+    """
+    One future per (source, query, filters): a search repeated while the previous one is
+    still running (a retry after a timeout) waits on it instead of queueing another.
+    """
+    key = (source, query, tuple(filenames or ()), tuple(pages or ()), limit)
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        new = fut is None
+        if new:
+            fut = _inflight[key] = _executor.submit(_timed, source, fn, query, filenames, pages, limit)
+    if new:
+        # outside the lock: a future already done runs the callback right here
+        fut.add_done_callback(lambda f: _forget(key, f))
+    return fut
+
+def _forget(key, fut):
+    with _inflight_lock:
+        if _inflight.get(key) is fut:
+            del _inflight[key]
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K):
+    """
+    Merge ranked hit lists. Hits are matched on (filename, page, chunk_index)
+    because Postgres and FAISS do not share chunk ids.
+    """
+    fused = {}
+    for source, hits in ranked_lists.items():
+        for rank, hit in enumerate(hits, start=1):
+            key = (hit["filename"], hit["page"], hit["chunk_index"])
+            entry = fused.setdefault(key, {**hit, "score": 0.0, "sources": []})
+            entry["score"] += 1.0 / (k + rank)
+            entry["sources"].append(source)
+            if not entry.get("pdf_link") and hit.get("pdf_link"):
+                entry["pdf_link"] = hit["pdf_link"]
+
+    return sorted(fused.values(), key=lambda h: h["score"], reverse=True)
+
+def hybrid_search(query: str, k: int = 20, filenames=None, pages=None):
+    """
+    Keyword (Postgres FTS) + semantic (vector store) search fused with RRF, both sources
+    sharing one SEARCH_TIMEOUT deadline. A source not done by then is left out and listed
+    in "pending": cancelled if it never started, else it keeps running (and warming the
+    pool / model) and the same search asked again waits on it.
+    Return: {"hits": [{"filename", "page", "chunk_index", "content", "pdf_link", "score", "sources"}, ...],
+             "pending": [source], "failed": [source], "latency_ms": {source: ms, "total": ms}}
+    """
+    result = {"hits": [], "pending": [], "failed": [], "latency_ms": {}}
+    if not query or not query.strip():
+        return result
+
+    started = time.perf_counter()
+    limit = max(k, CANDIDATES_PER_SOURCE)
+    futures = {
+        "keyword": _submit("keyword", _keyword_hits, query, filenames, pages, limit),
+        "semantic": _submit("semantic", _vector_hits, query, filenames, pages, limit),
+    }
+    done, not_done = wait(futures.values(), timeout=SEARCH_TIMEOUT)
+    for fut in not_done:
+        fut.cancel()   # still queued behind other searches: don't hold a worker for nobody
+
+    ranked_lists = {}
+    for source, fut in futures.items():
+        if fut not in done:
+            result["pending"].append(source)
+            inc("search_pending_total", source=source)
+            continue
+        try:
+            ranked_lists[source], seconds = fut.result()
+            result["latency_ms"][source] = round(seconds * 1000, 1)
+        except Exception as e:
+            result["failed"].append(source)
+            print(f"⚠️ {source} search failed: {e}")
+
+    result["hits"] = reciprocal_rank_fusion(ranked_lists)[:k]
+    seconds = time.perf_counter() - started
+    result["latency_ms"]["total"] = round(seconds * 1000, 1)
+    observe("search_seconds", seconds)
+    return result
+
+def _cached_embedding(text):
+    vec = _embedding_cache.get(text)
+    if vec is None:
+        vec = embed_query(text, instruction=False)
+        _embedding_cache.put(text, vec)
+    return vec
+
+def _spread(hits, k, exclude):
+    """
+    Top-k hits outside the excluded file, one per page and SIMILAR_PER_FILE per file
+    (neighbouring and overlapping chunks of one deposition would fill the list otherwise).
+    """
+    picked, pages, per_file = [], set(), {}
+    for h in hits:
+        if h["filename"] == exclude or (h["filename"], h["page"]) in pages:
+            continue
+        if per_file.get(h["filename"], 0) >= SIMILAR_PER_FILE:
+            continue
+        pages.add((h["filename"], h["page"]))
+        per_file[h["filename"]] = per_file.get(h["filename"], 0) + 1
+        picked.append(h)
+        if len(picked) == k:
+            break
+    return picked
+
+def find_similar_testimony(quoted_text: str, k: int = SIMILAR_TOP_K, exclude=None):
+    """
+    Chunks of other depositions most similar to a quoted statement.
+    exclude: filename of the source issue, left out of the results
+    Results are cached per index version, so a new index generation invalidates them.
+    """
+    if not quoted_text or not quoted_text.strip():
+        return []
+
+    store = get_vector_store()
+    key = (store.version(), quoted_text, k, exclude)
+    hits = _similar_cache.get(key)
+    if hits is not None:
+        return hits
+
+    vec = _cached_embedding(quoted_text)
+    fetch = k * SIMILAR_OVERFETCH
+    while True:
+        raw = store.search(vec, k=fetch)
+        hits = _spread(raw, k, exclude)
+        # stop when k survived, the store has nothing more, or the fetch cap is reached
+        if len(hits) >= k or len(raw) < fetch or fetch >= SIMILAR_MAX_FETCH:
+            break
+        fetch = min(fetch * SIMILAR_OVERFETCH, SIMILAR_MAX_FETCH)
+
+    _similar_cache.put(key, hits)
+    return hits
@@ -0,0 +1,338 @@
+"""
+Spans and metrics for ingest, extraction and review, without an OpenTelemetry SDK.
+
+    with span("pdf.parse_page", page=3) as tags:
+        ...
+        tags["has_ocr"] = True
+    inc("llm_tokens_total", resp.usage.output_tokens, direction="output")
+
+Spans nest per thread (contextvars) and inherit the filename / chunk_id / job_id tags of
+their parent. Finished spans go to the exporter set by telemetry.exporter:
+    "none"   (default) metrics only
+    "jsonl"  one JSON object per span, appended to telemetry.jsonl_path
+    "otlp"   batched OTLP/HTTP JSON to telemetry.otlp_endpoint (http://collector:4318)
+Every span also feeds the span_duration_seconds histogram. prometheus_text() renders all
+metrics in the Prometheus text format; they are served on telemetry.metrics_port when set,
+by the main process only: worker processes return drain_metrics() to it.
+"""
+import atexit
+import contextvars
+import json
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import get_config
+
+SERVICE_NAME = "deposition-extractor"
+METRIC_PREFIX = "depo_"
+INHERITED_TAGS = ("filename", "chunk_id", "job_id")
+METRIC_TAGS = ("filename",)   # chunk_id / job_id would create a series per chunk / job
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DEFAULT_JSONL_PATH = os.path.join("data", "telemetry", "spans.jsonl")
+OTLP_BATCH_SIZE = 512
+OTLP_FLUSH_INTERVAL = 5.0
+
+_current = contextvars.ContextVar("telemetry_span", default=None)
+
+_metrics_lock = threading.Lock()
+_counters = {}     # (name, labels) -> value
+_histograms = {}   # (name, labels) -> {"buckets", "counts", "sum", "count"}
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+def _new_id(n_bytes):
+    return os.urandom(n_bytes).hex()
+
+# ========== METRICS ==========
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+def inc(name, value=1, **labels):
+    key = (name, _labels(labels))
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, buckets=DURATION_BUCKETS, **labels):
+    key = (name, _labels(labels))
+    with _metrics_lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(h["buckets"]):
+            if value <= bound:
+                h["counts"][i] += 1
+                break
+        h["sum"] += value
+        h["count"] += 1
+
+def drain_metrics():
+    """
+    Take every counter and histogram recorded so far and reset them.
+    Return: {"counters": {key: value}, "histograms": {key: histogram}} for merge_metrics()
+    """
+    with _metrics_lock:
+        snapshot = {"counters": dict(_counters), "histograms": dict(_histograms)}
+        _counters.clear()
+        _histograms.clear()
+    return snapshot
+
+def merge_metrics(snapshot):
+    """
+    Add a drain_metrics() snapshot of another process (batch ingest workers) to this one's.
+    """
+    if not snapshot:
+        return
+    with _metrics_lock:
+        for key, value in snapshot["counters"].items():
+            _counters[key] = _counters.get(key, 0) + value
+        for key, other in snapshot["histograms"].items():
+            h = _histograms.get(key)
+            if h is None:
+                _histograms[key] = dict(other, counts=list(other["counts"]))
+                continue
+            h["counts"] = [a + b for a, b in zip(h["counts"], other["counts"])]
+            h["sum"] += other["sum"]
+            h["count"] += other["count"]
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+def prometheus_text():
+    """
+    Return: every counter and histogram in the Prometheus text exposition format.
+    """
+    with _metrics_lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, dict(v, counts=list(v["counts"]))) for k, v in _histograms.items())
+
+    lines, typed = [], set()
+    for (name, labels), value in counters:
+        metric = METRIC_PREFIX + name
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} counter")
+            typed.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+    for (name, labels), h in histograms:
+        metric = METRIC_PREFIX + name
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} histogram")
+            typed.add(metric)
+        cumulative = 0
+        for bound, count in zip(h["buckets"], h["counts"]):
+            cumulative += count
+            lines.append(f"{metric}_bucket{_format_labels(labels, [('le', repr(float(bound)))])} {cumulative}")
+        lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {h['count']}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {h['sum']}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {h['count']}")
+
+    return "\n".join(lines) + "\n"
+
+def write_metrics(path):
+    """
+    Prometheus textfile-collector style dump (cron jobs have nothing to scrape).
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve_metrics(port):
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    except OSError as e:  # another process of this host already serves the port
+        print(f"⚠️ Metrics endpoint not started on :{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Prometheus metrics on :{port}/metrics")
+    return server
+
+# ========== SPAN EXPORTERS ==========
+class JsonlExporter:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "a", buffering=1, encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def export(self, record):
+        line = json.dumps(record, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+def _otlp_value(v):
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+def _otlp_span(record):
+    start_ns = int(record["start"] * 1e9)
+    out = {
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        "name": record["name"],
+        "kind": 1,  # INTERNAL
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(start_ns + int(record["duration_ms"] * 1e6)),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in record["tags"].items()],
+        "status": {"code": 2, "message": record["error"]} if record.get("error") else {"code": 1},
+    }
+    if record.get("parent_id"):
+        out["parentSpanId"] = record["parent_id"]
+    return out
+
+class OtlpExporter:
+    """
+    Buffers spans and POSTs them as OTLP/HTTP JSON from a background thread.
+    """
+    def __init__(self, endpoint):
+        self.url = endpoint.rstrip("/") + ("" if endpoint.rstrip("/").endswith("/v1/traces") else "/v1/traces")
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.warned = False
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def export(self, record):
+        with self.lock:
+            self.buffer.append(record)
+            full = len(self.buffer) >= OTLP_BATCH_SIZE
+        if full:
+            self.wake.set()
+
+    def _loop(self):
+        while True:
+            self.wake.wait(OTLP_FLUSH_INTERVAL)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        import requests
+
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+        if not batch:
+            return
+
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "telemetry"}, "spans": [_otlp_span(r) for r in batch]}],
+        }]}
+        try:
+            requests.post(self.url, json=payload, timeout=5).raise_for_status()
+        except Exception as e:
+            if not self.warned:  # collector down: drop spans, don't flood the log
+                print(f"⚠️ OTLP export to {self.url} failed, dropping spans: {e}")
+                self.warned = True
+
+def get_exporter():
+    """
+    Span exporter from the settings, built on first use. Return: exporter or None
+    """
+    global _exporter
+
+    with _exporter_lock:
+        if _exporter is None:
+            kind = get_config("telemetry", "exporter", "none")
+            if kind == "jsonl":
+                _exporter = JsonlExporter(get_config("telemetry", "jsonl_path", DEFAULT_JSONL_PATH))
+            elif kind == "otlp":
+                _exporter = OtlpExporter(get_config("telemetry", "otlp_endpoint", "http://localhost:4318"))
+            else:
+                _exporter = False
+
+            port = get_config("telemetry", "metrics_port", None, cast=int)
+            # spawned workers hand their metrics to the parent (merge_metrics), which serves them
+            if port and multiprocessing.parent_process() is None:
+                serve_metrics(port)
+        return _exporter or None
+
+def flush():
+    if _exporter:
+        _exporter.flush()
+
+atexit.register(flush)
+
+# ========== SPANS ==========
+@contextmanager
+def span(name, **tags):
+    """
+    Time a block. Yields its tags dict: add tags (counts, sizes) while it runs.
+    Exceptions are recorded on the span and re-raised.
+    """
+    parent = _current.get()
+    if parent:
+        for key in INHERITED_TAGS:
+            if key not in tags and key in parent["tags"]:
+                tags[key] = parent["tags"][key]
+
+    record = {
+        "name": name,
+        "trace_id": parent["trace_id"] if parent else _new_id(16),
+        "span_id": _new_id(8),
+        "parent_id": parent["span_id"] if parent else None,
+        "start": time.time(),
+        "tags": tags,
+    }
+    token = _current.set(record)
+    started = time.perf_counter()
+    try:
+        yield tags
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        duration = time.perf_counter() - started
+        record["duration_ms"] = round(duration * 1000, 3)
+
+        metric_labels = {k: tags.get(k) for k in METRIC_TAGS}
+        observe("span_duration_seconds", duration, span=name, **metric_labels)
+        if record.get("error"):
+            inc("span_errors_total", span=name, **metric_labels)
+
+        exporter = get_exporter()
+        if exporter:
+            record["pid"] = os.getpid()
+            exporter.export(record)
+
+def current_tags():
+    """
+    Return: tags of the innermost open span ({} outside spans).
+    """
+    parent = _current.get()
+    return parent["tags"] if parent else {}
@@ -0,0 +1,41 @@
+import fitz
+import pytest
+import requests
+from benchmarks.standins import fake_anthropic
+from benchmarks.synthetic import make_corpus, make_deposition_pdf
+
+def test_synthetic_deposition_has_scanned_pages_without_text():
+    doc = fitz.open(stream=make_deposition_pdf(pages=20, image_fraction=0.5, seed=3), filetype="pdf")
+    assert doc.page_count == 20
+    assert "VIDEOTAPED DEPOSITION OF" in doc[0].get_text()
+    scanned = [p for p in doc if not p.get_text().strip()]
+    assert 0 < len(scanned) < 19 and all(p.get_images() for p in scanned)
+    assert all("Q. " in p.get_text() for p in doc if p.number and p.get_text().strip())
+
+def test_synthetic_corpus_is_reproducible():
+    first, second = make_corpus(files=2, pages=3, seed=7), make_corpus(files=2, pages=3, seed=7)
+    assert [name for name, _ in first] == ["synthetic_depo_000.pdf", "synthetic_depo_001.pdf"]
+    assert first[0][1] != first[1][1]
+    text = lambda data: [p.get_text() for p in fitz.open(stream=data, filetype="pdf")]
+    assert text(first[1][1]) == text(second[1][1])
+
+def post(server, **body):
+    r = requests.post(f"{server.base_url}/v1/messages", json={"model": "m", "max_tokens": 1024, **body}, timeout=10)
+    r.raise_for_status()
+    return r.json()
+
+def test_fake_anthropic_quotes_answers_scores_excerpts_and_truncates():
+    transcript = "Transcript:\nQ. Did you warn users?\nA. No warning was added.\n"
+    with fake_anthropic(latency_ms=0, ms_per_output_token=0, jitter=0) as server:
+        reply = post(server, messages=[{"role": "user", "content": transcript}],
+                     tools=[{"name": "record_issues"}])
+        assert reply["stop_reason"] == "tool_use"
+        assert reply["content"][0]["input"]["issues"][0]["quoted_text"] == "No warning was added."
+
+        reply = post(server, messages=[{"role": "user", "content": "Excerpts:\n\n[1]\nfoo\n\n[2]\nbar"}],
+                     tools=[{"name": "record_scores"}])
+        assert sorted(reply["content"][0]["input"]["scores"]) == ["1", "2"]
+
+        reply = post(server, max_tokens=2, messages=[{"role": "user", "content": transcript}])
+        assert reply["stop_reason"] == "max_tokens" and len(reply["content"][0]["text"]) == 8
+        assert server.requests == 3
@@ -0,0 +1,71 @@
+import io
+import json
+import pytest
+import cli
+
+@pytest.fixture
+def events(monkeypatch):
+    out = io.StringIO()
+    monkeypatch.setattr(cli, "_out", out)
+    return lambda: [json.loads(line) for line in out.getvalue().splitlines()]
+
+def test_export_arguments():
+    args = cli.build_parser().parse_args([
+        "export", "--out", "bundle.zip", "--format", "zip", "--risk", "HIGH", "--risk", "Medium",
+        "--file", "a.pdf", "--file", "b.pdf", "--batch-size", "100",
+    ])
+    assert args.func is cli.cmd_export
+    assert args.risk == ["high", "medium"] and args.files == ["a.pdf", "b.pdf"]
+    assert (args.format, args.sort, args.batch_size, args.dry_run) == ("zip", "page", 100, False)
+
+def test_extract_and_reextract_arguments():
+    parser = cli.build_parser()
+    args = parser.parse_args(["extract", "--all", "--triage-model", "small", "--triage-threshold", "0.2"])
+    assert args.all and args.files == [] and (args.triage_model, args.triage_threshold) == ("small", 0.2)
+    assert args.workers == cli.DEFAULT_WORKERS
+
+    args = parser.parse_args(["reextract", "resume", "abc123", "--budget-usd", "5", "--promote"])
+    assert (args.action, args.targets, args.budget_usd, args.promote) == ("resume", ["abc123"], 5.0, True)
+
+    for argv in ([], ["export"], ["reextract", "rollback"], ["ingest", "x.pdf", "--dropbox", "/f"]):
+        with pytest.raises(SystemExit):
+            parser.parse_args(argv)
+
+def test_progress_events_are_throttled_per_stage(events, monkeypatch):
+    monkeypatch.setattr(cli, "PROGRESS_EVENT_INTERVAL", 60)
+    progress = cli.json_progress("ingest", file="a.pdf")
+    progress("parse", pages=1)
+    progress("parse", pages=2)
+    progress("embed", chunks=10)
+    assert [(e["stage"], e["file"]) for e in events()] == [("parse", "a.pdf"), ("embed", "a.pdf")]
+    assert events()[0]["pages"] == 1
+
+def test_summary_exit_code_counts_failed_files(events):
+    assert cli._summary("ingest", 0.0, [{"file": "a.pdf"}, {"file": "b.pdf", "error": "bad"}]) == 1
+    assert cli._summary("ingest", 0.0, [{"file": "a.pdf"}], chunks=3) == 0
+    first, second = events()
+    assert (first["event"], first["ok"], first["failed"]) == ("summary", 1, 1)
+    assert second["chunks"] == 3
+
+def test_local_pdfs_are_collected_recursively(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ("b.PDF", "a.pdf", "notes.txt", "sub/c.pdf"):
+        (tmp_path / name).write_bytes(b"")
+    found = cli._collect_local([str(tmp_path), str(tmp_path / "notes.txt")])
+    assert [name for name, _ in found] == ["a.pdf", "b.PDF", "c.pdf"]
+    assert found[2][1] == ("path", str(tmp_path / "sub" / "c.pdf"))
+
+def test_export_reads_issues_page_by_page(monkeypatch):
+    db_utils = pytest.importorskip("db_utils")
+    pages = {None: ([("i1",), ("i2",)], "c1"), "c1": ([("i3",)], None)}
+    calls = []
+
+    def query_issues(filename, risks, issue_types, pages_filter, sort, limit, after):
+        calls.append((filename, risks, sort, limit, after))
+        return pages[after]
+
+    monkeypatch.setattr(db_utils, "query_issues", query_issues)
+    monkeypatch.setattr(db_utils, "ISSUE_COLUMNS", ["issue_id"])
+    args = cli.build_parser().parse_args(["export", "--out", "x.csv", "--risk", "HIGH", "--batch-size", "2"])
+    assert [r["issue_id"] for r in cli._iter_issues("a.pdf", args)] == ["i1", "i2", "i3"]
+    assert calls == [("a.pdf", ["high"], "page", 2, None), ("a.pdf", ["high"], "page", 2, "c1")]
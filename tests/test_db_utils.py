@@ -0,0 +1,114 @@
+import pytest
+
+pytest.importorskip("psycopg")
+import db_utils
+
+class FakeConn:
+    """
+    pooled_connection() stand-in: records statements, answers them from a queue of results.
+    """
+    def __init__(self, results=()):
+        self.results, self.executed = list(results), []
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.executed.append((" ".join(sql.split()), params))
+        self.result = self.results.pop(0) if self.results else []
+        return self
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(db_utils, "_query_cache", db_utils.LRUCache(maxsize=16))
+    monkeypatch.setattr(db_utils, "_version_cache", {})
+
+def test_cached_query_is_reused_until_the_scope_version_changes(fresh_cache, monkeypatch):
+    versions = FakeConn([[(3,)], [(3,)], [(4,)]])
+    monkeypatch.setattr(db_utils, "pooled_connection", versions)
+    monkeypatch.setattr(db_utils, "VERSION_CHECK_INTERVAL", 0)
+    loads = []
+    loader = lambda: loads.append(1) or len(loads)
+
+    assert db_utils.cached_query("issues:a.pdf", "page", loader) == 1
+    assert db_utils.cached_query("issues:a.pdf", "page", loader) == 1
+    # a writer bumped the version
+    assert db_utils.cached_query("issues:a.pdf", "page", loader) == 2
+    assert [params for _, params in versions.executed] == [("issues:a.pdf",)] * 3
+
+def test_version_is_trusted_for_the_check_interval(fresh_cache, monkeypatch):
+    versions = FakeConn([[(1,)]])
+    monkeypatch.setattr(db_utils, "pooled_connection", versions)
+    monkeypatch.setattr(db_utils, "VERSION_CHECK_INTERVAL", 60)
+
+    assert db_utils.get_data_version("chunks") == 1
+    assert db_utils.get_data_version("chunks") == 1
+    assert len(versions.executed) == 1
+    # no row yet: version 0
+    assert db_utils.get_data_version("issues:b.pdf") == 0
+
+def test_bump_increments_every_scope_in_the_writer_transaction():
+    cur = type("Cur", (), {"executemany": lambda self, sql, rows: setattr(self, "rows", rows)})()
+    db_utils.bump_data_version(cur, "chunks", db_utils.issues_scope("a.pdf"))
+    assert cur.rows == [("chunks",), ("issues:a.pdf",)]
+
+def issue_row(n, page):
+    # ISSUE_COLUMNS then the "risk" sort keys (risk rank, page, issue_id)
+    return (f"i{n}", "c1", "a.pdf", page, None, "HIGH", "", "q", "t", None, None, None, None, 0, page, f"i{n}")
+
+def test_query_issues_pages_by_keyset_cursor(monkeypatch):
+    conn = FakeConn([[issue_row(1, 3), issue_row(2, 4), issue_row(3, 9)], [issue_row(3, 9)]])
+    monkeypatch.setattr(db_utils, "pooled_connection", conn)
+
+    rows, cursor = db_utils.query_issues("a.pdf", risks=["HIGH"], pages=["4"], limit=2)
+    assert [r[0] for r in rows] == ["i1", "i2"] and len(rows[0]) == len(db_utils.ISSUE_COLUMNS)
+    assert cursor == (0, 4, "i2")
+
+    rows, cursor = db_utils.query_issues("a.pdf", risks=["HIGH"], pages=["4"], limit=2, after=cursor)
+    assert [r[0] for r in rows] == ["i3"] and cursor is None
+
+    (first, first_params), (second, second_params) = conn.executed
+    assert "WHERE filename = %s AND duplicate_of IS NULL AND risk_level = ANY(%s) AND page = ANY(%s) ORDER BY" in first
+    assert first_params == ["a.pdf", ["HIGH"], [4], 3]
+    rank = " ".join(db_utils.RISK_RANK_SQL.split())
+    assert f"AND ({rank}, page, issue_id) > (%s, %s, %s) ORDER BY {rank}, page, issue_id LIMIT %s" in second
+    assert second_params == ["a.pdf", ["HIGH"], [4], 0, 4, "i2", 3]
+
+def test_query_issues_without_limit_and_unknown_sort(monkeypatch):
+    conn = FakeConn([[issue_row(1, 3)]])
+    monkeypatch.setattr(db_utils, "pooled_connection", conn)
+    rows, cursor = db_utils.query_issues("a.pdf", sort="page", limit=None)
+    assert len(rows) == 1 and cursor is None
+    assert "LIMIT" not in conn.executed[0][0] and conn.executed[0][1] == ["a.pdf"]
+    with pytest.raises(ValueError):
+        db_utils.query_issues("a.pdf", sort="speaker")
+
+def test_issue_facets_count_every_option_and_the_filtered_total(monkeypatch):
+    conn = FakeConn([[
+        (0, 1, 1, "HIGH", None, None, 3, 2),
+        (0, 1, 1, "LOW", None, None, 1, 0),
+        (1, 0, 1, None, "causation", None, 4, 2),
+        (1, 1, 0, None, None, 12, 4, 2),
+        (1, 1, 1, None, None, None, 4, 2),
+    ]])
+    monkeypatch.setattr(db_utils, "pooled_connection", conn)
+    facets = db_utils.get_issue_facets("a.pdf", risks=["HIGH"])
+    assert facets == {"risk": {"HIGH": 3, "LOW": 1}, "issue_type": {"causation": 4}, "page": {12: 4},
+                      "total": 4, "matching": 2}
+    assert "COUNT(*) FILTER (WHERE risk_level = ANY(%s))" in conn.executed[0][0]
+    assert conn.executed[0][1] == [["HIGH"], "a.pdf"]
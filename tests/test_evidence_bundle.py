@@ -0,0 +1,74 @@
+import csv
+import io
+import zipfile
+from contextlib import contextmanager
+import fitz
+import pytest
+import evidence_bundle
+
+def make_pdf(pages):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"Page {i + 1}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+@pytest.fixture
+def depositions(monkeypatch):
+    pdfs = {"https://dbx/a.pdf": make_pdf(6), "https://dbx/b.pdf": make_pdf(3)}
+
+    @contextmanager
+    def acquire(pdf_link):
+        doc = fitz.open(stream=pdfs[pdf_link], filetype="pdf")
+        try:
+            yield pdf_link, doc
+        finally:
+            doc.close()
+
+    monkeypatch.setattr(evidence_bundle, "acquire_document", acquire)
+    return pdfs
+
+def issue(filename, page, risk="high", quote="we knew"):
+    return {"filename": filename, "page": page, "pdf_link": f"https://dbx/{filename}", "risk": risk,
+            "issue_type": "knowledge", "quoted_text": quote, "legal_relevance": "notice"}
+
+ISSUES = [issue("b.pdf", 2), issue("a.pdf", 5, "low"), issue("a.pdf", 2), issue("a.pdf", 5, quote="again")]
+
+def test_pdf_bundle_has_the_index_then_each_cited_page_once(depositions):
+    doc = fitz.open(stream=evidence_bundle.build_evidence_bundle(ISSUES, "pdf"), filetype="pdf")
+    assert doc.page_count == 1 + 3
+    # a.pdf p.2, a.pdf p.5 (both issues stamped), b.pdf p.2
+    assert [doc[i].get_text().split("Page ")[1].split()[0] for i in range(1, 4)] == ["2", "5", "2"]
+    assert "LOW - knowledge | HIGH - knowledge" in doc[2].get_text()
+
+def test_zip_bundle_has_index_files_and_one_pdf_per_deposition(depositions):
+    zf = zipfile.ZipFile(io.BytesIO(evidence_bundle.build_evidence_bundle(ISSUES, "zip")))
+    assert sorted(zf.namelist()) == ["a_evidence.pdf", "b_evidence.pdf", "index.csv", "index.pdf"]
+    rows = list(csv.DictReader(io.StringIO(zf.read("index.csv").decode())))
+    assert [(r["filename"], r["page"], r["risk"]) for r in rows] == [
+        ("a.pdf", "2", "HIGH"), ("a.pdf", "5", "LOW"), ("a.pdf", "5", "HIGH"), ("b.pdf", "2", "HIGH")
+    ]
+    with pytest.raises(ValueError):
+        evidence_bundle.build_evidence_bundle(ISSUES, "docx")
+
+def test_finished_jobs_expire_and_are_capped(monkeypatch):
+    monkeypatch.setattr(evidence_bundle, "_jobs", {})
+    monkeypatch.setattr(evidence_bundle, "MAX_BUNDLE_JOBS", 2)
+    jobs = evidence_bundle._jobs
+    jobs["running"] = {"finished_at": None}
+    jobs["expired"] = {"finished_at": 1000.0}
+    for n in range(3):
+        jobs[f"done{n}"] = {"finished_at": 5000.0 + n}
+
+    evidence_bundle._prune_jobs(now=5100.0)
+    assert sorted(jobs) == ["done1", "done2", "running"]
+
+def test_background_job_is_polled_then_discarded(depositions):
+    job_id = evidence_bundle.submit_evidence_bundle(ISSUES[:1], "pdf")
+    evidence_bundle._jobs[job_id]["future"].result(timeout=30)
+    job = evidence_bundle.get_bundle_job(job_id)
+    assert job["status"] == "done" and job["data"].startswith(b"%PDF") and job["count"] == 1
+
+    evidence_bundle.discard_bundle_job(job_id)
+    assert evidence_bundle.get_bundle_job(job_id) == {"status": "unknown"}
@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip("psycopg")
+import extraction_ledger
+
+class FakeConn:
+    def __init__(self, row=None, fail=None):
+        self.row, self.fail, self.executed = row, fail, []
+
+    def __call__(self):
+        if self.fail:
+            raise self.fail
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        return self
+
+    def fetchone(self):
+        return self.row
+
+def test_prices_match_the_most_specific_model_key():
+    assert extraction_ledger.model_prices("claude-opus-4-5-20251101")[0] == 5.00
+    assert extraction_ledger.model_prices("claude-opus-4-1")[0] == 15.00
+    assert extraction_ledger.model_prices("claude-3-5-haiku-latest")[0] == 0.80
+    assert extraction_ledger.model_prices("gpt-4o") is None
+    assert extraction_ledger.call_cost("gpt-4o", 1000, 1000) is None
+    # 1M input + 100k output + 200k cache reads on sonnet
+    assert extraction_ledger.call_cost("claude-sonnet-4-5", 1_000_000, 100_000, 0, 200_000) == pytest.approx(3 + 1.5 + 0.06)
+
+def test_record_call_writes_the_row_with_its_cost(monkeypatch):
+    conn = FakeConn()
+    monkeypatch.setattr(extraction_ledger, "pooled_connection", conn)
+    cost = extraction_ledger.record_call(chunk_id="c1", model="claude-haiku-4-5", input_tokens=1_000_000,
+                                         output_tokens=0, parse_status="ok")
+    assert cost == pytest.approx(1.0)
+    sql, params = conn.executed[0]
+    assert sql.startswith("INSERT INTO extraction_calls (chunk_id, model, input_tokens, output_tokens, "
+                          "parse_status, cost_usd, call_id)")
+    assert params[:6] == ["c1", "claude-haiku-4-5", 1_000_000, 0, "ok", cost]
+
+def test_record_call_never_raises(monkeypatch):
+    monkeypatch.setattr(extraction_ledger, "pooled_connection", FakeConn(fail=RuntimeError("pool closed")))
+    assert extraction_ledger.record_call(chunk_id="c1", model="unknown", parse_status="api_error") is None
+
+def test_projection_uses_defaults_then_the_model_history(monkeypatch):
+    monkeypatch.setattr(extraction_ledger, "pooled_connection", FakeConn((0, None, None, None, None, None)))
+    p = extraction_ledger.project(10, 7000, "claude-sonnet-4-5", prompt_chars=4000)
+    assert p["basis"] == "default"
+    assert p["input_tokens"] == 10 * 1000 + 7000 // 4
+    assert p["output_tokens"] == 10 * extraction_ledger.DEFAULT_OUTPUT_TOKENS
+    assert p["seconds"] == 10 * extraction_ledger.DEFAULT_LATENCY_S
+
+    # 2000 tokens of prompt + 0.3 tokens per transcript char, 500 output tokens, 4 s per call
+    monkeypatch.setattr(extraction_ledger, "pooled_connection", FakeConn((50, 2000.0, 0.3, 2200.0, 500.0, 4000.0)))
+    p = extraction_ledger.project(10, 7000, "claude-sonnet-4-5", prompt_chars=4000)
+    assert (p["basis"], p["calls"], p["input_tokens"], p["output_tokens"], p["seconds"]) == ("history", 50, 22100, 5000, 40.0)
+    assert p["cost_usd"] == pytest.approx((22100 * 3 + 5000 * 15) / 1e6)
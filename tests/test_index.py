@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+import index
+
+DIM = 8
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(index, "FAISS_DIR", str(tmp_path))
+    monkeypatch.setattr(index, "INDEX_PATH", str(tmp_path / "index.faiss"))
+    monkeypatch.setattr(index, "SQLITE_DB_PATH", str(tmp_path / "metadata.db"))
+    monkeypatch.setattr(index, "_current", {"snapshot": None, "manifest_mtime": None, "checked_at": 0.0})
+    return tmp_path
+
+def make_docs(filename, n, seed=0, collection="depos"):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, DIM)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    docs = [
+        {
+            "content": f"{filename} chunk {i}",
+            "metadata": {
+                "bates_id": f"{filename.upper()}_{i:03d}",
+                "source": filename,
+                "path": f"/{filename}",
+                "page": i + 1,
+                "chunk_index": 0,
+                "chunk_chars": 20,
+                "has_ocr": False,
+                "collection_id": collection,
+                "pdf_link": None,
+            },
+        }
+        for i in range(n)
+    ]
+    return docs, vectors
+
+def test_each_write_publishes_a_generation_with_per_shard_metadata(store):
+    docs, vectors = make_docs("a.pdf", 5)
+    index.add_to_shards(docs, vectors)
+    docs_b, vectors_b = make_docs("b.pdf", 3, seed=1)
+    index.add_to_shards(docs_b, vectors_b)
+
+    snap = index.current_snapshot(refresh=True)
+    assert snap.generation == 2
+    assert sorted(index.list_shards(snap=snap)) == sorted({index.shard_name(d["metadata"]) for d in docs + docs_b})
+    assert index.get_indexed_chunk_ids() == {d["metadata"]["bates_id"] for d in docs + docs_b}
+
+    # a.pdf's shard is shared with generation 1, not copied
+    shard_a = index.shard_name(docs[0]["metadata"])
+    assert os.stat(snap.shard_path(shard_a)).st_nlink == 2
+
+    hits = index.search_shards(vectors[2:3], k=1)
+    assert hits[0]["chunk_id"] == "A.PDF_002"
+
+def test_remove_leaves_other_files_and_renumbers_rows(store):
+    docs, vectors = make_docs("a.pdf", 4, collection="c")
+    docs_b, vectors_b = make_docs("b.pdf", 4, seed=1, collection="c")
+    index.SHARD_BY, shard_by = "collection", index.SHARD_BY
+    try:
+        index.add_to_shards(docs + docs_b, np.vstack([vectors, vectors_b]))
+        assert index.remove_from_shards(["a.pdf"]) == 4
+    finally:
+        index.SHARD_BY = shard_by
+
+    assert index.get_indexed_chunk_ids() == {d["metadata"]["bates_id"] for d in docs_b}
+    hits = index.search_shards(vectors_b[3:4], k=1)
+    assert hits[0]["chunk_id"] == "B.PDF_003"
+
+def test_pinned_generation_survives_pruning(store, monkeypatch):
+    monkeypatch.setattr(index, "KEEP_GENERATIONS", 1)
+    docs, vectors = make_docs("a.pdf", 2)
+    index.add_to_shards(docs, vectors)
+
+    with index.pinned_snapshot() as pinned:
+        for seed in range(1, 4):
+            index.add_to_shards(*make_docs(f"f{seed}.pdf", 2, seed=seed))
+        assert os.path.isdir(pinned.root)
+
+    # the next write prunes it once the reader is gone
+    index.add_to_shards(*make_docs("g.pdf", 2, seed=9))
+    assert not os.path.isdir(pinned.root)
+    assert sorted(os.listdir(os.path.join(store, index.GENERATIONS_SUBDIR))) == ["000005"]
+
+def test_failed_write_publishes_nothing(store):
+    index.add_to_shards(*make_docs("a.pdf", 2))
+    with pytest.raises(RuntimeError):
+        with index.new_generation():
+            raise RuntimeError("embedding failed")
+    assert index.current_snapshot(refresh=True).generation == 1
+    assert os.listdir(os.path.join(store, index.GENERATIONS_SUBDIR)) == ["000001"]
+
+def test_single_index_store_is_imported_as_generation_1(store):
+    docs, vectors = make_docs("a.pdf", 3)
+    docs_b, vectors_b = make_docs("b.pdf", 2, seed=1)
+    flat = faiss.IndexFlatIP(DIM)
+    flat.add(np.vstack([vectors, vectors_b]))
+    faiss.write_index(flat, index.INDEX_PATH)
+    index.init_sqlite(index.SQLITE_DB_PATH)
+    index.insert_metadata(docs + docs_b, index.SQLITE_DB_PATH)
+
+    hits = index.search_shards(vectors_b[1:2], k=1)
+    assert hits[0]["chunk_id"] == "B.PDF_001"
+    snap = index.current_snapshot()
+    assert snap.generation == 1
+    assert len(index.list_shards(["a.pdf"], snap)) == 1
+
+    conn = sqlite3.connect(snap.shard_db_path(index.shard_name(docs[0]["metadata"])))
+    assert conn.execute("SELECT COUNT(*) FROM chunks_v2").fetchone()[0] == 3
+    conn.close()
+
+def test_filtered_search_fills_k_from_shared_collection_shards(store, monkeypatch):
+    monkeypatch.setattr(index, "SHARD_BY", "collection")
+    docs, vectors = make_docs("a.pdf", 40, collection="c")
+    docs_b, _ = make_docs("b.pdf", 3, seed=1, collection="c")
+    # b.pdf's vectors sit right next to the query, a.pdf's further away
+    query = vectors[:1]
+    near = np.repeat(query, 3, axis=0)
+    index.add_to_shards(docs + docs_b, np.vstack([vectors, near]))
+
+    hits = index.search_shards(query, k=5, filenames=["a.pdf"])
+    assert len(hits) == 5 and {h["filename"] for h in hits} == {"a.pdf"}
+    assert hits[0]["chunk_id"] == "A.PDF_000"
+    assert [h["score"] for h in hits] == sorted((h["score"] for h in hits), reverse=True)
+
+    # fewer matches than k: every match, once
+    hits = index.search_shards(query, k=10, filenames=["b.pdf"])
+    assert sorted(h["chunk_id"] for h in hits) == ["B.PDF_000", "B.PDF_001", "B.PDF_002"]
@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import pytest
+
+pytest.importorskip("psycopg")
+import ingest_jobs
+
+@pytest.fixture
+def jobs_table(monkeypatch):
+    """
+    ingest_jobs rows in memory; batch ingest in threads instead of spawned processes.
+    """
+    rows = {}
+
+    def create_job(filename, created_by, batch_id=None):
+        job_id = f"job{len(rows)}"
+        rows[job_id] = {"job_id": job_id, "batch_id": batch_id, "filename": filename, "status": "queued",
+                        "stage": None, "stage_started_at": None, "updated_at": datetime.now(timezone.utc)}
+        return job_id
+
+    def update_job(job_id, stamps=(), **fields):
+        rows[job_id].update(fields, updated_at=datetime.now(timezone.utc))
+
+    def touch_jobs(job_ids):
+        for job_id in job_ids:
+            rows[job_id]["updated_at"] = datetime.now(timezone.utc)
+
+    monkeypatch.setattr(ingest_jobs, "_tables_ready", True)
+    monkeypatch.setattr(ingest_jobs, "_create_job", create_job)
+    monkeypatch.setattr(ingest_jobs, "_update_job", update_job)
+    monkeypatch.setattr(ingest_jobs, "_touch_jobs", touch_jobs)
+    monkeypatch.setattr(ingest_jobs, "list_ingest_jobs", lambda **kwargs: [])
+    monkeypatch.setattr(ingest_jobs, "ProcessPoolExecutor", lambda max_workers, mp_context: ThreadPoolExecutor(max_workers))
+    monkeypatch.setattr(ingest_jobs, "_ingest_executor", ThreadPoolExecutor(1))
+    monkeypatch.setattr(ingest_jobs, "_extract_executor", ThreadPoolExecutor(1))
+    return rows
+
+def read_back(row):
+    return ingest_jobs._job_from_row({**row, "db_now": datetime.now(timezone.utc)})
+
+def test_ingested_batch_file_waiting_for_extraction_is_not_interrupted(jobs_table, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(ingest_jobs, "JOB_STALE_SECONDS", 0.3)
+    monkeypatch.setattr(ingest_jobs, "_ingest_step", lambda job_id, pdf_bytes, filename: 1)
+    monkeypatch.setattr(ingest_jobs, "_extract_step", lambda job_id, filename: release.wait(5))
+
+    ingest_jobs.submit_ingest_batch([("a.pdf", b""), ("b.pdf", b""), ("c.pdf", b"")], processes=2)
+    deadline = time.monotonic() + 5
+    while sum(r["status"] == "waiting_extract" for r in jobs_table.values()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # extraction of a.pdf holds the extraction slot for longer than JOB_STALE_SECONDS
+    for _ in range(10):
+        ingest_jobs._beat()
+        time.sleep(0.06)
+        assert all(read_back(r)["status"] != "interrupted" for r in jobs_table.values())
+    assert sorted(r["status"] for r in jobs_table.values()) == ["running", "waiting_extract", "waiting_extract"]
+
+    # the ingest slot is free: a single upload is ingested meanwhile
+    job_id = ingest_jobs.submit_ingest_job(b"", "d.pdf", extract_issues=False)
+    ingest_jobs._ingest_executor.submit(lambda: None).result(timeout=5)
+    assert jobs_table[job_id]["status"] == "done"
+
+    release.set()
+    ingest_jobs._extract_executor.submit(lambda: None).result(timeout=5)
+    assert {r["status"] for r in jobs_table.values()} == {"done"}
+    assert not ingest_jobs._live_jobs
+
+def test_queued_job_without_heartbeat_reads_back_interrupted(jobs_table, monkeypatch):
+    monkeypatch.setattr(ingest_jobs, "JOB_STALE_SECONDS", 0.05)
+    job_id = ingest_jobs._create_job("lost.pdf", None)
+    time.sleep(0.1)
+    assert read_back(jobs_table[job_id])["status"] == "interrupted"
@@ -0,0 +1,35 @@
+from issue_dedup import find_duplicates
+
+PHRASE = "I would have to look at the documents to answer that question fully"
+
+def issue(i, text, chunk_pos, risk_rank=1):
+    return {"issue_id": f"i{i}", "quoted_text": text, "chunk_pos": chunk_pos, "page": chunk_pos, "risk_rank": risk_rank}
+
+def test_overlap_quote_merged_into_container():
+    long = "Q. Did the company test the talc? A. We tested it once in 1998 and never again after that"
+    issues = [issue(0, long, 3), issue(1, "We tested it once in 1998 and never again after that", 4)]
+    groups, _ = find_duplicates(issues)
+    assert groups == [[0, 1]]
+
+def test_shared_phrase_does_not_chain_distinct_answers():
+    x = "Q. Did the company test the talc for asbestos before launch? A. " + PHRASE
+    y = "Q. Were you told about the 1998 memo from the plant manager? A. " + PHRASE
+    issues = [issue(0, x, 3), issue(1, PHRASE, 4), issue(2, y, 5)]
+    groups, _ = find_duplicates(issues)
+    assert len(groups) == 1
+    canonical, *members = groups[0]
+    assert members == [1]
+    assert canonical in (0, 2)
+
+def test_high_risk_phrase_does_not_hide_longer_answers():
+    x = "Q. Did the company test the talc for asbestos before launch? A. " + PHRASE
+    y = "Q. Were you told about the 1998 memo from the plant manager? A. " + PHRASE
+    issues = [issue(0, x, 3), issue(1, PHRASE, 4, risk_rank=0), issue(2, y, 5)]
+    groups, _ = find_duplicates(issues)
+    hidden = {i for g in groups for i in g[1:]}
+    assert not hidden & {0, 2}
+
+def test_short_answers_merge_only_when_identical():
+    issues = [issue(0, "No, sir.", 3), issue(1, "No, sir.", 4), issue(2, "No, ma'am.", 4)]
+    groups, _ = find_duplicates(issues)
+    assert groups == [[0, 1]]
@@ -0,0 +1,97 @@
+import json
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("psycopg")
+pytest.importorskip("tqdm")
+import issue_extractor
+
+def issue(quote, risk="high"):
+    return {"issue_type": "causation", "quoted_text": quote, "legal_relevance": "r", "risk_level": risk}
+
+def feed_in_pieces(parser, text, size=7):
+    for i in range(0, len(text), size):
+        parser.feed(text[i:i + size])
+
+def test_stream_parser_yields_issues_as_they_close():
+    tricky = issue('He said "stop {now}" \\ and [left]')
+    text = json.dumps({"issues": [tricky, {"quoted_text": "no other keys"}, issue("second")]})
+    parser = issue_extractor.IssueStreamParser()
+    feed_in_pieces(parser, text)
+    assert parser.issues == [tricky, issue("second")] and parser.errors == 1
+
+def test_stream_parser_keeps_issues_completed_before_a_cut():
+    text = json.dumps({"issues": [issue("first"), issue("second")]})
+    parser = issue_extractor.IssueStreamParser()
+    feed_in_pieces(parser, text[:text.index("second") + 3])
+    assert parser.issues == [issue("first")] and parser.errors == 0
+
+def stream(issues, stop_reason, cut=None):
+    """
+    Messages API stream events of one forced record_issues reply.
+    """
+    text = json.dumps({"issues": issues})
+    if cut:
+        text = text[:cut]
+    events = [
+        SimpleNamespace(type="message_start", message=SimpleNamespace(usage=SimpleNamespace(input_tokens=100, output_tokens=1))),
+        SimpleNamespace(type="content_block_start", content_block=SimpleNamespace(type="tool_use", id="toolu_1")),
+    ] + [
+        SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(type="input_json_delta", partial_json=text[i:i + 16]))
+        for i in range(0, len(text), 16)
+    ] + [
+        SimpleNamespace(type="message_delta", delta=SimpleNamespace(stop_reason=stop_reason),
+                        usage=SimpleNamespace(output_tokens=50)),
+    ]
+    return SimpleNamespace(parse=lambda: iter(events), retries_taken=0)
+
+@pytest.fixture
+def replies(monkeypatch):
+    """
+    Scripted streamed replies, one per messages.create; every request is recorded.
+    """
+    queue, requests = [], []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return queue.pop(0)
+
+    client = SimpleNamespace(messages=SimpleNamespace(with_raw_response=SimpleNamespace(create=create)))
+    monkeypatch.setattr(issue_extractor, "get_client", lambda: client)
+    return queue, requests
+
+def new_call():
+    return {"model": "claude-sonnet-4-5", "chunk_id": "c1", "parse_status": "api_error"}
+
+def test_truncated_reply_is_continued_without_repeating_issues(replies):
+    queue, requests = replies
+    first = json.dumps({"issues": [issue("one"), issue("two"), issue("three")]})
+    queue += [
+        stream([issue("one"), issue("two"), issue("three")], "max_tokens", cut=first.index("three") + 2),
+        stream([issue("two"), issue("three")], "tool_use"),
+    ]
+    call = new_call()
+    issues = issue_extractor.call_extraction("Q. ... A. ...", call)
+
+    assert [it["quoted_text"] for it in issues] == ["one", "two", "three"]
+    assert (call["continuations"], call["input_tokens"], call["output_tokens"]) == (1, 200, 100)
+    assert call["stop_reason"] == "tool_use"
+    assistant, result = requests[1]["messages"][1:]
+    assert assistant["content"][0]["input"] == {"issues": [issue("one"), issue("two")]}
+    assert result["content"][0]["tool_use_id"] == "toolu_1"
+
+def test_continuations_are_capped(replies, monkeypatch):
+    queue, requests = replies
+    monkeypatch.setattr(issue_extractor, "MAX_CONTINUATIONS", 1)
+    queue += [stream([issue(f"q{n}")], "max_tokens") for n in range(3)]
+    call = new_call()
+    assert len(issue_extractor.call_extraction("text", call)) == 2
+    assert len(requests) == 2 and call["continuations"] == 1
+
+def test_reply_with_only_malformed_issues_fails(replies):
+    queue, _ = replies
+    queue.append(stream([{"quoted_text": "missing keys"}], "tool_use"))
+    call = new_call()
+    with pytest.raises(ValueError):
+        issue_extractor.call_extraction("text", call)
+    assert call["parse_status"] == "invalid_json"
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("streamlit")
+pd = pytest.importorskip("pandas")
+import issue_list
+
+def test_paginate_clamps_the_page_index():
+    df = pd.DataFrame({"issue_id": range(60)})
+    window, page_index, page_count = issue_list.paginate(df, 5, page_size=25)
+    assert (page_index, page_count) == (2, 3)
+    assert list(window["issue_id"]) == list(range(50, 60))
+
+    window, page_index, _ = issue_list.paginate(df.iloc[:0], -1)
+    assert page_index == 0 and window.empty
+
+@pytest.fixture
+def keyset_page(monkeypatch):
+    """
+    60 issues served 25 at a time by cursor; the pager clicks are scripted per rerun.
+    """
+    issues = list(range(60))
+    fetched, shown, clicks = [], [], []
+
+    def fetch_page(after):
+        fetched.append(after)
+        start = 0 if after is None else after + 1
+        page = issues[start:start + 25]
+        return page, page[-1] if start + 25 < len(issues) else None
+
+    def rerun():
+        shown.clear()
+        fetched.clear()
+        page_index = issue_list.render_keyset_list(fetch_page, total=len(issues), page_size=25)
+        issue_list.st.session_state.issue_page = page_index
+        return page_index
+
+    monkeypatch.setattr(issue_list, "st", SimpleNamespace(session_state=SimpleNamespace(issue_cursors=[None], issue_page=0)))
+    monkeypatch.setattr(issue_list, "render_pager", lambda total, page_index, page_count: page_index + clicks.pop(0))
+    monkeypatch.setattr(issue_list, "render_issue_card", lambda row, similar_lookup=None: shown.append(row))
+    return rerun, clicks, fetched, shown
+
+def test_keyset_list_walks_forward_and_back_by_cursor(keyset_page):
+    rerun, clicks, fetched, shown = keyset_page
+
+    clicks += [1]                                   # Next on page 1
+    assert rerun() == 1 and shown[0] == 25 and fetched == [None, 24]
+    clicks += [1]
+    assert rerun() == 2 and shown == list(range(50, 60))
+    assert issue_list.st.session_state.issue_cursors == [None, 24, 49]
+
+    clicks += [0]                                   # last page: no next cursor
+    assert rerun() == 2 and fetched == [49]
+    clicks += [-1]                                  # Prev reuses the stored cursor
+    assert rerun() == 1 and fetched == [49, 24] and shown[0] == 25
@@ -0,0 +1,226 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import fitz
+import pytest
+import pdf_utils
+
+@pytest.fixture
+def pdf_cache(tmp_path, monkeypatch):
+    """
+    Fresh process-wide PDF cache, spilling to tmp_path.
+    """
+    monkeypatch.setenv("DEPO_PDF_CACHE_SPILL_DIR", str(tmp_path))
+    monkeypatch.setattr(pdf_utils, "_pdf_cache", None)
+    return tmp_path
+
+def test_cache_settings_are_read_on_first_use(pdf_cache, monkeypatch):
+    # set after import: still applies
+    monkeypatch.setenv("DEPO_PDF_CACHE_MAX_MB", "3")
+    assert pdf_utils._get_pdf_cache().maxbytes == 3 * 1024 * 1024
+    assert pdf_utils.pdf_cache_settings()["spill_dir"] == str(pdf_cache)
+
+@pytest.fixture
+def dropbox(monkeypatch):
+    """
+    Dropbox stand-in: files by link, every download recorded as (link, etag sent).
+    """
+    files, downloads = {}, []
+
+    def download(link, access_token, etag=None):
+        downloads.append((link, etag))
+        data, current = files[link]
+        if etag == current:
+            return None, etag, "rev"
+        return data, current, "rev"
+
+    monkeypatch.setattr(pdf_utils, "get_runtime_access_token", lambda: "token")
+    monkeypatch.setattr(pdf_utils, "download_dropbox_pdf", download)
+    return files, downloads
+
+def test_evicted_pdf_is_spilled_and_revalidated_by_etag(pdf_cache, dropbox, monkeypatch):
+    files, downloads = dropbox
+    files["https://dbx/a.pdf"] = (b"A" * 600_000, "ea")
+    files["https://dbx/b.pdf"] = (b"B" * 600_000, "eb")
+    monkeypatch.setenv("DEPO_PDF_CACHE_MAX_MB", "1")
+
+    assert pdf_utils.get_pdf_bytes("https://dbx/a.pdf?dl=0") == b"A" * 600_000
+    pdf_utils.get_pdf_bytes("https://dbx/b.pdf")   # pushes a.pdf out of memory
+    assert pdf_utils._get_pdf_cache().get("https://dbx/a.pdf") is None
+    assert len(list(pdf_cache.glob("*.pdf"))) == 1
+
+    # back from the spill dir: a 304 revalidation, not a second download
+    assert pdf_utils.get_pdf_bytes("https://dbx/a.pdf") == b"A" * 600_000
+    assert downloads[-1] == ("https://dbx/a.pdf", "ea")
+
+def test_spilled_copy_is_served_when_dropbox_is_unreachable(pdf_cache, dropbox, monkeypatch):
+    files, _ = dropbox
+    files["https://dbx/a.pdf"] = (b"A" * 10, "ea")
+    pdf_utils.get_pdf_bytes("https://dbx/a.pdf")
+    pdf_utils._spill_to_disk("https://dbx/a.pdf", pdf_utils._get_pdf_cache().get("https://dbx/a.pdf"))
+    monkeypatch.setattr(pdf_utils, "_pdf_cache", None)
+    files.clear()   # every download fails now
+
+    assert pdf_utils.get_pdf_bytes("https://dbx/a.pdf") == b"A" * 10
+    with pytest.raises(KeyError):
+        pdf_utils.get_pdf_bytes("https://dbx/other.pdf")
+
+def test_concurrent_requests_share_one_download(pdf_cache, dropbox, monkeypatch):
+    files, downloads = dropbox
+    files["https://dbx/a.pdf"] = (b"A", "ea")
+    started, release = threading.Event(), threading.Event()
+    download = pdf_utils.download_dropbox_pdf
+
+    def slow(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return download(*args, **kwargs)
+
+    monkeypatch.setattr(pdf_utils, "download_dropbox_pdf", slow)
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(pdf_utils.get_pdf_bytes, "https://dbx/a.pdf")]
+        started.wait(5)
+        futures += [pool.submit(pdf_utils.get_pdf_bytes, "https://dbx/a.pdf") for _ in range(3)]
+        time.sleep(0.05)
+        release.set()
+        assert [f.result(timeout=5) for f in futures] == [b"A"] * 4
+    assert len(downloads) == 1
+
+def make_pdf(pages, size=0):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {i + 1} " + "x" * size)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+@pytest.fixture
+def deposition(pdf_cache, dropbox, monkeypatch):
+    """
+    A 5-page deposition behind a shared link, with empty document / page caches.
+    """
+    files, downloads = dropbox
+    files["https://dbx/depo.pdf"] = (make_pdf(5), "e1")
+    monkeypatch.setattr(pdf_utils, "_doc_cache", pdf_utils.LRUCache(maxsize=2, on_evict=pdf_utils._close_docs))
+    monkeypatch.setattr(pdf_utils, "_page_cache", pdf_utils.LRUCache(maxsize=None))
+    return "https://dbx/depo.pdf"
+
+def page_text(pdf_bytes):
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        return [page.get_text().split()[1] for page in doc]
+    finally:
+        doc.close()
+
+def test_page_render_is_cached_and_neighbours_prefetched(deposition, monkeypatch):
+    renders = []
+    render = pdf_utils._render
+    monkeypatch.setattr(pdf_utils, "_render", lambda doc, page, mode, dpi: renders.append(page) or render(doc, page, mode, dpi))
+
+    png = pdf_utils.get_page_render(deposition, 3, "png", dpi=30)
+    assert png.startswith(b"\x89PNG")
+    deadline = time.monotonic() + 5
+    while len(renders) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(renders) == [2, 3, 4]
+
+    assert pdf_utils.get_page_render(deposition, 2, "png", dpi=30)
+    assert page_text(pdf_utils.get_page_render(deposition, 5, "pdf")) == ["5"]
+    with pytest.raises(ValueError):
+        pdf_utils.get_page_render(deposition, 6, "png", dpi=30)
+
+def test_copy_pages_keeps_the_requested_order(deposition):
+    assert page_text(pdf_utils.extract_pages_pdf(deposition, [2, 3, 4, 1, 5])) == ["2", "3", "4", "1", "5"]
+    with pytest.raises(ValueError):
+        pdf_utils.extract_pages_pdf(deposition, [])
+    with pytest.raises(ValueError):
+        pdf_utils.extract_pages_pdf(deposition, [0])
+
+def test_concurrent_users_of_a_file_get_separate_handles(deposition, monkeypatch):
+    monkeypatch.setattr(pdf_utils, "MAX_DOCS_PER_FILE", 2)
+    with pdf_utils.acquire_document(deposition) as (key, first):
+        with pdf_utils.acquire_document(deposition) as (_, second):
+            assert first is not second
+
+        # both handles busy: a third user waits instead of opening another
+        third = []
+        waiter = threading.Thread(target=lambda: third.append(pdf_utils.get_page_count(deposition)))
+        with pdf_utils.acquire_document(deposition):
+            waiter.start()
+            time.sleep(0.05)
+            assert not third
+
+    waiter.join(5)
+    assert third == [5]
+    assert len(pdf_utils._doc_cache.get(key)["handles"]) == 2
+
+def test_evicted_file_handles_are_closed(deposition, dropbox):
+    files, _ = dropbox
+    with pdf_utils.acquire_document(deposition) as (key, doc):
+        pass
+    for name in ("b", "c"):
+        files[f"https://dbx/{name}.pdf"] = (make_pdf(1), name)
+        pdf_utils.get_page_count(f"https://dbx/{name}.pdf")
+
+    deadline = time.monotonic() + 5
+    while not doc.is_closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert doc.is_closed and pdf_utils._doc_cache.get(key) is None
+    # opened again on the next use
+    assert pdf_utils.get_page_count(deposition) == 5
+
+class FakeHTTP:
+    """
+    pdf_utils._http stand-in: token endpoint hands out tok1, tok2, ...; the file endpoint
+    rejects every token in `revoked`.
+    """
+    def __init__(self):
+        self.tokens, self.revoked, self.calls = 0, set(), []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.calls.append(url)
+        if url == pdf_utils.DROPBOX_TOKEN_URL:
+            self.tokens += 1
+            body = {"access_token": f"tok{self.tokens}", "expires_in": 14400}
+            return SimpleNamespace(status_code=200, json=lambda: body, text="")
+        token = headers["Authorization"].split()[1]
+        if token in self.revoked:
+            return SimpleNamespace(status_code=401, content=b"expired", headers={})
+        return SimpleNamespace(status_code=200, content=b"%PDF " + token.encode(),
+                               headers={"ETag": "e1", "Dropbox-API-Result": '{"rev": "r1"}'})
+
+@pytest.fixture
+def http(monkeypatch):
+    fake = FakeHTTP()
+    monkeypatch.setattr(pdf_utils, "_http", fake)
+    monkeypatch.setattr(pdf_utils, "_token", (None, 0.0))
+    monkeypatch.setenv("DEPO_DROPBOX_REFRESH_TOKEN", "refresh")
+    monkeypatch.setenv("DEPO_DROPBOX_APP_KEY", "key")
+    monkeypatch.setenv("DEPO_DROPBOX_APP_SECRET", "secret")
+    return fake
+
+def test_access_token_is_refreshed_once_and_shared(http, monkeypatch):
+    with ThreadPoolExecutor(8) as pool:
+        tokens = list(pool.map(lambda _: pdf_utils.get_runtime_access_token(), range(16)))
+    assert set(tokens) == {"tok1"} and http.tokens == 1
+
+    # inside the refresh margin: a new one
+    monkeypatch.setattr(pdf_utils, "_token", ("tok1", time.monotonic() + pdf_utils.TOKEN_REFRESH_MARGIN - 1))
+    assert pdf_utils.get_runtime_access_token() == "tok2"
+
+def test_long_lived_token_is_used_without_refresh(http, monkeypatch):
+    monkeypatch.delenv("DEPO_DROPBOX_REFRESH_TOKEN")
+    monkeypatch.setattr(pdf_utils, "local_cfg", {})
+    monkeypatch.setenv("DEPO_DROPBOX_ACCESS_TOKEN", "static")
+    assert pdf_utils.get_runtime_access_token() == "static" and not http.calls
+
+def test_rejected_token_is_refreshed_and_the_download_retried_once(pdf_cache, http):
+    http.revoked.add("tok1")
+    assert pdf_utils.get_pdf_bytes("https://dbx/a.pdf") == b"%PDF tok2"
+    assert http.tokens == 2
+
+    # a stale invalidation does not drop the token that replaced it
+    pdf_utils.invalidate_access_token("tok1")
+    assert pdf_utils.get_runtime_access_token() == "tok2"
@@ -0,0 +1,67 @@
+from quote_verify import SourceText, source_levels, verify_quote
+
+def levels(*contents):
+    return [("chunk", SourceText([(f"c{i}", c) for i, c in enumerate(contents)]))]
+
+def test_exact_match_offsets():
+    text = "Q. Did you warn? A. Yes, we warned them twice."
+    r = verify_quote("we warned them", levels(text))
+    assert r["quote_status"] == "exact"
+    assert text[r["quote_start"]:r["quote_end"]] == "we warned them"
+
+def test_exact_requires_word_boundary_at_end():
+    r = verify_quote("We warn", levels("A. We warned them in 1998."))
+    assert r["quote_status"] != "exact"
+    assert r["quote_status"] != "normalized"
+
+def test_exact_requires_word_boundary_at_start():
+    r = verify_quote("arned them", levels("A. We warned them."))
+    assert r["quote_status"] not in ("exact", "normalized")
+
+def test_exact_skips_partial_hit_for_later_whole_word():
+    text = "A. We warned them. Q. And then? A. We warn everyone now."
+    r = verify_quote("We warn", levels(text))
+    assert r["quote_status"] == "exact"
+    assert r["quote_start"] == text.index("We warn everyone")
+
+def test_normalized_requires_word_boundary_at_end():
+    r = verify_quote("WE  WARN", levels("A. We warned them."))
+    assert r["quote_status"] not in ("exact", "normalized")
+
+def test_normalized_match():
+    r = verify_quote("WE WARNED  THEM", levels("A. We warned them."))
+    assert r["quote_status"] == "normalized"
+    assert (r["quote_start"], r["quote_end"]) == (3, 17)
+
+def test_dropped_negation_is_unmatched():
+    r = verify_quote("I did know about the study", levels("A. I did not know about the study."))
+    assert r["quote_status"] == "unmatched"
+
+def test_added_negation_is_unmatched():
+    r = verify_quote("we did not test the talc in that plant", levels("A. We did test the talc in that plant."))
+    assert r["quote_status"] == "unmatched"
+
+def test_changed_number_is_unmatched():
+    r = verify_quote("the memo from 1989 said the dust was safe",
+                     levels("A. The memo from 1998 said the dust was safe for workers."))
+    assert r["quote_status"] == "unmatched"
+
+def test_extra_source_words_lower_the_score():
+    source = "A. We reviewed every single one of the internal safety reports before launch."
+    r = verify_quote("We reviewed the reports before launch", levels(source))
+    assert r["quote_status"] == "unmatched"
+    assert r["quote_score"] < 0.85
+
+def test_small_edit_is_fuzzy():
+    source = "A. We never told the doctors about the results of the inhalation study in the plant."
+    r = verify_quote("We never told the doctors about the results of that inhalation study in the plant", levels(source))
+    assert r["quote_status"] == "fuzzy"
+    assert 0.85 <= r["quote_score"] < 1
+
+def test_quote_across_chunk_overlap():
+    text = "Q. Did you test it? A. We tested the talc for asbestos only once, in the spring of 1998."
+    chunks = [("a", 1, text[:60]), ("b", 1, text[40:])]
+    r = verify_quote("tested the talc for asbestos only once", source_levels(chunks)("a"))
+    assert r["quote_status"] == "exact"
+    assert r["quote_source"] == "neighbours"
+    assert r["quote_chunk_id"] == "a"
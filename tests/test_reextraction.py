@@ -0,0 +1,90 @@
+import pytest
+
+pytest.importorskip("psycopg")
+pytest.importorskip("tqdm")
+import reextraction
+
+class FakeConn:
+    """
+    pooled_connection() stand-in answering each execute() from a queue of results.
+    """
+    def __init__(self, results=()):
+        self.results, self.executed = list(results), []
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append((" ".join(sql.split()), params))
+        self.result = self.results.pop(0) if self.results else []
+        return self
+
+    def fetchall(self):
+        return self.result
+
+def test_diff_matches_issues_on_the_normalized_quote(monkeypatch):
+    live = [
+        ("c1", "a.pdf", 3, "We knew  about it.", "HIGH", "knowledge"),
+        ("c1", "a.pdf", 3, "No warning was given.", "low", "warning"),
+        ("c2", "a.pdf", 5, "I don't recall.", "low", "other"),
+        ("c3", "b.pdf", 1, "The data had gaps.", "medium", "methodology"),
+    ]
+    staged = [
+        ("c1", "a.pdf", 3, "we knew about it.", "high", "knowledge"),
+        ("c1", "a.pdf", 3, "No warning was given.", "high", "warning"),
+        ("c3", "b.pdf", 1, "The data had gaps.", "medium", "methodology"),
+        ("c3", "b.pdf", 1, "It was never validated.", "high", "methodology"),
+    ]
+    chunks = [("c1", "a.pdf"), ("c2", "a.pdf"), ("c3", "b.pdf"), ("c4", "b.pdf")]
+    monkeypatch.setattr(reextraction, "init_reextraction_tables", lambda: None)
+    monkeypatch.setattr(reextraction, "pooled_connection", FakeConn([live, staged, chunks]))
+
+    diff = reextraction.diff_run("r1")
+    assert (diff["chunks"], diff["unchanged_chunks"]) == (4, 1)
+    assert [i["quoted_text"] for i in diff["added"]] == ["It was never validated."]
+    assert [i["quoted_text"] for i in diff["removed"]] == ["I don't recall."]
+    assert [(i["quoted_text"], i["old_risk_level"], i["risk_level"]) for i in diff["risk_changed"]] == [
+        ("No warning was given.", "low", "high")
+    ]
+    assert diff["files"] == {
+        "a.pdf": {"chunks": 2, "added": 0, "removed": 1, "risk_changed": 1},
+        "b.pdf": {"chunks": 2, "added": 1, "removed": 0, "risk_changed": 0},
+    }
+
+def test_usd_budget_needs_known_prices():
+    reextraction._check_budget("unknown-model", None)
+    reextraction._check_budget("claude-sonnet-4-5", 10)
+    with pytest.raises(ValueError):
+        reextraction._check_budget("unknown-model", 10)
+
+def test_unknown_priority_is_rejected_before_anything_runs(monkeypatch):
+    monkeypatch.setattr(reextraction, "init_reextraction_tables", lambda: pytest.fail("should not run"))
+    with pytest.raises(ValueError):
+        reextraction.start_run(priority="newest", triage=False)
+
+def test_run_stops_before_a_call_would_cross_the_budget(monkeypatch):
+    monkeypatch.setenv("DEPO_CLAUDE_ANTHROPIC_MODEL", "claude-sonnet-4-5")
+    run = {"run_id": "r1", "status": "running", "prompt_version": reextraction.PROMPT_VERSION,
+           "model": "claude-sonnet-4-5", "filenames": None, "priority": "risk", "max_chunks": None,
+           "budget_usd": 1.0, "chunks_done": 0, "chunks_failed": 0, "spent_usd": 0.0, "triage_model": None}
+    staged = []
+    monkeypatch.setattr(reextraction, "init_reextraction_tables", lambda: None)
+    monkeypatch.setattr(reextraction, "get_run", lambda run_id: run)
+    monkeypatch.setattr(reextraction, "_next_chunks",
+                        lambda run, n, exclude: [(f"c{i}", "text", 1, "a.pdf", None) for i in range(5)])
+    monkeypatch.setattr(reextraction, "call_extraction", lambda content, call: [])
+    monkeypatch.setattr(reextraction, "record_call", lambda **call: 0.4)
+    monkeypatch.setattr(reextraction, "_stage_chunk", lambda run_id, chunk_id, *args: staged.append(chunk_id))
+    monkeypatch.setattr(reextraction, "_update_run", lambda run_id, **fields: run.update(fields))
+    conn = FakeConn()
+    monkeypatch.setattr(reextraction, "pooled_connection", conn)
+
+    reextraction.resume_run("r1")
+    assert staged == ["c0", "c1"] and run["spent_usd"] == pytest.approx(0.8)
+    assert conn.executed[-1][1] == ("budget_exhausted", "r1")
@@ -0,0 +1,107 @@
+import threading
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("psycopg")
+import search
+
+def hit(filename, page, chunk_index, **extra):
+    return {"filename": filename, "page": page, "chunk_index": chunk_index, "content": "", **extra}
+
+def test_rrf_ranks_hits_found_by_both_sources_first():
+    fused = search.reciprocal_rank_fusion({
+        "keyword": [hit("a.pdf", 1, 0), hit("a.pdf", 2, 0, pdf_link=None)],
+        "semantic": [hit("b.pdf", 9, 3), hit("a.pdf", 2, 0, pdf_link="https://x/a.pdf")],
+    })
+    assert [(h["filename"], h["page"]) for h in fused] == [("a.pdf", 2), ("a.pdf", 1), ("b.pdf", 9)]
+    assert fused[0]["sources"] == ["keyword", "semantic"]
+    assert fused[0]["score"] == pytest.approx(1 / 62 + 1 / 62)
+    assert fused[0]["pdf_link"] == "https://x/a.pdf"
+
+def test_slow_source_is_pending_and_a_retry_waits_on_it(monkeypatch):
+    release, calls = threading.Event(), []
+
+    def slow_vector(query, filenames, pages, limit):
+        calls.append(query)
+        release.wait(5)
+        return [hit("b.pdf", 4, 1)]
+
+    monkeypatch.setattr(search, "SEARCH_TIMEOUT", 0.05)
+    monkeypatch.setattr(search, "_keyword_hits", lambda query, filenames, pages, limit: [hit("a.pdf", 1, 0)])
+    monkeypatch.setattr(search, "_vector_hits", slow_vector)
+
+    first = search.hybrid_search("knew about the risk")
+    assert first["pending"] == ["semantic"]
+    assert [h["filename"] for h in first["hits"]] == ["a.pdf"]
+    assert "keyword" in first["latency_ms"]
+
+    # the retry attaches to the running semantic search instead of queueing another
+    search.hybrid_search("knew about the risk")
+    assert calls == ["knew about the risk"]
+
+    running = list(search._inflight.values())
+    release.set()
+    for fut in running:
+        fut.result(timeout=5)
+    done = search.hybrid_search("knew about the risk")
+    assert done["pending"] == [] and len(done["hits"]) == 2
+
+def test_queued_source_is_cancelled_after_the_deadline(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(search, "SEARCH_TIMEOUT", 0.05)
+    monkeypatch.setattr(search, "_executor", search.ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(search, "_keyword_hits", lambda *args: release.wait(5) and [])
+    monkeypatch.setattr(search, "_vector_hits", lambda *args: pytest.fail("queued search ran after its deadline"))
+
+    result = search.hybrid_search("exposure")
+    assert sorted(result["pending"]) == ["keyword", "semantic"]
+    release.set()
+    search._executor.shutdown(wait=True)
+    assert not search._inflight
+
+def test_failed_source_is_reported(monkeypatch):
+    def broken(*args):
+        raise RuntimeError("relation chunks does not exist")
+
+    monkeypatch.setattr(search, "_keyword_hits", broken)
+    monkeypatch.setattr(search, "_vector_hits", lambda *args: [hit("a.pdf", 1, 0)])
+    result = search.hybrid_search("warnings")
+    assert result["failed"] == ["keyword"] and len(result["hits"]) == 1
+
+class FakeStore:
+    def __init__(self, hits):
+        self.hits, self.fetches = hits, []
+
+    def version(self):
+        return ("fake", 1)
+
+    def search(self, query, k=10, filenames=None):
+        self.fetches.append(k)
+        return self.hits[:k]
+
+def test_similar_testimony_spreads_hits_and_grows_the_fetch(monkeypatch):
+    # the nearest 30 chunks are the issue's own deposition, then one page repeated
+    hits = [hit("self.pdf", i, 0) for i in range(30)]
+    hits += [hit("b.pdf", 7, i) for i in range(3)]
+    hits += [hit("b.pdf", p, 0) for p in (8, 9)] + [hit("c.pdf", 1, 0)]
+    store = FakeStore(hits)
+    monkeypatch.setattr(search, "get_vector_store", lambda: store)
+    monkeypatch.setattr(search, "_cached_embedding", lambda text: [0.0])
+    monkeypatch.setattr(search, "_similar_cache", search.LRUCache(maxsize=4))
+
+    similar = search.find_similar_testimony("we tested it", k=3, exclude="self.pdf")
+    assert [(h["filename"], h["page"]) for h in similar] == [("b.pdf", 7), ("b.pdf", 8), ("c.pdf", 1)]
+    assert store.fetches == [12, 48]
+
+    # cached per index version
+    assert search.find_similar_testimony("we tested it", k=3, exclude="self.pdf") == similar
+    assert store.fetches == [12, 48]
+
+def test_similar_testimony_stops_when_the_store_runs_out(monkeypatch):
+    store = FakeStore([hit("self.pdf", 1, 0), hit("b.pdf", 2, 0)])
+    monkeypatch.setattr(search, "get_vector_store", lambda: store)
+    monkeypatch.setattr(search, "_cached_embedding", lambda text: [0.0])
+    monkeypatch.setattr(search, "_similar_cache", search.LRUCache(maxsize=4))
+
+    assert len(search.find_similar_testimony("quote", k=5, exclude="self.pdf")) == 1
+    assert store.fetches == [20]
@@ -0,0 +1,19 @@
+from telemetry import drain_metrics, inc, merge_metrics, observe, prometheus_text
+
+def test_worker_metrics_merge_into_parent():
+    drain_metrics()
+    inc("pages_parsed_total", 3, filename="a.pdf")
+    observe("span_duration_seconds", 0.2, span="pdf.parse_page")
+    worker = drain_metrics()
+    assert "pages_parsed_total" not in prometheus_text()
+
+    inc("pages_parsed_total", 2, filename="a.pdf")
+    observe("span_duration_seconds", 7, span="pdf.parse_page")
+    merge_metrics(worker)
+    merge_metrics(None)
+
+    text = prometheus_text()
+    assert 'depo_pages_parsed_total{filename="a.pdf"} 5' in text
+    assert 'depo_span_duration_seconds_count{span="pdf.parse_page"} 2' in text
+    assert 'depo_span_duration_seconds_bucket{span="pdf.parse_page",le="0.25"} 1' in text
+    drain_metrics()
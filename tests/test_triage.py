@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("psycopg")
+pytest.importorskip("tqdm")
+import issue_extractor
+import reextraction
+import triage
+
+@pytest.fixture(autouse=True)
+def primary_model(monkeypatch):
+    monkeypatch.setenv("DEPO_CLAUDE_ANTHROPIC_MODEL", "big")
+
+CHUNKS = [("c1", "objection, form"), ("c2", "we knew about the exposure"), ("c3", "I don't recall")]
+
+def reply(*blocks):
+    resp = SimpleNamespace(content=list(blocks), stop_reason="tool_use",
+                           usage=SimpleNamespace(input_tokens=100, output_tokens=20))
+    raw = SimpleNamespace(parse=lambda: resp, retries_taken=0)
+    create = lambda **kwargs: raw
+    return SimpleNamespace(messages=SimpleNamespace(with_raw_response=SimpleNamespace(create=create)))
+
+def test_tool_scores_are_mapped_to_chunks_and_clamped(monkeypatch):
+    tool_use = SimpleNamespace(type="tool_use", input={"scores": {"1": 0.05, "[2]": 1.7, "4": 0.9, "x": 0.5, "3": "n/a"}})
+    monkeypatch.setattr(issue_extractor, "get_client", lambda: reply(tool_use))
+    call = {"model": "small"}
+    assert triage._triage_call(CHUNKS, call) == {"c1": 0.05, "c2": 1.0}
+    assert call["input_tokens"] == 100 and call["stop_reason"] == "tool_use"
+
+def test_json_text_reply_is_a_fallback(monkeypatch):
+    text = SimpleNamespace(type="text", text='Scores: {"scores": {"3": 0.4}}')
+    monkeypatch.setattr(issue_extractor, "get_client", lambda: reply(text))
+    assert triage._triage_call(CHUNKS, {"model": "small"}) == {"c3": 0.4}
+
+def test_reply_without_scores_raises(monkeypatch):
+    monkeypatch.setattr(issue_extractor, "get_client", lambda: reply(SimpleNamespace(type="text", text="no idea")))
+    call = {"model": "small"}
+    with pytest.raises(ValueError):
+        triage._triage_call(CHUNKS, call)
+    assert call["parse_status"] == "no_json"
+
+def test_resume_run_sends_only_escalated_chunks_to_the_primary_model(monkeypatch):
+    settings = {"model": "small", "threshold": 0.3, "batch": 8}
+    run = {"run_id": "r1", "status": "running", "prompt_version": issue_extractor.PROMPT_VERSION, "model": "big",
+           "filenames": None, "priority": "risk", "max_chunks": None, "budget_usd": None, "chunks_done": 0,
+           "chunks_failed": 0, "spent_usd": 0.0, "triage_model": "small", "triage_threshold": 0.3}
+    batches = [[(cid, content, 1, "a.pdf", None) for cid, content in CHUNKS], []]
+    staged, primary = {}, []
+
+    monkeypatch.setattr(reextraction, "init_reextraction_tables", lambda: None)
+    monkeypatch.setattr(reextraction, "get_run", lambda run_id: run)
+    monkeypatch.setattr(reextraction, "triage_settings", lambda model, threshold: {**settings, "model": model})
+    monkeypatch.setattr(reextraction, "_next_chunks", lambda run, n, exclude: batches.pop(0))
+    monkeypatch.setattr(reextraction, "_triage_spend", lambda run_id: 0.0)
+    monkeypatch.setattr(reextraction, "triage_chunks", lambda chunks, s, filename, run_id: {"c1": 0.1, "c2": 0.8})
+    monkeypatch.setattr(reextraction, "call_extraction", lambda content, call: primary.append(call["chunk_id"]) or [])
+    monkeypatch.setattr(reextraction, "record_call", lambda **call: 0.0)
+    monkeypatch.setattr(reextraction, "_update_run", lambda run_id, **fields: run.update(fields))
+    monkeypatch.setattr(reextraction, "_stage_chunk",
+                        lambda run_id, chunk_id, filename, page, pdf_link, issues, call, t=None, score=None:
+                        staged.update({chunk_id: (call["prompt_version"], call["model"], score)}))
+
+    class Conn:
+        def __enter__(self): return self
+        def __exit__(self, *exc): return False
+        def execute(self, sql, params=()): pass
+    monkeypatch.setattr(reextraction, "pooled_connection", Conn)
+
+    reextraction.resume_run("r1")
+    # c3 was not scored: escalated (fail open)
+    assert primary == ["c2", "c3"]
+    assert staged == {
+        "c1": (triage.TRIAGE_PROMPT_VERSION, "small", 0.1),
+        "c2": (issue_extractor.PROMPT_VERSION, "big", 0.8),
+        "c3": (issue_extractor.PROMPT_VERSION, "big", None),
+    }
+    assert run["chunks_done"] == 3
+
+def test_stale_filter_keeps_chunks_dropped_by_the_current_triage_model():
+    conditions, params = reextraction._stale_filter(["a.pdf"], {"model": "small", "threshold": 0.3})
+    assert len(conditions) == 4
+    assert params[2:] == [triage.TRIAGE_PROMPT_VERSION, "small", ["a.pdf"]]
@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("psycopg")
+import vector_store
+
+def test_backend_is_read_from_the_settings_on_each_call(monkeypatch):
+    monkeypatch.delenv("DEPO_VECTOR_BACKEND", raising=False)
+    assert isinstance(vector_store.get_vector_store(), vector_store.FaissStore)
+    monkeypatch.setenv("DEPO_VECTOR_BACKEND", "pgvector")
+    assert isinstance(vector_store.get_vector_store(), vector_store.PgVectorStore)
+    monkeypatch.setenv("DEPO_VECTOR_BACKEND", "annoy")
+    with pytest.raises(ValueError):
+        vector_store.get_vector_store()
+
+class RecordingConn:
+    """
+    pooled_connection() stand-in: records statements, returns rows for the last SELECT.
+    """
+    def __init__(self, rows=()):
+        self.rows, self.executed = list(rows), []
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.executed.append((" ".join(sql.split()), params))
+        return self
+
+    def fetchall(self):
+        return self.rows
+
+def test_pgvector_filtered_search_scans_the_files_exactly(monkeypatch):
+    conn = RecordingConn([("A_001", "a.pdf", 3, 0, "text", None, 0.75)])
+    monkeypatch.setattr(vector_store, "pooled_connection", conn)
+
+    hits = vector_store.PgVectorStore().search([0.5, 0.25], k=7, filenames=["a.pdf"])
+    assert hits == [{"chunk_id": "A_001", "score": 0.75, "filename": "a.pdf", "page": 3,
+                     "chunk_index": 0, "content": "text", "pdf_link": None}]
+
+    (setting, _), (sql, params) = conn.executed
+    assert setting == "SET LOCAL enable_indexscan = off"
+    assert "AND filename = ANY(%s) ORDER BY embedding <=> %s::vector LIMIT %s" in sql
+    assert params == ["[0.5,0.25]", ["a.pdf"], "[0.5,0.25]", 7]
+
+def test_pgvector_unfiltered_search_widens_ef_search_to_k(monkeypatch):
+    conn = RecordingConn()
+    monkeypatch.setattr(vector_store, "pooled_connection", conn)
+
+    vector_store.PgVectorStore().search([1.0], k=200)
+    (setting, _), (sql, params) = conn.executed
+    assert setting == "SET LOCAL hnsw.ef_search = 200"
+    assert "ANY" not in sql and params[-1] == 200
@@ -0,0 +1,165 @@
+"""
+Triage tier of the extraction cascade: a small model scores packed batches of chunks for
+plaintiff-relevant testimony; only chunks scoring >= threshold go to the primary model.
+
+Settings ([claude] in secrets.toml or DEPO_CLAUDE_* env vars):
+    triage_model       e.g. "claude-haiku-4-5"; unset = cascade off, every chunk to the primary model
+    triage_threshold   escalate at or above this score (default 0.3)
+    triage_batch       chunks per triage call (default 8)
+
+Fails open: chunks the triage call did not score are escalated.
+"""
+import hashlib
+import json
+import time
+from config import get_config
+from extraction_ledger import record_call, usage_fields
+from telemetry import inc, span
+
+DEFAULT_THRESHOLD = 0.3
+DEFAULT_BATCH = 8
+TOKENS_PER_SCORE = 12   # max_tokens budget per chunk of a triage reply
+TOOL_CALL_TOKENS = 64   # + the record_scores tool_use block around the scores
+
+TRIAGE_PROMPT = """
+    You screen deposition excerpts for a legal analyst in U.S. mass tort litigation.
+
+    For each numbered excerpt, estimate the probability (0 to 1) that it contains testimony useful to plaintiffs: failure to warn, causation, exposure pathway, corporate knowledge, regulatory compliance, alternative causes, damages or injury timeline, or admissions about methodology, data gaps, uncertainty or limitations.
+
+    Objections, colloquy, exhibit handling and biographical background alone score low. When unsure, score higher.
+
+    Call record_scores once, with a score for every excerpt.
+"""
+
+TRIAGE_TOOL = {
+    "name": "record_scores",
+    "description": "Record the probability that each numbered excerpt contains testimony useful to plaintiffs.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "scores": {
+                "type": "object",
+                "description": "excerpt number -> probability",
+                "additionalProperties": {"type": "number", "minimum": 0, "maximum": 1},
+            },
+        },
+        "required": ["scores"],
+    },
+}
+
+# changes whenever TRIAGE_PROMPT or the tool schema is edited
+TRIAGE_PROMPT_VERSION = "triage-" + hashlib.sha256(
+    (TRIAGE_PROMPT + json.dumps(TRIAGE_TOOL, sort_keys=True)).encode("utf-8")
+).hexdigest()[:12]
+
+def triage_settings(model=None, threshold=None, batch=None):
+    """
+    Return: {"model", "threshold", "batch"}, or None when no triage model is configured
+    """
+    model = model or get_config("claude", "triage_model", None)
+    if not model:
+        return None
+    return {
+        "model": model,
+        "threshold": threshold if threshold is not None
+        else get_config("claude", "triage_threshold", DEFAULT_THRESHOLD, cast=float),
+        "batch": batch or get_config("claude", "triage_batch", DEFAULT_BATCH, cast=int),
+    }
+
+def triage_stamp(settings):
+    """
+    Return: the issue_progress stamp (prompt_version, model) of a chunk the triage model dropped
+    """
+    return {"prompt_version": TRIAGE_PROMPT_VERSION, "model": settings["model"]}
+
+def _triage_call(chunks, call):
+    """
+    chunks: list of (chunk_id, content)
+    Return: {chunk_id: score} for the excerpts the reply scored
+    """
+    from issue_extractor import extract_json, get_client
+
+    excerpts = "\n\n".join(f"[{i}]\n{content}" for i, (_, content) in enumerate(chunks, start=1))
+    started = time.perf_counter()
+    try:
+        raw = get_client().messages.with_raw_response.create(
+            model=call["model"],
+            max_tokens=TOKENS_PER_SCORE * len(chunks) + TOOL_CALL_TOKENS,
+            temperature=0,
+            tools=[TRIAGE_TOOL],
+            tool_choice={"type": "tool", "name": TRIAGE_TOOL["name"]},
+            messages=[{"role": "user", "content": TRIAGE_PROMPT + "\n\nExcerpts:\n\n" + excerpts}]
+        )
+        resp = raw.parse()
+    finally:
+        call["latency_ms"] = (time.perf_counter() - started) * 1000
+
+    call.update(usage_fields(resp), retries=getattr(raw, "retries_taken", 0), stop_reason=resp.stop_reason)
+    inc("llm_tokens_total", resp.usage.input_tokens, direction="input")
+    inc("llm_tokens_total", resp.usage.output_tokens, direction="output")
+
+    tool_use = next((block for block in resp.content if block.type == "tool_use"), None)
+    if tool_use is not None:
+        raw_scores = tool_use.input.get("scores") or {}
+    else:
+        # no tool call (should not happen with tool_choice): fall back to JSON in the text
+        json_text = extract_json("".join(block.text for block in resp.content if block.type == "text"))
+        if not json_text:
+            call["parse_status"] = "no_json"
+            raise ValueError("No tool call or JSON found")
+        try:
+            raw_scores = json.loads(json_text).get("scores", {})
+        except ValueError:
+            call["parse_status"] = "invalid_json"
+            raise
+    if not isinstance(raw_scores, dict):
+        call["parse_status"] = "invalid_json"
+        raise ValueError(f"scores is not an object: {raw_scores!r:.200}")
+
+    scores = {}
+    for key, value in raw_scores.items():
+        try:
+            index, score = int(str(key).strip("[]")), float(value)
+        except (TypeError, ValueError):
+            continue
+        if 1 <= index <= len(chunks):
+            scores[chunks[index - 1][0]] = min(max(score, 0.0), 1.0)
+    return scores
+
+def triage_chunks(chunks, settings, filename=None, **fields):
+    """
+    Score chunks in packed batches of settings["batch"], one ledger row per call.
+    chunks: list of (chunk_id, content)
+    fields: extra extraction_calls columns (run_id)
+    Return: {chunk_id: score}; chunks missing from it were not scored (escalate them)
+    """
+    scores = {}
+    for start in range(0, len(chunks), settings["batch"]):
+        part = chunks[start:start + settings["batch"]]
+        call = {
+            "chunk_id": part[0][0] if len(part) == 1 else None,
+            "filename": filename,
+            "model": settings["model"],
+            "prompt_version": TRIAGE_PROMPT_VERSION,
+            "stage": "triage",
+            "chunk_count": len(part),
+            "content_chars": sum(len(content) for _, content in part),
+            "parse_status": "api_error",
+            **fields,
+        }
+        try:
+            with span("llm.triage", model=settings["model"], chunks=len(part)) as tags:
+                part_scores = _triage_call(part, call)
+                tags["scored"] = len(part_scores)
+            call["parse_status"] = "ok"
+            scores.update(part_scores)
+        except Exception as e:
+            call["error"] = str(e)[:1000]
+            print(f"⚠️ Triage call failed, escalating {len(part)} chunks: {e}")
+
+        escalated = sum(1 for cid, _ in part if scores.get(cid, 1.0) >= settings["threshold"])
+        call["issues_found"] = escalated   # triage rows: chunks sent on to the primary model
+        inc("triage_chunks_total", escalated, decision="escalated")
+        inc("triage_chunks_total", len(part) - escalated, decision="dropped")
+        record_call(**call)
+    return scores
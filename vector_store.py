@@ -0,0 +1,190 @@
+import time
+import numpy as np
+import index
+from config import get_config
+from db_utils import pooled_connection
+
+EMBEDDING_DIM = 1024       # BAAI/bge-large-en-v1.5
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+HNSW_EF_SEARCH = 80
+WRITE_BATCH_SIZE = 500
+PG_VERSION_TTL = 60        # seconds; pgvector has no local file to watch
+
+def _to_vector_literal(vec) -> str:
+    return "[" + ",".join(f"{x:.7g}" for x in vec) + "]"
+
+class FaissStore:
+    """
+    Local FAISS shards (index.py) with metadata in metadata.db.
+    """
+    name = "faiss"
+
+    def init(self):
+        # tables are created in each staged generation (index.new_generation)
+        pass
+
+    def version(self):
+        """
+        Changes whenever a new index generation is published.
+        """
+        return ("faiss", index.current_snapshot().generation)
+
+    def indexed_chunk_ids(self):
+        return index.get_indexed_chunk_ids()
+
+    def add(self, docs, embeddings):
+        return index.add_to_shards(docs, embeddings)
+
+    def search(self, query, k=10, filenames=None):
+        return index.search_shards(query, k=k, filenames=filenames)
+
+    def remove(self, filenames):
+        return index.remove_from_shards(filenames)
+
+class PgVectorStore:
+    """
+    Vectors in a pgvector column on Postgres chunks, HNSW index, shared by all app replicas.
+    """
+    name = "pgvector"
+
+    def __init__(self, table="chunks"):
+        self.table = table
+
+    def init(self):
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+                cur.execute(f"""
+                    ALTER TABLE {self.table}
+                    ADD COLUMN IF NOT EXISTS embedding vector({EMBEDDING_DIM})
+                """)
+                cur.execute(f"""
+                    ALTER TABLE {self.table}
+                    ADD COLUMN IF NOT EXISTS pdf_link TEXT
+                """)
+                cur.execute(f"""
+                    CREATE INDEX IF NOT EXISTS idx_{self.table}_embedding_hnsw
+                    ON {self.table} USING hnsw (embedding vector_cosine_ops)
+                    WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})
+                """)
+                # exact search within a few depositions (see search)
+                cur.execute(f"""
+                    CREATE INDEX IF NOT EXISTS idx_{self.table}_filename
+                    ON {self.table} (filename)
+                """)
+
+    def version(self):
+        # shared table written by other replicas: expire cached results by time
+        return ("pgvector", self.table, int(time.time() // PG_VERSION_TTL))
+
+    def indexed_chunk_ids(self):
+        with pooled_connection() as conn:
+            rows = conn.execute(
+                f"SELECT chunk_id FROM {self.table} WHERE embedding IS NOT NULL"
+            ).fetchall()
+        return set(r[0] for r in rows)
+
+    def add(self, docs, embeddings):
+        self.init()
+        rows = []
+        for d, vec in zip(docs, embeddings):
+            meta = d["metadata"]
+            rows.append((
+                meta["bates_id"],
+                meta["source"],
+                meta["path"],
+                meta["page"],
+                meta["chunk_index"],
+                meta["chunk_chars"],
+                int(meta["has_ocr"]),
+                meta["collection_id"],
+                d["content"],
+                meta.get("pdf_link"),
+                _to_vector_literal(vec),
+            ))
+
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                for start in range(0, len(rows), WRITE_BATCH_SIZE):
+                    cur.executemany(f"""
+                        INSERT INTO {self.table} (
+                            chunk_id, filename, path, page, chunk_index, chunk_chars,
+                            has_ocr, collection_id, content, pdf_link, embedding
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::vector)
+                        ON CONFLICT (chunk_id) DO UPDATE
+                        SET embedding = EXCLUDED.embedding,
+                            pdf_link = COALESCE({self.table}.pdf_link, EXCLUDED.pdf_link)
+                    """, rows[start:start + WRITE_BATCH_SIZE])
+                    conn.commit()
+
+        print(f"💾 Saved {len(rows)} vectors to PostgreSQL ({self.table}.embedding).")
+        return len(rows)
+
+    def search(self, query, k=10, filenames=None):
+        if isinstance(query, str):
+            query = index.embed_query(query)
+        vec = _to_vector_literal(np.asarray(query, dtype="float32").reshape(-1))
+
+        sql = f"""
+            SELECT chunk_id, filename, page, chunk_index, content, pdf_link,
+                   1 - (embedding <=> %s::vector) AS score
+            FROM {self.table}
+            WHERE embedding IS NOT NULL
+        """
+        params = [vec]
+        if filenames:
+            sql += " AND filename = ANY(%s)"
+            params.append(list(filenames))
+        sql += " ORDER BY embedding <=> %s::vector LIMIT %s"
+        params += [vec, k]
+
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                if filenames:
+                    # the HNSW scan returns ef_search rows before the filename filter runs, so a
+                    # one-file search could come back with far fewer than k rows. A deposition
+                    # is a few thousand chunks at most: scan them exactly via the filename index.
+                    cur.execute("SET LOCAL enable_indexscan = off")
+                else:
+                    cur.execute(f"SET LOCAL hnsw.ef_search = {max(HNSW_EF_SEARCH, k)}")
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+
+        return [
+            {
+                "chunk_id": chunk_id,
+                "score": float(score),
+                "filename": filename,
+                "page": page,
+                "chunk_index": chunk_index,
+                "content": content,
+                "pdf_link": pdf_link,
+            }
+            for chunk_id, filename, page, chunk_index, content, pdf_link, score in rows
+        ]
+
+    def remove(self, filenames):
+        if not filenames:
+            return 0
+        with pooled_connection() as conn:
+            cur = conn.execute(
+                f"UPDATE {self.table} SET embedding = NULL WHERE filename = ANY(%s)",
+                (list(filenames),)
+            )
+            return cur.rowcount
+
+def vector_backend():
+    """
+    Return: vector.backend from the settings, "faiss" = local shards + SQLite sidecar,
+    "pgvector" = vector column on Postgres chunks
+    """
+    return get_config("vector", "backend", "faiss")
+
+def get_vector_store(backend=None):
+    backend = backend or vector_backend()
+    if backend == "pgvector":
+        return PgVectorStore()
+    if backend == "faiss":
+        return FaissStore()
+    raise ValueError(f"Unknown vector backend: {backend}")